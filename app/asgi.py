@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+App ASGI del servidor (la que sirve run.py con uvicorn).
+
+Flask corre detrás de WsgiToAsgi, que ejecuta todas las peticiones WSGI (también
+las vistas async) en un único hilo compartido: una petición que espera ahí deja
+en cola a todas las demás. Las rutas que esperan se atienden aquí, en el loop de
+uvicorn, y todo lo demás se deriva a la app Flask:
+
+- GET /stream/orders y /stream/order/<id>: Server-Sent Events (ver app/sse.py).
+- POST /generate_pizza_idea: ideas de pizza, que pueden esperar a Gemini hasta
+  GEMINI_TIMEOUT segundos (ver app/pizza_ideas.py).
+"""
+import asyncio
+import json
+import logging
+import re
+
+from asgiref.wsgi import WsgiToAsgi
+
+from app.pizza_ideas import servicio_ideas, normalizar_ingredientes, IdeaUnavailable
+from app.sse import responder_json, stream_order, stream_orders
+
+logger = logging.getLogger(__name__)
+
+# Tamaño máximo del cuerpo de /generate_pizza_idea (la lista de ingredientes).
+MAX_CUERPO_IDEA = 16 * 1024
+
+_RUTA_PEDIDO = re.compile(r'^/stream/order/([^/]+)/?$')
+_RUTA_PEDIDOS = re.compile(r'^/stream/orders/?$')
+_RUTA_IDEA = re.compile(r'^/generate_pizza_idea/?$')
+
+
+class CuerpoDemasiadoGrande(ValueError):
+    """El cuerpo de la petición supera el tamaño permitido."""
+
+
+async def _leer_cuerpo(receive, limite):
+    """Cuerpo completo de la petición; lanza CuerpoDemasiadoGrande si supera `limite` bytes."""
+    partes, total = [], 0
+    while True:
+        mensaje = await receive()
+        if mensaje['type'] == 'http.disconnect':
+            raise ConnectionError("El cliente se desconectó")
+        parte = mensaje.get('body', b'')
+        total += len(parte)
+        if total > limite:
+            raise CuerpoDemasiadoGrande(f"El cuerpo supera {limite} bytes.")
+        partes.append(parte)
+        if not mensaje.get('more_body'):
+            return b''.join(partes)
+
+
+async def _responder_preflight(scope, send):
+    """Respuesta CORS a OPTIONS (la app Flask la da con flask-cors para sus rutas)."""
+    cabeceras = dict(scope.get('headers') or [])
+    await send({'type': 'http.response.start', 'status': 204, 'headers': [
+        (b'access-control-allow-origin', b'*'),
+        (b'access-control-allow-methods', b'POST, OPTIONS'),
+        (b'access-control-allow-headers', cabeceras.get(b'access-control-request-headers', b'content-type')),
+        (b'access-control-max-age', b'86400'),
+    ]})
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+async def generate_pizza_idea(receive, send):
+    """
+    Genera una idea de pizza (nombre y descripción) para una lista de ingredientes.
+    Las ideas se cachean por conjunto de ingredientes (ver app/pizza_ideas.py).
+    """
+    try:
+        try:
+            data = json.loads(await _leer_cuerpo(receive, MAX_CUERPO_IDEA) or b'null')
+        except CuerpoDemasiadoGrande as e:
+            return await responder_json(send, 413, {"error": str(e)})
+        except ValueError:
+            data = None
+        if not isinstance(data, dict) or 'ingredients' not in data:
+            return await responder_json(send, 400, {"error": "La lista de 'ingredients' es requerida."})
+
+        try:
+            ingredientes = normalizar_ingredientes(data['ingredients'])
+        except ValueError as e:
+            return await responder_json(send, 400, {"error": str(e)})
+
+        logger.info(f"Generando idea de pizza con ingredientes: {', '.join(ingredientes)}")
+        # Caché o generación (compartida con peticiones iguales en curso), sin bloquear el loop
+        idea = await servicio_ideas.generar(ingredientes)
+        logger.info(f"Idea generada: {idea}")
+        await responder_json(send, 200, idea)
+
+    except ConnectionError:
+        pass
+    except IdeaUnavailable as e:
+        logger.error(f"/generate_pizza_idea sin modelo disponible: {e}")
+        await responder_json(send, 503, {"error": "El servicio de IA no está disponible en este momento. Inténtalo de nuevo."})
+    except asyncio.TimeoutError:
+        logger.error("/generate_pizza_idea: Gemini no respondió a tiempo.")
+        await responder_json(send, 504, {"error": "El servicio de IA tardó demasiado. Inténtalo de nuevo."})
+    except Exception as e:
+        logger.error(f"Error en /generate_pizza_idea: {e}", exc_info=True)
+        await responder_json(send, 500, {"error": "Ocurrió un error inesperado al generar la idea."})
+
+
+def crear_app_asgi(flask_app):
+    """App ASGI del servidor: las rutas que esperan, nativas; todo lo demás por Flask (WsgiToAsgi)."""
+    wsgi = WsgiToAsgi(flask_app)
+
+    async def aplicacion(scope, receive, send):
+        if scope['type'] == 'http':
+            ruta, metodo = scope['path'], scope['method']
+            if metodo == 'GET':
+                if _RUTA_PEDIDOS.match(ruta):
+                    return await stream_orders(receive, send)
+                encontrada = _RUTA_PEDIDO.match(ruta)
+                if encontrada:
+                    return await stream_order(encontrada.group(1), receive, send)
+            elif _RUTA_IDEA.match(ruta):
+                if metodo == 'POST':
+                    return await generate_pizza_idea(receive, send)
+                if metodo == 'OPTIONS':
+                    return await _responder_preflight(scope, send)
+        return await wsgi(scope, receive, send)
+
+    return aplicacion
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+Variante asíncrona de la API de `app.services`.
+
+El cliente de Firestore es bloqueante, así que cada función se ejecuta en un pool
+de hilos acotado (FIRESTORE_EXECUTOR_WORKERS) en lugar de bloquear el loop de
+asyncio. Así las rutas async y los handlers del bot pueden lanzar lecturas
+independientes en paralelo con asyncio.gather().
+"""
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from config import FIRESTORE_EXECUTOR_WORKERS
+from app import services
+
+logger = logging.getLogger(__name__)
+
+executor = ThreadPoolExecutor(max_workers=FIRESTORE_EXECUTOR_WORKERS, thread_name_prefix="firestore")
+
+
+def _version_async(func):
+    """Envuelve una función bloqueante de services para ejecutarla en el pool."""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, functools.partial(func, *args, **kwargs))
+    wrapper.__name__ = f"{func.__name__}_async"
+    wrapper.__qualname__ = wrapper.__name__
+    return wrapper
+
+
+# --- Pedidos ---
+guardar_pedido_en_firestore_async = _version_async(services.guardar_pedido_en_firestore)
+obtener_pedido_por_id_async = _version_async(services.obtener_pedido_por_id)
+actualizar_estado_pedido_async = _version_async(services.actualizar_estado_pedido)
+obtener_todos_los_pedidos_async = _version_async(services.obtener_todos_los_pedidos)
+obtener_pedidos_activos_async = _version_async(services.obtener_pedidos_activos)
+obtener_pedidos_paginados_async = _version_async(services.obtener_pedidos_paginados)
+guardar_calificacion_pedido_async = _version_async(services.guardar_calificacion_pedido)
+
+# --- Conductores ---
+actualizar_ubicacion_conductor_async = _version_async(services.actualizar_ubicacion_conductor)
+obtener_conductores_activos_async = _version_async(services.obtener_conductores_activos)
+obtener_conductores_cercanos_async = _version_async(services.obtener_conductores_cercanos)
+obtener_pedidos_por_conductor_async = _version_async(services.obtener_pedidos_por_conductor)
+obtener_pedidos_activos_conductor_async = _version_async(services.obtener_pedidos_activos_conductor)
+asignar_pedido_a_conductor_async = _version_async(services.asignar_pedido_a_conductor)
+asignar_pedido_al_conductor_mas_cercano_async = _version_async(services.asignar_pedido_al_conductor_mas_cercano)
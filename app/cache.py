@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+Caché en memoria acotada (LRU) con expiración por tiempo (TTL).
+Segura para hilos y con contadores de aciertos/fallos para poder medir su efecto.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUTTLCache:
+    """
+    Diccionario acotado a `maxsize` entradas; las más antiguas en uso se descartan
+    primero y cada entrada expira `ttl` segundos después de escribirse.
+    Con `copy_values=True` se guardan y devuelven copias profundas, para que quien
+    lea pueda modificar el dict (ej. inyectar 'restaurant_location') sin tocar la caché.
+    """
+
+    def __init__(self, maxsize=1024, ttl=60.0, copy_values=False, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.copy_values = copy_values
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._data = OrderedDict()  # clave -> (expira_en, valor)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _out(self, value):
+        return copy.deepcopy(value) if self.copy_values else value
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at < self._clock():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return self._out(value)
+
+    def peek(self, key, default=None):
+        """Como get() pero sin contar aciertos/fallos ni reordenar."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < self._clock():
+                return default
+            return self._out(entry[1])
+
+    def set(self, key, value):
+        if self.copy_values:
+            value = copy.deepcopy(value)
+        with self._lock:
+            self._data[key] = (self._clock() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def update(self, key, fields):
+        """
+        Mezcla `fields` en el dict guardado bajo `key` si existe (escritura a través).
+        Devuelve True si la entrada estaba en la caché.
+        """
+        if self.copy_values:
+            fields = copy.deepcopy(fields)
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < self._clock():
+                return False
+            entry[1].update(fields)
+            return True
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return self.peek(key) is not None
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'ttl_seconds': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_ratio': round(self.hits / total, 4) if total else 0.0,
+        }
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+Despacho por lotes: asignación óptima de pedidos a conductores.
+
+En lugar de darle a cada pedido, apenas llega, el conductor libre más cercano
+(lo que en hora pico deja conductores mal ubicados para el pedido siguiente), los
+pedidos se juntan durante DISPATCH_WINDOW segundos y el lote se resuelve como una
+asignación de costo mínimo sobre la matriz de distancias pedido-conductor
+(linear_sum_assignment de scipy).
+Cada par resultante se escribe con `asignar_pedido_a_conductor`, igual que una
+asignación manual.
+"""
+import logging
+import threading
+import time
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+from config import (
+    DISPATCH_WINDOW, DISPATCH_MAX_BATCH, DISPATCH_CANDIDATES_PER_ORDER, DISPATCH_MAX_KM, DISPATCH_MAX_ATTEMPTS
+)
+
+from app.distance import matriz_distancias_km
+
+logger = logging.getLogger(__name__)
+
+# Costo de los pares que superan max_km: solo se usan si no queda otra y luego se descartan.
+_COSTO_PROHIBIDO = 1e9
+
+
+def asignar_lote(pedidos, conductores, max_km=DISPATCH_MAX_KM):
+    """
+    Resuelve un lote. `pedidos`: [(order_id, lat, lon)], `conductores`: [(driver_id, lat, lon)].
+    Devuelve [(order_id, driver_id, distancia_km)] con a lo sumo un pedido por conductor,
+    minimizando la distancia total y sin pares a más de `max_km`.
+    """
+    if not pedidos or not conductores:
+        return []
+    distancias = matriz_distancias_km(
+        [p[1] for p in pedidos], [p[2] for p in pedidos],
+        [c[1] for c in conductores], [c[2] for c in conductores]
+    )
+    costos = np.where(distancias <= max_km, distancias, _COSTO_PROHIBIDO)
+    filas, columnas = linear_sum_assignment(costos)
+    return [
+        (pedidos[i][0], conductores[j][0], float(distancias[i, j]))
+        for i, j in zip(filas, columnas)
+        if costos[i, j] < _COSTO_PROHIBIDO
+    ]
+
+
+class BatchDispatcher:
+    """
+    Junta pedidos durante `window` segundos (desde el primero pendiente) y asigna el lote.
+    Los pedidos que quedan sin conductor se reintentan en las ventanas siguientes,
+    hasta `max_attempts` veces.
+
+    - candidatos(lat, lon, k) -> [(driver_id, lat, lon)] conductores libres cercanos.
+    - asignar(order_id, driver_id) -> bool, la escritura de la asignación.
+    - ya_asignado(order_id) -> bool, para saltar pedidos que alguien asignó mientras esperaban.
+    """
+
+    def __init__(self, candidatos, asignar, ya_asignado=None, window=DISPATCH_WINDOW, max_batch=DISPATCH_MAX_BATCH,
+                 candidates_per_order=DISPATCH_CANDIDATES_PER_ORDER, max_km=DISPATCH_MAX_KM, max_attempts=DISPATCH_MAX_ATTEMPTS):
+        self._candidatos = candidatos
+        self._asignar = asignar
+        self._ya_asignado = ya_asignado or (lambda order_id: False)
+        self.window = window
+        self.max_batch = max_batch
+        self.candidates_per_order = candidates_per_order
+        self.max_km = max_km
+        self.max_attempts = max_attempts
+        self._pending = {}  # order_id -> [lat, lon, intentos]
+        self._cond = threading.Condition()
+        self._thread = None
+        self._metrics = {
+            'enqueued': 0,
+            'assigned': 0,
+            'dropped': 0,
+            'batches': 0,
+            'solve_ms_avg': 0.0,
+            'solve_ms_max': 0.0,
+            'assigned_km_avg': 0.0,
+        }
+
+    def enqueue(self, order_id, lat, lon):
+        """Agrega un pedido al próximo lote (no bloquea)."""
+        with self._cond:
+            self._pending[str(order_id)] = [float(lat), float(lon), 0]
+            self._metrics['enqueued'] += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="batch-dispatcher", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+            # Ventana de recolección: los pedidos que lleguen mientras tanto entran al mismo lote
+            time.sleep(self.window)
+            try:
+                self.dispatch_once()
+            except Exception as e:
+                logger.error(f"Error en el despacho por lotes: {e}", exc_info=True)
+
+    def _tomar_lote(self):
+        with self._cond:
+            ids = list(self._pending)[:self.max_batch]
+            return [(order_id, *self._pending[order_id][:2]) for order_id in ids]
+
+    def dispatch_once(self):
+        """Resuelve y escribe un lote con los pedidos pendientes. Devuelve las asignaciones hechas."""
+        lote = [p for p in self._tomar_lote() if not self._descartar_si_asignado(p[0])]
+        if not lote:
+            return []
+
+        # Candidatos: los k conductores libres más cercanos a cada pedido (unión sin repetidos)
+        conductores = {}
+        for _, lat, lon in lote:
+            for driver_id, d_lat, d_lon in self._candidatos(lat, lon, self.candidates_per_order):
+                conductores.setdefault(driver_id, (driver_id, d_lat, d_lon))
+
+        inicio = time.perf_counter()
+        pares = asignar_lote(lote, list(conductores.values()), max_km=self.max_km)
+        solve_ms = (time.perf_counter() - inicio) * 1000
+
+        hechas = []
+        for order_id, driver_id, distancia in pares:
+            try:
+                ok = self._asignar(order_id, driver_id)
+            except Exception as e:
+                logger.error(f"Error al asignar pedido {order_id} a {driver_id}: {e}", exc_info=True)
+                ok = False
+            if ok:
+                hechas.append((order_id, driver_id, distancia))
+                logger.info(f"✅ Pedido {order_id} asignado por lote al conductor {driver_id} a {distancia:.2f}km")
+
+        self._registrar(lote, hechas, solve_ms, len(conductores))
+        return hechas
+
+    def _descartar_si_asignado(self, order_id):
+        if self._ya_asignado(order_id):
+            with self._cond:
+                self._pending.pop(order_id, None)
+            return True
+        return False
+
+    def _registrar(self, lote, hechas, solve_ms, num_conductores):
+        asignados = {order_id for order_id, _, _ in hechas}
+        m = self._metrics
+        with self._cond:
+            for order_id, _, _ in lote:
+                entrada = self._pending.get(order_id)
+                if entrada is None:
+                    continue
+                if order_id in asignados:
+                    del self._pending[order_id]
+                    continue
+                entrada[2] += 1
+                if entrada[2] >= self.max_attempts:
+                    del self._pending[order_id]
+                    m['dropped'] += 1
+                    logger.warning(f"⚠️ Pedido {order_id} sin conductor libre tras {entrada[2]} intentos; queda sin asignar.")
+        m['batches'] += 1
+        m['solve_ms_avg'] += (solve_ms - m['solve_ms_avg']) / m['batches']
+        m['solve_ms_max'] = max(m['solve_ms_max'], solve_ms)
+        for _, _, distancia in hechas:
+            m['assigned'] += 1
+            m['assigned_km_avg'] += (distancia - m['assigned_km_avg']) / m['assigned']
+        logger.info(f"Lote de despacho: {len(lote)} pedidos, {num_conductores} conductores candidatos, {len(hechas)} asignados ({solve_ms:.1f} ms).")
+
+    def stats(self):
+        stats = {k: round(v, 2) if isinstance(v, float) else v for k, v in self._metrics.items()}
+        stats['pending'] = len(self._pending)
+        return stats
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+Distancias Haversine en km, compartidas por el índice de conductores, el despacho,
+la simulación y las rutas.
+
+- `distancia_km`: un par de puntos (escalar, con math; para un solo cálculo
+  numpy solo agrega costo).
+- `distancias_km`: de un punto a muchos, sobre arreglos de coordenadas.
+- `matriz_distancias_km`: de muchos a muchos (matriz len1 x len2).
+- `mas_cercanos`: índices y distancias de los k puntos más cercanos a uno dado.
+- `coordenadas`: (lat, lon) de una ubicación guardada en un pedido o conductor.
+
+Las versiones vectorizadas aceptan listas, tuplas o arreglos numpy.
+"""
+import math
+
+import numpy as np
+
+RADIO_TIERRA_KM = 6371.0
+
+
+def coordenadas(location):
+    """(lat, lon) de una ubicación con claves latitude/longitude o lat/lng, o None."""
+    if not isinstance(location, dict):
+        return None
+    lat = location.get('latitude', location.get('lat'))
+    lon = location.get('longitude', location.get('lng'))
+    if lat is None or lon is None:
+        return None
+    return float(lat), float(lon)
+
+
+def distancia_km(lat1, lon1, lat2, lon2):
+    """Distancia Haversine en km entre dos puntos."""
+    dlat = math.radians(lat2 - lat1)
+    dlon = math.radians(lon2 - lon1)
+    a = math.sin(dlat / 2) ** 2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon / 2) ** 2
+    return 2 * RADIO_TIERRA_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _radianes(valores):
+    return np.radians(np.asarray(valores, dtype=np.float64))
+
+
+def distancias_km(lat, lon, lats, lons):
+    """Arreglo con la distancia en km desde (lat, lon) a cada punto (lats[i], lons[i])."""
+    lat1 = math.radians(lat)
+    lat2 = _radianes(lats)
+    dlat = lat2 - lat1
+    dlon = _radianes(lons) - math.radians(lon)
+    a = np.sin(dlat / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return 2 * RADIO_TIERRA_KM * np.arcsin(np.sqrt(np.minimum(1.0, a)))
+
+
+def matriz_distancias_km(lats1, lons1, lats2, lons2):
+    """Matriz (len1 x len2) de distancias Haversine en km."""
+    lat1 = _radianes(lats1)[:, None]
+    lon1 = _radianes(lons1)[:, None]
+    lat2 = _radianes(lats2)[None, :]
+    lon2 = _radianes(lons2)[None, :]
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * RADIO_TIERRA_KM * np.arcsin(np.sqrt(np.minimum(1.0, a)))
+
+
+def mas_cercanos(lat, lon, lats, lons, k=1):
+    """
+    (índices, distancias_km) de los `k` puntos más cercanos a (lat, lon), ordenados
+    de menor a mayor distancia. Con argpartition: no ordena el arreglo completo.
+    """
+    distancias = distancias_km(lat, lon, lats, lons)
+    if k <= 0 or distancias.size == 0:
+        return np.empty(0, dtype=np.intp), np.empty(0)
+    if k < distancias.size:
+        indices = np.argpartition(distancias, k - 1)[:k]
+    else:
+        indices = np.arange(distancias.size)
+    indices = indices[np.argsort(distancias[indices], kind='stable')]
+    return indices, distancias[indices]
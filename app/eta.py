@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+"""
+Hora estimada de entrega (ETA) de los pedidos, para /get_order y /stream.
+
+- Tiempo de viaje: al arrancar se precalcula una grilla con los minutos de viaje
+  desde el restaurante hasta el centro de cada celda del área de reparto; una
+  consulta es buscar la celda del cliente. El ritmo (minutos por km) empieza en
+  AVG_SPEED_KMH x TRAFFIC_FACTOR y se ajusta con los viajes reales ('en_camino'
+  -> 'entregado'); cuando cambia, la grilla se recalcula.
+- Preparación: mediana de los tiempos reales (confirmación -> salida del local)
+  de los últimos pedidos con la misma cantidad de items; sin historial suficiente,
+  PREP_TIME_BASE + 2 min por item adicional.
+- En camino con ubicación del repartidor: tiempo desde esa ubicación hasta el
+  cliente, así que la ETA se mueve con cada 'driver_location'.
+
+Los momentos de cada cambio de estado se guardan en el pedido como
+'status_ts.<estado>' (ver `clave_estado`); de ahí se aprende.
+"""
+import logging
+import math
+import statistics
+import threading
+import time
+import unicodedata
+from collections import deque
+
+import numpy as np
+
+from config import RESTAURANT_LOCATION, ETA_GRID_RADIUS_KM, ETA_GRID_CELL_M, ETA_HISTORY_SIZE, ETA_MIN_SAMPLES
+from app.distance import distancia_km, distancias_km, coordenadas
+from app.order_registry import ESTADOS_TERMINALES
+
+logger = logging.getLogger(__name__)
+
+AVG_SPEED_KMH = 30.0       # Velocidad promedio de la moto
+PREP_TIME_BASE = 15.0      # Minutos base de preparación
+TRAFFIC_FACTOR = 1.2       # Colchón de tráfico
+
+# Los pedidos de MAX_ITEMS_GRUPO items o más comparten estadística de preparación.
+MAX_ITEMS_GRUPO = 5
+# Muestras fuera de estos rangos (relojes mal puestos, pedidos olvidados) se ignoran.
+MAX_MINUTOS_MUESTRA = 180.0
+MIN_KM_MUESTRA = 0.3
+RITMO_MIN, RITMO_MAX = 0.5, 20.0  # minutos por km
+
+_KM_POR_GRADO_LAT = 110.54
+_KM_POR_GRADO_LON = 111.32
+
+
+def clave_estado(estado):
+    """Nombre de campo para un estado: 'En preparación' -> 'en_preparacion'."""
+    sin_acentos = unicodedata.normalize('NFKD', str(estado)).encode('ascii', 'ignore').decode('ascii')
+    return '_'.join(sin_acentos.lower().split()) or 'desconocido'
+
+
+CLAVE_CONFIRMADO = clave_estado('Confirmado')
+CLAVE_EN_CAMINO = clave_estado('En camino')
+CLAVE_ENTREGADO = clave_estado('Entregado')
+
+
+def minutos_preparacion_base(num_items):
+    return PREP_TIME_BASE + 2 * max(0, num_items - 1)
+
+
+def ritmo_base():
+    """Minutos por km sin historial."""
+    return 60.0 / AVG_SPEED_KMH * TRAFFIC_FACTOR
+
+
+def cantidad_items(order):
+    return sum(item.get('quantity', 1) for item in order.get('items', []) if isinstance(item, dict))
+
+
+class TravelTimeGrid:
+    """Minutos de viaje desde `origen` al centro de cada celda de `cell_m` metros."""
+
+    def __init__(self, origen, radius_km=ETA_GRID_RADIUS_KM, cell_m=ETA_GRID_CELL_M, minutos_por_km=None):
+        self.origen = origen
+        self.radius_km = radius_km
+        lat0, lon0 = origen
+        self._dlat = cell_m / 1000.0 / _KM_POR_GRADO_LAT
+        self._dlon = cell_m / 1000.0 / (_KM_POR_GRADO_LON * math.cos(math.radians(lat0)))
+        self._n = int(math.ceil(radius_km * 1000.0 / cell_m))
+        self._lat_min = lat0 - self._n * self._dlat
+        self._lon_min = lon0 - self._n * self._dlon
+        lados = 2 * self._n + 1
+        filas, columnas = np.mgrid[0:lados, 0:lados]
+        self._km = distancias_km(
+            lat0, lon0,
+            self._lat_min + (filas + 0.5) * self._dlat,
+            self._lon_min + (columnas + 0.5) * self._dlon
+        ).astype(np.float32)
+        self.minutos_por_km = minutos_por_km or ritmo_base()
+        self._minutos = self._km * np.float32(self.minutos_por_km)
+
+    def set_pace(self, minutos_por_km):
+        self.minutos_por_km = minutos_por_km
+        # Se reemplaza la grilla entera: los lectores ven la anterior o la nueva, nunca una mezcla
+        self._minutos = self._km * np.float32(minutos_por_km)
+
+    def _celda(self, lat, lon):
+        fila = int((lat - self._lat_min) // self._dlat)
+        columna = int((lon - self._lon_min) // self._dlon)
+        lados = self._km.shape[0]
+        if 0 <= fila < lados and 0 <= columna < lados:
+            return fila, columna
+        return None
+
+    def desde_origen(self, lat, lon):
+        """Minutos de viaje desde el origen; fuera de la grilla se calcula al momento."""
+        celda = self._celda(lat, lon)
+        if celda is None:
+            return distancia_km(self.origen[0], self.origen[1], lat, lon) * self.minutos_por_km
+        return float(self._minutos[celda])
+
+    def entre(self, lat1, lon1, lat2, lon2):
+        """Minutos de viaje entre dos puntos cualesquiera (ej. repartidor -> cliente)."""
+        return distancia_km(lat1, lon1, lat2, lon2) * self.minutos_por_km
+
+    @property
+    def cells(self):
+        return self._km.size
+
+
+class PrepTimeModel:
+    """Minutos de preparación por cantidad de items, a partir de los últimos pedidos."""
+
+    def __init__(self, history=ETA_HISTORY_SIZE, min_samples=ETA_MIN_SAMPLES):
+        self.min_samples = min_samples
+        self._muestras = [deque(maxlen=history) for _ in range(MAX_ITEMS_GRUPO + 1)]
+        self._tabla = [minutos_preparacion_base(n) for n in range(MAX_ITEMS_GRUPO + 1)]
+
+    def observar(self, num_items, minutos):
+        grupo = min(max(num_items, 1), MAX_ITEMS_GRUPO)
+        muestras = self._muestras[grupo]
+        muestras.append(minutos)
+        if len(muestras) >= self.min_samples:
+            self._tabla[grupo] = statistics.median(muestras)
+
+    def minutos(self, num_items):
+        return self._tabla[min(max(num_items, 1), MAX_ITEMS_GRUPO)]
+
+    def stats(self):
+        return {
+            str(n): {'minutes': round(self._tabla[n], 1), 'samples': len(self._muestras[n])}
+            for n in range(1, MAX_ITEMS_GRUPO + 1)
+        }
+
+
+class EtaService:
+    """
+    Estima la entrega de un pedido con búsquedas en la grilla y en la tabla de preparación.
+    `cargar_historial()` -> [pedido] (opcional) se llama una vez, en segundo plano, en la
+    primera estimación.
+    """
+
+    def __init__(self, restaurante=RESTAURANT_LOCATION, cargar_historial=None, radius_km=ETA_GRID_RADIUS_KM,
+                 cell_m=ETA_GRID_CELL_M, history=ETA_HISTORY_SIZE, min_samples=ETA_MIN_SAMPLES, clock=time.time):
+        self.origen = (float(restaurante['latitude']), float(restaurante['longitude']))
+        self.grid = TravelTimeGrid(self.origen, radius_km=radius_km, cell_m=cell_m)
+        self.prep = PrepTimeModel(history=history, min_samples=min_samples)
+        self.min_samples = min_samples
+        self._ritmos = deque(maxlen=history)
+        self._cargar_historial = cargar_historial
+        self._historial_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._clock = clock
+        self._metrics = {'estimates': 0, 'learned_orders': 0}
+
+    # --- Aprendizaje ---
+
+    def aprender(self, pedido):
+        """Agrega las muestras de un pedido entregado. Devuelve True si aportó alguna."""
+        tiempos = pedido.get('status_ts') or {}
+        salida = tiempos.get(CLAVE_EN_CAMINO)
+        entrega = tiempos.get(CLAVE_ENTREGADO)
+        inicio = tiempos.get(CLAVE_CONFIRMADO) or pedido.get('date_ts')
+        aporto = False
+        with self._lock:
+            if salida and inicio:
+                minutos = (salida - inicio) / 60000.0
+                if 0 < minutos <= MAX_MINUTOS_MUESTRA:
+                    self.prep.observar(cantidad_items(pedido), minutos)
+                    aporto = True
+            destino = coordenadas(pedido.get('location'))
+            if salida and entrega and destino is not None:
+                km = distancia_km(self.origen[0], self.origen[1], destino[0], destino[1])
+                minutos = (entrega - salida) / 60000.0
+                if km >= MIN_KM_MUESTRA and 0 < minutos <= MAX_MINUTOS_MUESTRA:
+                    self._ritmos.append(min(max(minutos / km, RITMO_MIN), RITMO_MAX))
+                    self._ajustar_ritmo()
+                    aporto = True
+            if aporto:
+                self._metrics['learned_orders'] += 1
+        return aporto
+
+    def _ajustar_ritmo(self):
+        if len(self._ritmos) < self.min_samples:
+            return
+        ritmo = statistics.median(self._ritmos)
+        # Recalcular la grilla solo si el cambio se nota (más de un 2%)
+        if abs(ritmo - self.grid.minutos_por_km) > 0.02 * self.grid.minutos_por_km:
+            self.grid.set_pace(ritmo)
+
+    def aprender_historial(self, pedidos):
+        aprendidos = sum(1 for pedido in pedidos if self.aprender(pedido))
+        logger.info(f"ETA: {aprendidos} pedidos históricos aprendidos (ritmo {self.grid.minutos_por_km:.2f} min/km).")
+        return aprendidos
+
+    def _asegurar_historial(self):
+        if self._cargar_historial is None:
+            return
+        with self._historial_lock:
+            cargar, self._cargar_historial = self._cargar_historial, None
+        if cargar is None:
+            return
+
+        def _cargar():
+            try:
+                self.aprender_historial(cargar())
+            except Exception as e:
+                logger.error(f"Error al cargar el historial para ETA: {e}", exc_info=True)
+
+        threading.Thread(target=_cargar, name="eta-history", daemon=True).start()
+
+    # --- Consultas ---
+
+    def estimar(self, pedido, ahora_ms=None):
+        """
+        {'eta_ms', 'minutes', 'phase', 'prep_minutes', 'travel_minutes'} para un pedido
+        no terminal con ubicación; None si no aplica.
+        """
+        self._asegurar_historial()
+        estado = pedido.get('status')
+        destino = coordenadas(pedido.get('location'))
+        if estado in ESTADOS_TERMINALES or destino is None:
+            return None
+        ahora = ahora_ms if ahora_ms is not None else int(self._clock() * 1000)
+        tiempos = pedido.get('status_ts') or {}
+        self._metrics['estimates'] += 1
+
+        prep_minutes = 0.0
+        salida = tiempos.get(CLAVE_EN_CAMINO)
+        if estado == 'En camino' or salida:
+            fase = 'on_the_way'
+            repartidor = coordenadas(pedido.get('driver_location'))
+            if repartidor is not None:
+                travel_minutes = self.grid.entre(repartidor[0], repartidor[1], destino[0], destino[1])
+                llegada = ahora + travel_minutes * 60000
+            else:
+                travel_minutes = self.grid.desde_origen(*destino)
+                llegada = max(ahora, (salida or ahora) + travel_minutes * 60000)
+        else:
+            fase = 'preparing'
+            inicio = tiempos.get(CLAVE_CONFIRMADO) or pedido.get('date_ts') or ahora
+            prep_minutes = self.prep.minutos(cantidad_items(pedido))
+            travel_minutes = self.grid.desde_origen(*destino)
+            llegada = max(ahora, inicio + prep_minutes * 60000) + travel_minutes * 60000
+
+        return {
+            'eta_ms': int(llegada),
+            'minutes': max(0, math.ceil((llegada - ahora) / 60000)),
+            'phase': fase,
+            'prep_minutes': round(prep_minutes, 1),
+            'travel_minutes': round(travel_minutes, 1)
+        }
+
+    def stats(self):
+        stats = dict(self._metrics)
+        stats['pace_min_per_km'] = round(self.grid.minutos_por_km, 3)
+        stats['pace_samples'] = len(self._ritmos)
+        stats['grid_cells'] = self.grid.cells
+        stats['prep'] = self.prep.stats()
+        return stats
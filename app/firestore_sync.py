@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+Sincronización entre réplicas con listeners de Firestore (on_snapshot).
+
+Con varias instancias del backend, lo que cada una tiene en memoria (estado
+caliente, caché de pedidos, registro de ocupados, índice de conductores) queda
+desactualizado en cuanto otra réplica escribe. Con FIRESTORE_SYNC=true cada
+instancia se suscribe a:
+
+- 'pedidos' no terminales: cada alta o cambio se aplica en memoria; cuando un
+  pedido sale de la consulta (entregado, cancelado o borrado) se descarta.
+- 'drivers' en línea: posición y estado; al desconectarse, se quitan.
+
+Las lecturas siguen siendo locales. Los cambios que escribe la propia instancia
+vuelven como eco; quien aplica los cambios decide si están atrasados (ver
+`_aplicar_pedido_remoto` en services).
+
+El cliente es inyectable: sirve cualquier objeto con la interfaz de consultas de
+google-cloud-firestore (`collection().where().on_snapshot()`), como el emulador
+o un fake en memoria.
+"""
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Cada cuántos segundos se revisa que los listeners sigan activos.
+INTERVALO_VIGILANCIA = 30.0
+
+
+class _Suscripcion:
+    def __init__(self, nombre, consulta, aplicar, quitar):
+        self.nombre = nombre
+        self.consulta = consulta
+        self.aplicar = aplicar
+        self.quitar = quitar
+        self.watch = None
+        self.metrics = {
+            'snapshots': 0,
+            'added': 0,
+            'modified': 0,
+            'removed': 0,
+            'stale': 0,
+            'errors': 0,
+            'restarts': 0,
+            'last_snapshot_ms': None,
+        }
+
+
+class FirestoreSync:
+    """
+    Listeners de on_snapshot sobre varias consultas.
+
+    - aplicar(doc_id, datos) -> bool: alta o cambio (False = ignorado por atrasado).
+    - quitar(doc_id): el documento salió de la consulta.
+    """
+
+    def __init__(self, client, intervalo_vigilancia=INTERVALO_VIGILANCIA):
+        self.client = client
+        self.intervalo_vigilancia = intervalo_vigilancia
+        self._suscripciones = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._vigilante = None
+
+    def watch(self, nombre, consulta, aplicar, quitar):
+        """Registra una consulta a escuchar (antes de start)."""
+        self._suscripciones.append(_Suscripcion(nombre, consulta, aplicar, quitar))
+        return self
+
+    def start(self):
+        """Abre los listeners (idempotente) y el hilo que los reabre si se cierran."""
+        with self._lock:
+            for s in self._suscripciones:
+                if s.watch is None:
+                    s.watch = s.consulta.on_snapshot(self._callback(s))
+                    logger.info(f"Sincronización con Firestore activa para '{s.nombre}'.")
+            if self._vigilante is None and self.intervalo_vigilancia:
+                self._stop.clear()
+                self._vigilante = threading.Thread(target=self._vigilar, name="firestore-sync", daemon=True)
+                self._vigilante.start()
+
+    def stop(self):
+        self._stop.set()
+        with self._lock:
+            for s in self._suscripciones:
+                if s.watch is not None:
+                    try:
+                        s.watch.unsubscribe()
+                    except Exception as e:
+                        logger.warning(f"Error al cerrar el listener de '{s.nombre}': {e}")
+                    s.watch = None
+            self._vigilante = None
+
+    def _callback(self, s):
+        def on_snapshot(docs, changes, read_time):
+            m = s.metrics
+            m['snapshots'] += 1
+            for change in changes:
+                doc = change.document
+                tipo = change.type.name
+                try:
+                    if tipo == 'REMOVED':
+                        s.quitar(doc.id)
+                        m['removed'] += 1
+                        continue
+                    if s.aplicar(doc.id, doc.to_dict()) is False:
+                        m['stale'] += 1
+                    m['added' if tipo == 'ADDED' else 'modified'] += 1
+                except Exception as e:
+                    m['errors'] += 1
+                    logger.error(f"Error al aplicar cambio de '{s.nombre}/{doc.id}': {e}", exc_info=True)
+            m['last_snapshot_ms'] = int(time.time() * 1000)
+        return on_snapshot
+
+    def _vigilar(self):
+        # El listener de google-cloud-firestore se reconecta solo ante cortes
+        # transitorios; si se cierra del todo (is_active = False) se abre otro.
+        while not self._stop.wait(self.intervalo_vigilancia):
+            with self._lock:
+                for s in self._suscripciones:
+                    if s.watch is not None and getattr(s.watch, 'is_active', True) is False:
+                        logger.warning(f"Listener de '{s.nombre}' cerrado; reabriendo.")
+                        s.metrics['restarts'] += 1
+                        try:
+                            s.watch = s.consulta.on_snapshot(self._callback(s))
+                        except Exception as e:
+                            s.metrics['errors'] += 1
+                            logger.error(f"No se pudo reabrir el listener de '{s.nombre}': {e}", exc_info=True)
+
+    def stats(self):
+        return {
+            s.nombre: dict(s.metrics, active=s.watch is not None and getattr(s.watch, 'is_active', True) is not False)
+            for s in self._suscripciones
+        }
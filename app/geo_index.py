@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+Índice espacial en memoria para las posiciones de los conductores.
+
+Divide el mapa en una rejilla de celdas (lat/lon) y guarda en cada celda
+los conductores que están dentro. Las búsquedas de vecinos más cercanos
+recorren anillos de celdas alrededor del punto consultado y se detienen en
+cuanto ninguna celda restante puede contener un conductor más cercano, así
+que el costo depende de los conductores cercanos y no del total de la flota.
+Las distancias de cada anillo se calculan en bloque (app/distance.py).
+"""
+import heapq
+import logging
+import math
+import threading
+
+from app.distance import distancia_km, distancias_km
+
+logger = logging.getLogger(__name__)
+
+# Tamaño de celda por defecto: 0.01° ~ 1.1 km de lado en Santa Cruz.
+CELL_SIZE_DEG = 0.01
+
+# Más allá de este número de anillos (~55 km) se recorre el resto de forma lineal;
+# solo ocurre con conductores fuera de la ciudad (ej. coordenadas 0,0 de prueba).
+MAX_RINGS = 50
+
+_KM_PER_DEG_LAT = 111.32
+
+# Desde cuántos candidatos conviene calcular las distancias de un anillo en bloque (numpy)
+# en lugar de una por una.
+BATCH_MIN = 16
+
+
+class DriverSpatialIndex:
+    """
+    Rejilla de conductores con actualización incremental y búsqueda k-NN.
+    Es segura para usar desde varios hilos (Flask atiende peticiones en paralelo).
+    """
+
+    def __init__(self, cell_size_deg=CELL_SIZE_DEG):
+        self.cell_size_deg = cell_size_deg
+        self._lock = threading.Lock()
+        self._cells = {}      # (fila, columna) -> set(driver_id)
+        self._positions = {}  # driver_id -> (lat, lon, celda)
+
+    def _cell_of(self, lat, lon):
+        return (math.floor(lat / self.cell_size_deg), math.floor(lon / self.cell_size_deg))
+
+    def __len__(self):
+        return len(self._positions)
+
+    def __contains__(self, driver_id):
+        return str(driver_id) in self._positions
+
+    def upsert(self, driver_id, lat, lon):
+        """Inserta o mueve un conductor. Solo toca las dos celdas implicadas."""
+        driver_id = str(driver_id)
+        lat, lon = float(lat), float(lon)
+        cell = self._cell_of(lat, lon)
+        with self._lock:
+            previous = self._positions.get(driver_id)
+            if previous and previous[2] != cell:
+                self._discard_from_cell(driver_id, previous[2])
+            self._cells.setdefault(cell, set()).add(driver_id)
+            self._positions[driver_id] = (lat, lon, cell)
+
+    def remove(self, driver_id):
+        """Quita un conductor del índice (ej. pasó a 'ocupado' o 'desconectado')."""
+        driver_id = str(driver_id)
+        with self._lock:
+            previous = self._positions.pop(driver_id, None)
+            if previous:
+                self._discard_from_cell(driver_id, previous[2])
+
+    def _discard_from_cell(self, driver_id, cell):
+        members = self._cells.get(cell)
+        if members is not None:
+            members.discard(driver_id)
+            if not members:
+                del self._cells[cell]
+
+    def clear(self):
+        with self._lock:
+            self._cells.clear()
+            self._positions.clear()
+
+    def position(self, driver_id):
+        """Devuelve (lat, lon) del conductor o None si no está indexado."""
+        entry = self._positions.get(str(driver_id))
+        return (entry[0], entry[1]) if entry else None
+
+    def nearest(self, lat, lon, k=1, accept=None):
+        """
+        Devuelve hasta `k` tuplas (driver_id, distancia_km) ordenadas por distancia.
+        `accept(driver_id)` permite descartar candidatos (ej. conductores ocupados)
+        sin salir del recorrido por anillos.
+        """
+        if k <= 0:
+            return []
+        lat, lon = float(lat), float(lon)
+        row0, col0 = self._cell_of(lat, lon)
+
+        # Distancia mínima (km) a cualquier celda del anillo r: (r - 1) celdas completas.
+        cell_km = self.cell_size_deg * _KM_PER_DEG_LAT * max(0.01, math.cos(math.radians(min(89.0, abs(lat)) + self.cell_size_deg)))
+
+        with self._lock:
+            total = len(self._positions)
+            best = []  # max-heap simulado: (-distancia, driver_id)
+            seen = 0
+            ring = 0
+            while seen < total and ring <= MAX_RINGS:
+                if len(best) == k and (ring - 1) * cell_km > -best[0][0]:
+                    break
+                candidatos = []
+                for cell in self._ring_cells(row0, col0, ring):
+                    members = self._cells.get(cell)
+                    if not members:
+                        continue
+                    seen += len(members)
+                    candidatos.extend(members)
+                self._consider_all(best, k, lat, lon, candidatos, accept)
+                ring += 1
+            else:
+                if seen < total and ring > MAX_RINGS:
+                    # Conductores muy lejanos: se revisan de forma lineal.
+                    lejanos = []
+                    for cell, members in self._cells.items():
+                        if max(abs(cell[0] - row0), abs(cell[1] - col0)) > MAX_RINGS:
+                            lejanos.extend(members)
+                    self._consider_all(best, k, lat, lon, lejanos, accept)
+
+        return [(driver_id, -neg_dist) for neg_dist, driver_id in sorted(best, reverse=True)]
+
+    def _consider_all(self, best, k, lat, lon, driver_ids, accept):
+        """Evalúa un grupo de candidatos: en bloque con numpy si son muchos, uno a uno si no."""
+        if accept is not None:
+            driver_ids = [d for d in driver_ids if accept(d)]
+        if len(driver_ids) < BATCH_MIN:
+            for driver_id in driver_ids:
+                d_lat, d_lon, _ = self._positions[driver_id]
+                self._push(best, k, distancia_km(lat, lon, d_lat, d_lon), driver_id)
+            return
+        posiciones = [self._positions[d] for d in driver_ids]
+        dists = distancias_km(lat, lon, [p[0] for p in posiciones], [p[1] for p in posiciones])
+        if len(best) == k:
+            # Solo pasan al heap los que mejoran al peor de los k actuales
+            umbral = -best[0][0]
+            indices = (dists < umbral).nonzero()[0]
+        else:
+            indices = range(len(driver_ids))
+        for i in indices:
+            self._push(best, k, float(dists[i]), driver_ids[i])
+
+    @staticmethod
+    def _push(best, k, dist, driver_id):
+        if len(best) < k:
+            heapq.heappush(best, (-dist, driver_id))
+        elif dist < -best[0][0]:
+            heapq.heapreplace(best, (-dist, driver_id))
+
+    @staticmethod
+    def _ring_cells(row0, col0, ring):
+        if ring == 0:
+            yield (row0, col0)
+            return
+        for col in range(col0 - ring, col0 + ring + 1):
+            yield (row0 - ring, col)
+            yield (row0 + ring, col)
+        for row in range(row0 - ring + 1, row0 + ring):
+            yield (row, col0 - ring)
+            yield (row, col0 + ring)
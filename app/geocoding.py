@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""
+Geocodificación inversa con Nominatim (proxy de /reverse_geocode).
+
+- Un solo `httpx.Client` persistente (conexiones reutilizadas entre peticiones).
+- Caché LRU+TTL por coordenadas redondeadas a GEOCODE_PRECISION decimales:
+  arrastrar el pin por el mismo lugar no vuelve a consultar Nominatim.
+- Single-flight: si varias peticiones piden la misma celda a la vez, solo una
+  consulta Nominatim y las demás esperan su resultado.
+- Limitador global: las consultas salen como máximo una cada GEOCODE_MIN_INTERVAL
+  segundos (política de Nominatim). Una petición espera su turno como mucho
+  GEOCODE_MAX_WAIT segundos (por defecto no espera) y si no, responde 503 con
+  Retry-After: esperar bloquearía el hilo WSGI que comparten todas las rutas.
+
+Si hay un índice local (GEOCODE_OFFLINE_INDEX) se consulta primero, y Nominatim
+solo atiende los puntos fuera del área indexada.
+
+Es síncrono a propósito: Flask ejecuta cada vista async en un loop nuevo, así que
+un cliente async no se podría compartir entre peticiones.
+"""
+import logging
+import threading
+import time
+
+import httpx
+
+from config import (
+    NOMINATIM_URL, NOMINATIM_USER_AGENT, GEOCODE_PRECISION, GEOCODE_CACHE_SIZE,
+    GEOCODE_CACHE_TTL, GEOCODE_MIN_INTERVAL, GEOCODE_MAX_WAIT, GEOCODE_OFFLINE_INDEX,
+    GEOCODE_OFFLINE_MAX_DISTANCE
+)
+from app.cache import LRUTTLCache
+
+logger = logging.getLogger(__name__)
+
+
+class GeocodingError(Exception):
+    """Nominatim respondió con un error (status distinto de 200)."""
+
+
+class GeocodingBusy(Exception):
+    """No hay turno libre a tiempo: mejor responder 503 que esperar. `retry_after` en segundos."""
+
+    def __init__(self, message, retry_after=1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class RateLimiter:
+    """Reparte turnos separados por `min_interval` segundos entre todos los hilos, en orden de llegada."""
+
+    def __init__(self, min_interval, max_wait=None, clock=time.monotonic, sleep=time.sleep):
+        self.min_interval = min_interval
+        self.max_wait = max_wait
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+        self.waited = 0
+
+    def acquire(self):
+        """Bloquea hasta el turno reservado. Lanza GeocodingBusy si habría que esperar más de max_wait."""
+        with self._lock:
+            now = self._clock()
+            slot = max(now, self._next_slot)
+            wait = slot - now
+            if self.max_wait is not None and wait > self.max_wait:
+                raise GeocodingBusy(f"Cola de geocodificación llena (espera estimada {wait:.1f}s).", retry_after=wait)
+            self._next_slot = slot + self.min_interval
+        if wait > 0:
+            self.waited += 1
+            self._sleep(wait)
+
+
+class _Flight:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class ReverseGeocoder:
+    def __init__(self, url=NOMINATIM_URL, user_agent=NOMINATIM_USER_AGENT, precision=GEOCODE_PRECISION,
+                 cache_size=GEOCODE_CACHE_SIZE, cache_ttl=GEOCODE_CACHE_TTL,
+                 min_interval=GEOCODE_MIN_INTERVAL, max_wait=GEOCODE_MAX_WAIT, client=None, timeout=10.0,
+                 offline=None):
+        self.url = url
+        self.offline = offline
+        self.precision = precision
+        self.timeout = timeout
+        self._client = client
+        self._headers = {"User-Agent": user_agent}  # Obligatorio para Nominatim
+        self._client_lock = threading.Lock()
+        self.cache = LRUTTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self.limiter = RateLimiter(min_interval, max_wait=max_wait)
+        self._flights = {}
+        self._flights_lock = threading.Lock()
+        self._metrics = {'offline_hits': 0, 'upstream_requests': 0, 'upstream_errors': 0, 'coalesced': 0}
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = httpx.Client(
+                        headers=self._headers,
+                        timeout=self.timeout,
+                        limits=httpx.Limits(max_connections=4, max_keepalive_connections=2)
+                    )
+        return self._client
+
+    def key(self, lat, lon):
+        """Celda de caché: coordenadas redondeadas a `precision` decimales."""
+        return (round(float(lat), self.precision), round(float(lon), self.precision))
+
+    def reverse(self, lat, lon):
+        """
+        Dirección para (lat, lon): del índice local si cubre el punto; si no, respuesta
+        JSON de Nominatim, desde la caché si la celda ya se consultó.
+        Lanza GeocodingError, GeocodingBusy o httpx.RequestError.
+        """
+        if self.offline is not None:
+            data = self.offline.reverse(lat, lon)
+            if data is not None:
+                self._metrics['offline_hits'] += 1
+                return data
+
+        key = self.key(lat, lon)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        with self._flights_lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                self._metrics['coalesced'] += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            # Otra petición pudo completar la celda entre el get() y tomar el vuelo
+            data = self.cache.peek(key)
+            if data is None:
+                data = self._fetch(*key)
+                self.cache.set(key, data)
+            flight.result = data
+            return data
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._flights_lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def _fetch(self, lat, lon):
+        self.limiter.acquire()
+        self._metrics['upstream_requests'] += 1
+        params = {
+            "format": "json",
+            "lat": lat,
+            "lon": lon,
+            "zoom": 18,
+            "addressdetails": 1
+        }
+        try:
+            response = self.client.get(self.url, params=params)
+        except httpx.RequestError:
+            self._metrics['upstream_errors'] += 1
+            raise
+        if response.status_code != 200:
+            self._metrics['upstream_errors'] += 1
+            logger.error(f"Error de Nominatim: {response.status_code} - {response.text}")
+            raise GeocodingError(f"Nominatim respondió {response.status_code}")
+        return response.json()
+
+    def close(self):
+        if self._client is not None:
+            self._client.close()
+
+    def stats(self):
+        stats = dict(self._metrics)
+        stats['cache'] = self.cache.stats()
+        stats['rate_limited_waits'] = self.limiter.waited
+        stats['in_flight'] = len(self._flights)
+        stats['offline_index_size'] = len(self.offline) if self.offline is not None else 0
+        return stats
+
+
+def _cargar_indice_offline(index_dir=GEOCODE_OFFLINE_INDEX):
+    """Índice local si está configurado y se puede abrir; si no, None (todo va a Nominatim)."""
+    if not index_dir:
+        return None
+    try:
+        from app.offline_geocoder import OfflineGeocoder  # Requiere numpy
+        return OfflineGeocoder(index_dir, max_distance_m=GEOCODE_OFFLINE_MAX_DISTANCE)
+    except Exception as e:
+        logger.error(f"No se pudo cargar el índice de geocodificación local '{index_dir}': {e}", exc_info=True)
+        return None
+
+
+# --- Instancia global ---
+geocoder = ReverseGeocoder(offline=_cargar_indice_offline())
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+Estado "caliente" en memoria: los pedidos que no están en un estado terminal y los
+conductores en línea.
+
+Es lo que consultan casi todos los endpoints mientras un pedido está vivo (estado,
+conductor, posición del repartidor), así que se sirve desde diccionarios en lugar
+de ir a Firestore. Firestore sigue siendo la fuente de verdad: el estado se
+reconstruye desde ahí al arrancar y cada cambio se escribe en segundo plano
+(buffer de escrituras).
+
+Los pedidos se guardan copy-on-write: cada cambio crea un dict nuevo y los ya
+guardados no se modifican, así que una lectura solo necesita una copia superficial.
+Quien reciba un pedido puede cambiar sus claves, pero no los dicts anidados.
+"""
+import threading
+
+from app.order_registry import ESTADOS_TERMINALES
+from app.timeutils import fecha_pedido_ms, marca_a_ms
+
+# Estados de conductor que cuentan como "en línea".
+ESTADOS_CONDUCTOR_EN_LINEA = frozenset({'disponible', 'ocupado'})
+
+
+def _fecha_orden(pedido):
+    return fecha_pedido_ms(pedido) or 0
+
+
+class HotStateStore:
+    """Pedidos activos (order_id -> dict) y conductores en línea (driver_id -> tupla compacta)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._orders = {}
+        self._drivers = {}  # driver_id -> (status, lat, lon, updated_ms)
+        self._metrics = {'order_hits': 0, 'order_misses': 0}
+
+    # --- Carga ---
+
+    def load(self, pedidos, conductores):
+        """Reemplaza todo el contenido. `pedidos`: {order_id: dict}, `conductores`: {driver_id: dict}."""
+        orders = {str(order_id): dict(p) for order_id, p in pedidos.items() if p.get('status') not in ESTADOS_TERMINALES}
+        drivers = {}
+        for driver_id, driver in conductores.items():
+            entrada = self._entrada_conductor(driver)
+            if entrada is not None:
+                drivers[str(driver_id)] = entrada
+        with self._lock:
+            self._orders = orders
+            self._drivers = drivers
+
+    def clear(self):
+        with self._lock:
+            self._orders = {}
+            self._drivers = {}
+
+    # --- Pedidos ---
+
+    def put_order(self, order_id, pedido):
+        """Guarda el pedido si está activo; si es terminal lo quita. Devuelve True si quedó guardado."""
+        order_id = str(order_id)
+        with self._lock:
+            if pedido.get('status') in ESTADOS_TERMINALES:
+                self._orders.pop(order_id, None)
+                return False
+            self._orders[order_id] = dict(pedido)
+            return True
+
+    def update_order(self, order_id, fields):
+        """Mezcla `fields` en un pedido activo. Devuelve False si el pedido no está."""
+        order_id = str(order_id)
+        with self._lock:
+            actual = self._orders.get(order_id)
+            if actual is None:
+                return False
+            nuevo = {**actual, **fields}
+            if nuevo.get('status') in ESTADOS_TERMINALES:
+                del self._orders[order_id]
+            else:
+                self._orders[order_id] = nuevo
+            return True
+
+    def remove_order(self, order_id):
+        with self._lock:
+            return self._orders.pop(str(order_id), None) is not None
+
+    def get_order(self, order_id):
+        """Copia superficial del pedido activo, o None."""
+        pedido = self._orders.get(str(order_id))
+        if pedido is None:
+            self._metrics['order_misses'] += 1
+            return None
+        self._metrics['order_hits'] += 1
+        return dict(pedido)
+
+    def __contains__(self, order_id):
+        return str(order_id) in self._orders
+
+    def order_updated_at(self, order_id):
+        """'updated_at' del pedido guardado (None si no está): para descartar cambios atrasados."""
+        pedido = self._orders.get(str(order_id))
+        return pedido.get('updated_at') if pedido is not None else None
+
+    def orders(self):
+        """Todos los pedidos activos, del más reciente al más antiguo."""
+        pedidos = sorted(list(self._orders.values()), key=_fecha_orden, reverse=True)
+        return [dict(p) for p in pedidos]
+
+    # --- Conductores ---
+
+    @staticmethod
+    def _entrada_conductor(driver, updated_ms=None):
+        status = driver.get('status')
+        loc = driver.get('location') or {}
+        if status not in ESTADOS_CONDUCTOR_EN_LINEA or 'latitude' not in loc or 'longitude' not in loc:
+            return None
+        if updated_ms is None:
+            updated_ms = marca_a_ms(driver.get('last_update'))
+        return (status, float(loc['latitude']), float(loc['longitude']), updated_ms)
+
+    def put_driver(self, driver_id, lat, lon, status, updated_ms=None):
+        """Registra la posición y estado de un conductor; si ya no está en línea lo quita."""
+        driver_id = str(driver_id)
+        with self._lock:
+            if status not in ESTADOS_CONDUCTOR_EN_LINEA:
+                self._drivers.pop(driver_id, None)
+                return False
+            self._drivers[driver_id] = (status, float(lat), float(lon), updated_ms)
+            return True
+
+    def put_driver_doc(self, driver_id, driver):
+        """Como put_driver, a partir de un documento de 'drivers'. Devuelve True si quedó en línea."""
+        entrada = self._entrada_conductor(driver)
+        driver_id = str(driver_id)
+        with self._lock:
+            if entrada is None:
+                self._drivers.pop(driver_id, None)
+                return False
+            self._drivers[driver_id] = entrada
+            return True
+
+    def driver_updated_at(self, driver_id):
+        entrada = self._drivers.get(str(driver_id))
+        return entrada[3] if entrada is not None else None
+
+    def remove_driver(self, driver_id):
+        with self._lock:
+            return self._drivers.pop(str(driver_id), None) is not None
+
+    @staticmethod
+    def _driver_dict(driver_id, entrada):
+        status, lat, lon, updated_ms = entrada
+        return {'id': driver_id, 'status': status, 'location': {'latitude': lat, 'longitude': lon}, 'last_update': updated_ms}
+
+    def get_driver(self, driver_id):
+        entrada = self._drivers.get(str(driver_id))
+        return self._driver_dict(str(driver_id), entrada) if entrada else None
+
+    def drivers(self, status=None):
+        """Conductores en línea como dicts {'id', 'status', 'location', 'last_update'}."""
+        return [
+            self._driver_dict(driver_id, entrada)
+            for driver_id, entrada in list(self._drivers.items())
+            if status is None or entrada[0] == status
+        ]
+
+    def stats(self):
+        stats = dict(self._metrics)
+        stats['orders'] = len(self._orders)
+        stats['drivers'] = len(self._drivers)
+        return stats
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+Respuestas HTTP pre-serializadas con ETag fuerte y variante gzip.
+
+Para contenido que cambia poco (el menú, facturas ya generadas): el cuerpo se
+serializa y comprime una sola vez; cada petición elige la variante según
+Accept-Encoding y solo compara su ETag. Cada variante tiene su propio ETag fuerte
+(los bytes son distintos, RFC 9110 §8.8.3): el de la variante sin comprimir con el
+sufijo '-gzip'.
+"""
+import gzip
+import hashlib
+
+from flask import Response, request
+
+# Por debajo de este tamaño comprimir no compensa.
+MIN_COMPRESS_BYTES = 512
+
+
+def make_etag(body):
+    """ETag fuerte (entre comillas) a partir del contenido."""
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def _etag_variante(etag, encoding):
+    """ETag de una variante comprimida: el sufijo va dentro de las comillas."""
+    if encoding == 'identity':
+        return etag
+    return f'{etag[:-1]}-{encoding}"' if etag.endswith('"') else f'{etag}-{encoding}'
+
+
+class PreparedResponse:
+    """Cuerpo ya serializado + variante gzip calculada una vez, cada una con su ETag."""
+
+    def __init__(self, body, content_type, etag=None):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self.body = body
+        self.content_type = content_type
+        self.etag = etag or make_etag(body)
+        self.variants = {'identity': body}
+        if len(body) >= MIN_COMPRESS_BYTES:
+            self.variants['gzip'] = gzip.compress(body, compresslevel=9, mtime=0)
+        self.etags = {encoding: _etag_variante(self.etag, encoding) for encoding in self.variants}
+
+
+def _accepted_encodings(header):
+    """Codificación -> q según Accept-Encoding (incluye '*' si viene)."""
+    accepted = {}
+    for part in (header or '').split(','):
+        token, _, params = part.strip().partition(';')
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[token] = q
+    return accepted
+
+
+def _elegir_encoding(prepared, header):
+    """gzip si lo acepta; un 'gzip;q=0' explícito tiene prioridad sobre '*'."""
+    accepted = _accepted_encodings(header)
+    if 'gzip' in prepared.variants and accepted.get('gzip', accepted.get('*', 0.0)) > 0:
+        return 'gzip'
+    return 'identity'
+
+
+def etag_matches(etag, if_none_match):
+    """Comparación débil de If-None-Match (RFC 9110), que es la que aplica a GET."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    candidates = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+    return etag in candidates
+
+
+def serve_prepared(prepared, cache_control, status=200):
+    """
+    Devuelve `prepared` para la petición actual: la variante comprimida que acepte,
+    o 304 si el cliente ya tiene esa variante.
+    """
+    encoding = _elegir_encoding(prepared, request.headers.get('Accept-Encoding'))
+    headers = {
+        'ETag': prepared.etags[encoding],
+        'Cache-Control': cache_control,
+        'Vary': 'Accept-Encoding',
+    }
+    if etag_matches(prepared.etags[encoding], request.headers.get('If-None-Match')):
+        return Response(status=304, headers=headers)
+
+    if encoding != 'identity':
+        headers['Content-Encoding'] = encoding
+    return Response(prepared.variants[encoding], status=status, content_type=prepared.content_type, headers=headers)
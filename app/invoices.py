@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+Factura web (/factura/<id>).
+
+La plantilla se compila una sola vez al importar el módulo y el HTML generado se
+guarda en caché por pedido junto con un hash de su contenido: mientras el pedido
+no cambie, ver la factura de nuevo no vuelve a renderizar nada (y el ETag permite
+responder 304 a quien ya la tiene).
+"""
+import hashlib
+import json
+import logging
+from jinja2 import Environment
+
+from app.cache import LRUTTLCache
+from app.http_cache import PreparedResponse
+from app.timeutils import formatear_fecha_local, FORMATO_FECHA_HORA
+
+logger = logging.getLogger(__name__)
+
+# Cambiar si se modifica la plantilla, para invalidar ETags ya entregados.
+TEMPLATE_VERSION = 1
+
+_INVOICE_TEMPLATE_SOURCE = """
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <meta charset="utf-8">
+        <title>Factura Pizzeria Nova #{{ order_id }}</title>
+        <style>
+            body { font-family: sans-serif; margin: 20px; }
+            .container { max-width: 600px; margin: auto; padding: 20px; border: 1px solid #ddd; box-shadow: 0 0 10px rgba(0,0,0,0.1); }
+            h1 { color: #E94E1B; text-align: center; border-bottom: 2px solid #ddd; padding-bottom: 10px; }
+            table { width: 100%; border-collapse: collapse; margin-top: 20px; }
+            th, td { border-bottom: 1px solid #eee; padding: 8px; }
+            th { background-color: #f5f5f5; text-align: left; }
+            .summary-table td { border: none; font-weight: bold; }
+            .total-row td { border-top: 2px solid #333; font-size: 1.2em; }
+            .client-info { background-color: #f9f9f9; padding: 10px; border-radius: 5px; margin-bottom: 20px; }
+        </style>
+    </head>
+    <body>
+        <div class="container">
+            <h1>🍕 Factura Pizzeria Nova</h1>
+
+            <div class="client-info">
+                <p><strong>Factura N°:</strong> {{ order_id }}</p>
+                <p><strong>Fecha/Hora:</strong> {{ invoice_date }}</p>
+                <p><strong>Cliente:</strong> {{ customer_name }}</p>
+                <p><strong>NIT/CI:</strong> {{ customer_nit }}</p>
+                <p><strong>Teléfono:</strong> {{ customer_phone }}</p>
+            </div>
+
+            <p><strong>Dirección de Entrega:</strong> {{ address }}</p>
+            <p><strong>Método de Pago:</strong> {{ payment_method }}</p>
+
+            <table>
+                <thead>
+                    <tr>
+                        <th>Producto</th>
+                        <th style="text-align: center;">Cant.</th>
+                        <th style="text-align: right;">Precio Unit.</th>
+                        <th style="text-align: right;">Total Item</th>
+                    </tr>
+                </thead>
+                <tbody>
+                    {%- for item in items %}
+                    <tr>
+                        <td style="text-align: left; padding: 8px 0;">{{ item.name }} ({{ item.emoji }})</td>
+                        <td style="text-align: center;">{{ item.quantity }}</td>
+                        <td style="text-align: right;">{{ currency }} {{ "%.2f"|format(item.price) }}</td>
+                        <td style="text-align: right;">{{ currency }} {{ "%.2f"|format(item.total) }}</td>
+                    </tr>
+                    {%- endfor %}
+                </tbody>
+            </table>
+
+            <table class="summary-table" style="margin-top: 20px; float: right; width: 50%;">
+                <tr class="total-row">
+                    <td>Total a Pagar:</td>
+                    <td style="text-align: right;">{{ currency }} {{ "%.2f"|format(total) }}</td>
+                </tr>
+            </table>
+            <div style="clear: both;"></div>
+
+            <p style="text-align: center; margin-top: 30px; font-size: 0.8em; color: #777;">
+                Gracias por tu pedido. Este documento es un comprobante de venta simplificado.
+            </p>
+        </div>
+    </body>
+    </html>
+"""
+
+# Compilada una sola vez; autoescape evita que datos del cliente inyecten HTML.
+_invoice_template = Environment(autoescape=True).from_string(_INVOICE_TEMPLATE_SOURCE)
+
+# order_id -> (hash del contenido, PreparedResponse)
+_rendered_invoices = LRUTTLCache(maxsize=500, ttl=3600)
+
+
+def total_linea(item):
+    """Total de la línea: centavos exactos del motor de precios, o precio x cantidad en pedidos antiguos."""
+    if 'line_total_cents' in item:
+        return item['line_total_cents'] / 100
+    return item['price'] * item['quantity']
+
+
+def generate_invoice_html(order):
+    """Genera una factura simple en HTML"""
+    items = [
+        {
+            'name': item['name'],
+            'emoji': item.get('emoji', '🍕'),
+            'quantity': item['quantity'],
+            'price': item['price'],
+            'total': total_linea(item)
+        }
+        for item in order.get('items', [])
+    ]
+    return _invoice_template.render(
+        order_id=order['id'],
+        invoice_date=formatear_fecha_local(order, FORMATO_FECHA_HORA),
+        customer_name=order.get('customer_name', 'Cliente'),
+        customer_nit=order.get('customer_nit', 'S/N'),
+        customer_phone=order.get('customer_phone', 'No registrado'),
+        address=order.get('address', 'No especificada'),
+        payment_method=order['paymentMethod'],
+        currency=order.get('currency', 'Bs'),
+        items=items,
+        total=order.get('total', 0)
+    )
+
+
+# Solo los campos que aparecen en la factura: cambios de estado o de ubicación
+# del conductor no obligan a volver a renderizarla.
+_CAMPOS_FACTURA = (
+    'id', 'date_ts', 'date', 'customer_name', 'customer_nit', 'customer_phone',
+    'address', 'paymentMethod', 'currency', 'items', 'total'
+)
+
+
+def _hash_pedido(order):
+    campos = {campo: order.get(campo) for campo in _CAMPOS_FACTURA}
+    contenido = json.dumps(campos, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(f"{TEMPLATE_VERSION}:{contenido}".encode('utf-8')).hexdigest()[:32]
+
+
+def obtener_factura_preparada(order):
+    """
+    HTML de la factura listo para servir (con ETag), reutilizando el render anterior
+    si el contenido del pedido no cambió desde entonces.
+    """
+    order_id = str(order['id'])
+    content_hash = _hash_pedido(order)
+    cached = _rendered_invoices.get(order_id)
+    if cached is not None and cached[0] == content_hash:
+        return cached[1]
+
+    prepared = PreparedResponse(generate_invoice_html(order), 'text/html; charset=utf-8', etag=f'"{content_hash}"')
+    _rendered_invoices.set(order_id, (content_hash, prepared))
+    return prepared
+
+
+def estadisticas_facturas():
+    return _rendered_invoices.stats()
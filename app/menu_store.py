@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+Almacén del menú con recarga en caliente.
+
+El menú se carga desde un archivo JSON, desde Firestore o, por defecto, desde
+`app/menu_data.py`, y se publica como una instantánea inmutable con índices por
+id de producto y por categoría. Recargar construye una instantánea nueva y la
+reemplaza de una sola vez: quien esté leyendo sigue con la anterior, sin locks.
+Cada recarga incrementa `version`, que las cachés (ej. /get_products) usan como clave.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from types import MappingProxyType
+
+from config import MENU_SOURCE, MENU_FILE, MENU_RELOAD_INTERVAL
+from app.menu_data import products as MENU_POR_DEFECTO
+
+logger = logging.getLogger(__name__)
+
+
+class MenuError(ValueError):
+    """El menú cargado no es válido (ids repetidos, precios no numéricos, etc.)."""
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def _thaw(value):
+    if isinstance(value, MappingProxyType):
+        return {k: _thaw(v) for k, v in value.items()}
+    if isinstance(value, tuple):
+        return [_thaw(v) for v in value]
+    return value
+
+
+class MenuSnapshot:
+    """Versión inmutable del menú con índices O(1) por id y por categoría."""
+
+    def __init__(self, data, version):
+        self.version = version
+        by_id = {}
+        category_of = {}
+        categories = {}
+        for category, items in data.items():
+            if not isinstance(items, list):
+                raise MenuError(f"La categoría '{category}' debe ser una lista de productos.")
+            frozen_items = []
+            for item in items:
+                product_id = item.get('id')
+                if not product_id:
+                    raise MenuError(f"Producto sin 'id' en la categoría '{category}'.")
+                if product_id in by_id:
+                    raise MenuError(f"Id de producto repetido: '{product_id}'.")
+                if not isinstance(item.get('price'), (int, float)):
+                    raise MenuError(f"Precio inválido para '{product_id}'.")
+                frozen = _freeze(item)
+                by_id[product_id] = frozen
+                category_of[product_id] = category
+                frozen_items.append(frozen)
+            categories[category] = tuple(frozen_items)
+        self.by_id = MappingProxyType(by_id)
+        self.category_of = MappingProxyType(category_of)
+        self.categories = MappingProxyType(categories)
+
+    @property
+    def raw(self):
+        """Menú completo, congelado: categoría -> tupla de productos (mappings de solo lectura)."""
+        return self.categories
+
+    def to_dict(self):
+        """Copia mutable (dicts y listas) del menú, para serializar a JSON."""
+        return _thaw(self.categories)
+
+    def get(self, product_id):
+        return self.by_id.get(product_id)
+
+    def items_in(self, category):
+        return self.categories.get(category, ())
+
+    def __len__(self):
+        return len(self.by_id)
+
+
+class MenuStore:
+    def __init__(self, source=MENU_SOURCE, path=MENU_FILE):
+        self.source = source
+        self.path = path
+        self._reload_lock = threading.Lock()
+        self._listeners = []
+        self._file_mtime = None
+        self._watcher = None
+        self._snapshot = MenuSnapshot(MENU_POR_DEFECTO, version=1)
+
+    @property
+    def snapshot(self):
+        """Instantánea vigente. Guardarla en una variable local si se leen varios campos."""
+        return self._snapshot
+
+    @property
+    def version(self):
+        return self._snapshot.version
+
+    def on_change(self, callback):
+        """Registra `callback(snapshot)` para cuando se publique una versión nueva."""
+        self._listeners.append(callback)
+
+    def _load_data(self):
+        if self.source == 'file':
+            with open(self.path, encoding='utf-8') as f:
+                self._file_mtime = os.path.getmtime(self.path)
+                return json.load(f)
+        if self.source == 'firestore':
+            from app.services import db
+            if not db:
+                raise MenuError("Firestore no está disponible para cargar el menú.")
+            data = {}
+            for doc in db.collection('menu').stream():
+                data[doc.id] = doc.to_dict().get('items', [])
+            if not data:
+                raise MenuError("La colección 'menu' de Firestore está vacía.")
+            return data
+        return MENU_POR_DEFECTO
+
+    def reload(self):
+        """
+        Vuelve a cargar el menú desde su fuente y publica una nueva versión.
+        Si la carga falla se conserva la versión anterior y se relanza el error.
+        """
+        with self._reload_lock:
+            try:
+                data = self._load_data()
+                snapshot = MenuSnapshot(data, version=self._snapshot.version + 1)
+            except Exception as e:
+                logger.error(f"No se pudo recargar el menú desde '{self.source}': {e}", exc_info=True)
+                raise
+            self._snapshot = snapshot
+        logger.info(f"Menú recargado desde '{self.source}': versión {snapshot.version}, {len(snapshot)} productos.")
+        for callback in list(self._listeners):
+            try:
+                callback(snapshot)
+            except Exception as e:
+                logger.error(f"Error en un listener de cambio de menú: {e}", exc_info=True)
+        return snapshot
+
+    def start_watcher(self, interval=MENU_RELOAD_INTERVAL):
+        """Si la fuente es un archivo, lo revisa cada `interval` segundos y recarga si cambió."""
+        if self.source != 'file' or interval <= 0 or self._watcher:
+            return
+
+        def watch():
+            ultimo_error = None
+            while True:
+                time.sleep(interval)
+                try:
+                    cambiado = os.path.getmtime(self.path) != self._file_mtime
+                    ultimo_error = None
+                except OSError as e:
+                    # Una vez por error distinto (ej. archivo borrado), no en cada vuelta
+                    if repr(e) != ultimo_error:
+                        ultimo_error = repr(e)
+                        logger.error(f"No se puede revisar el menú '{self.path}' (se mantiene la versión {self.version}): {e}", exc_info=True)
+                    continue
+                if cambiado:
+                    try:
+                        self.reload()
+                    except Exception:
+                        # reload() ya lo registró con exc_info; se reintenta cuando el archivo vuelva a cambiar
+                        logger.warning(f"Se mantiene la versión {self.version} del menú.")
+
+        self._watcher = threading.Thread(target=watch, name="menu-watcher", daemon=True)
+        self._watcher.start()
+
+
+def _crear_store():
+    store = MenuStore()
+    if store.source != 'module':
+        try:
+            store.reload()
+        except Exception:
+            logger.warning("Se usará el menú por defecto de app/menu_data.py.")
+        store.start_watcher()
+    return store
+
+
+# --- Instancia global ---
+menu_store = _crear_store()
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+Geocodificación inversa local para la zona de reparto.
+
+Índice de direcciones generado por `build_geocode_index.py` a partir de un
+extracto de OpenStreetMap. Los puntos se guardan ordenados por celda de una
+grilla regular, en arrays .npy que se abren con mmap: cargarlo no lee el archivo
+completo y una consulta solo toca las 3x3 celdas vecinas (búsqueda binaria por
+fila + distancia vectorizada), del orden de decenas de microsegundos.
+
+Archivos del directorio del índice:
+    meta.json          grilla (origen, tamaño de celda, filas/columnas) y bbox
+    lat.npy, lon.npy   float64, coordenadas de cada dirección
+    cells.npy          int64, celda de cada punto (ordenado ascendente)
+    label_offsets.npy  int64, N+1 desplazamientos dentro de labels.bin
+    labels.bin         textos UTF-8 concatenados
+    address_offsets.npy, addresses.bin
+                       igual, con el diccionario 'address' de cada punto en JSON
+                       (ausentes en índices antiguos: 'address' sale vacío)
+"""
+import json
+import logging
+import math
+import mmap
+import os
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+METROS_POR_GRADO_LAT = 110540.0
+METROS_POR_GRADO_LON = 111320.0
+
+
+def celda(lat, lon, meta):
+    """(fila, columna) de la grilla para un punto (puede caer fuera de la grilla)."""
+    fila = int(math.floor((lat - meta['lat0']) / meta['cell_deg']))
+    columna = int(math.floor((lon - meta['lon0']) / meta['cell_deg']))
+    return fila, columna
+
+
+def _abrir_blob(path):
+    with open(path, 'rb') as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(path) else b''
+
+
+class OfflineGeocoder:
+    def __init__(self, index_dir, max_distance_m=150.0):
+        with open(os.path.join(index_dir, 'meta.json'), encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self.lat = np.load(os.path.join(index_dir, 'lat.npy'), mmap_mode='r')
+        self.lon = np.load(os.path.join(index_dir, 'lon.npy'), mmap_mode='r')
+        self.cells = np.load(os.path.join(index_dir, 'cells.npy'), mmap_mode='r')
+        self.label_offsets = np.load(os.path.join(index_dir, 'label_offsets.npy'), mmap_mode='r')
+        self._labels = _abrir_blob(os.path.join(index_dir, 'labels.bin'))
+        if os.path.exists(os.path.join(index_dir, 'addresses.bin')):
+            self.address_offsets = np.load(os.path.join(index_dir, 'address_offsets.npy'), mmap_mode='r')
+            self._addresses = _abrir_blob(os.path.join(index_dir, 'addresses.bin'))
+        else:
+            self.address_offsets = None
+
+        meta = self.meta
+        self._cos_lat = math.cos(math.radians((meta['lat_min'] + meta['lat_max']) / 2))
+        # Solo se revisan las celdas vecinas: más allá de una celda no se garantiza el más cercano
+        alcance = meta['cell_deg'] * METROS_POR_GRADO_LON * self._cos_lat
+        if max_distance_m > alcance:
+            logger.warning(f"GEOCODE_OFFLINE_MAX_DISTANCE ({max_distance_m} m) supera el tamaño de celda del índice; se usa {alcance:.0f} m.")
+            max_distance_m = alcance
+        self.max_distance_m = max_distance_m
+        logger.info(f"Índice de geocodificación local cargado: {len(self.lat)} direcciones desde '{index_dir}'.")
+
+    def __len__(self):
+        return len(self.lat)
+
+    def covers(self, lat, lon):
+        """True si el punto está dentro del área indexada."""
+        meta = self.meta
+        return meta['lat_min'] <= lat <= meta['lat_max'] and meta['lon_min'] <= lon <= meta['lon_max']
+
+    def _label(self, i):
+        inicio, fin = int(self.label_offsets[i]), int(self.label_offsets[i + 1])
+        return self._labels[inicio:fin].decode('utf-8')
+
+    def _address(self, i):
+        if self.address_offsets is None:
+            return {}
+        inicio, fin = int(self.address_offsets[i]), int(self.address_offsets[i + 1])
+        return json.loads(self._addresses[inicio:fin].decode('utf-8'))
+
+    def reverse(self, lat, lon):
+        """
+        Dirección más cercana a (lat, lon) con el mismo formato básico que Nominatim
+        ('display_name', 'lat', 'lon', 'address'), o None si el punto está fuera del área
+        indexada o no hay ninguna dirección a menos de max_distance_m.
+
+        'address' solo trae los campos que tenía el extracto de OSM (road, house_number,
+        suburb, city, postcode); no incluye state, country ni country_code como Nominatim.
+        """
+        lat, lon = float(lat), float(lon)
+        if not len(self.lat) or not self.covers(lat, lon):
+            return None
+
+        meta = self.meta
+        fila, columna = celda(lat, lon, meta)
+        col_min = max(columna - 1, 0)
+        col_max = min(columna + 1, meta['ncols'] - 1)
+        rangos = []
+        for f in (fila - 1, fila, fila + 1):
+            if 0 <= f < meta['nrows']:
+                # Las tres celdas de la fila son claves consecutivas: un solo rango
+                inicio = np.searchsorted(self.cells, f * meta['ncols'] + col_min, side='left')
+                fin = np.searchsorted(self.cells, f * meta['ncols'] + col_max, side='right')
+                if fin > inicio:
+                    rangos.append((inicio, fin))
+        if not rangos:
+            return None
+
+        indices = np.concatenate([np.arange(inicio, fin) for inicio, fin in rangos])
+        dy = (self.lat[indices] - lat) * METROS_POR_GRADO_LAT
+        dx = (self.lon[indices] - lon) * (METROS_POR_GRADO_LON * self._cos_lat)
+        distancias = dx * dx + dy * dy
+        mejor = int(np.argmin(distancias))
+        distancia_m = math.sqrt(float(distancias[mejor]))
+        if distancia_m > self.max_distance_m:
+            return None
+
+        i = int(indices[mejor])
+        return {
+            'display_name': self._label(i),
+            'lat': f"{float(self.lat[i]):.7f}",
+            'lon': f"{float(self.lon[i]):.7f}",
+            'address': self._address(i),
+            'distance_m': round(distancia_m, 1),
+            'source': 'offline'
+        }
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+Registro en memoria de los pedidos activos de cada conductor.
+
+Reemplaza las consultas a Firestore que se hacían por cada conductor para saber
+si estaba ocupado: saber si un conductor tiene pedidos en proceso pasa a ser
+una búsqueda en un diccionario.
+"""
+import threading
+
+# Estados en los que un pedido ya no ocupa al conductor.
+ESTADOS_TERMINALES = frozenset({'Entregado', 'Cancelado'})
+
+
+def es_estado_terminal(estado):
+    return estado in ESTADOS_TERMINALES
+
+
+class ActiveOrderRegistry:
+    """
+    Mantiene order_id -> driver_id y driver_id -> {order_id} solo para pedidos
+    que no están en un estado terminal.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._driver_by_order = {}
+        self._orders_by_driver = {}
+
+    def track(self, order_id, driver_id, estado):
+        """
+        Registra el estado actual de un pedido. Si el estado es terminal (o el pedido
+        no tiene conductor) el pedido deja de ocupar a su conductor.
+        """
+        order_id = str(order_id)
+        with self._lock:
+            previous_driver = self._driver_by_order.pop(order_id, None)
+            if previous_driver is not None:
+                self._discard(previous_driver, order_id)
+            if driver_id is None:
+                driver_id = previous_driver
+            if driver_id is None or es_estado_terminal(estado):
+                return
+            driver_id = str(driver_id)
+            self._driver_by_order[order_id] = driver_id
+            self._orders_by_driver.setdefault(driver_id, set()).add(order_id)
+
+    def release(self, order_id):
+        """Libera el pedido de su conductor (pasó a un estado terminal)."""
+        order_id = str(order_id)
+        with self._lock:
+            driver_id = self._driver_by_order.pop(order_id, None)
+            if driver_id is not None:
+                self._discard(driver_id, order_id)
+
+    def _discard(self, driver_id, order_id):
+        orders = self._orders_by_driver.get(driver_id)
+        if orders is not None:
+            orders.discard(order_id)
+            if not orders:
+                del self._orders_by_driver[driver_id]
+
+    def is_busy(self, driver_id):
+        return str(driver_id) in self._orders_by_driver
+
+    def busy_drivers(self):
+        with self._lock:
+            return set(self._orders_by_driver)
+
+    def active_orders(self, driver_id):
+        """IDs de los pedidos activos del conductor."""
+        with self._lock:
+            return set(self._orders_by_driver.get(str(driver_id), ()))
+
+    def driver_of(self, order_id):
+        return self._driver_by_order.get(str(order_id))
+
+    def clear(self):
+        with self._lock:
+            self._driver_by_order.clear()
+            self._orders_by_driver.clear()
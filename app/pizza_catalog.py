@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Catálogo persistente de ideas de pizza.
+
+Un archivo JSON Lines (una idea por línea, clave = ingredientes normalizados) que
+se carga completo en memoria al iniciar: las combinaciones conocidas se responden
+sin llamar a Gemini. `build_pizza_catalog.py` lo llena por adelantado con las
+combinaciones más comunes y el servicio agrega al final cada idea nueva que genera
+con ingredientes del menú (`vocabulario`); las combinaciones de texto libre del
+cliente quedan solo en la caché LRU del servicio, para que el archivo no crezca
+sin límite. Si una combinación aparece dos veces, vale la última línea.
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+from app.menu_data import products
+
+logger = logging.getLogger(__name__)
+
+
+def ingredientes_del_menu():
+    """Ingredientes de los adicionales 'Extra ...' del menú ("Extra Jamón" -> "Jamón")."""
+    ingredientes = []
+    for adicional in products.get('adicionales', []):
+        nombre = adicional['name']
+        if nombre.startswith('Extra '):
+            ingredientes.append(nombre[len('Extra '):])
+    return ingredientes
+
+
+class IdeaCatalog:
+    def __init__(self, path, vocabulario=None):
+        self.path = path
+        # Ingredientes normalizados que se pueden persistir; None = cualquiera
+        self.vocabulario = frozenset(vocabulario) if vocabulario is not None else None
+        self._ideas = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            logger.info(f"Catálogo de ideas '{self.path}' no existe todavía; se creará al agregar ideas.")
+            return
+        invalidas = 0
+        with open(self.path, encoding='utf-8') as f:
+            for linea in f:
+                linea = linea.strip()
+                if not linea:
+                    continue
+                try:
+                    entrada = json.loads(linea)
+                    clave = tuple(entrada['ingredients'])
+                    self._ideas[clave] = {'name': entrada['name'], 'description': entrada['description']}
+                except (ValueError, KeyError, TypeError):
+                    invalidas += 1  # Ej. una línea cortada por un apagado a mitad de escritura
+        if invalidas:
+            logger.warning(f"Catálogo de ideas: se ignoraron {invalidas} líneas inválidas.")
+        logger.info(f"Catálogo de ideas cargado: {len(self._ideas)} combinaciones desde '{self.path}'.")
+
+    def __len__(self):
+        return len(self._ideas)
+
+    def __contains__(self, ingredientes):
+        return ingredientes in self._ideas
+
+    def get(self, ingredientes):
+        """Idea para una tupla de ingredientes normalizada, o None."""
+        idea = self._ideas.get(ingredientes)
+        if idea is not None:
+            self.hits += 1
+            return dict(idea)
+        return None
+
+    def admite(self, ingredientes):
+        """True si todos los ingredientes son del vocabulario (las ideas que vale la pena guardar)."""
+        return self.vocabulario is None or self.vocabulario.issuperset(ingredientes)
+
+    def add(self, ingredientes, idea, source='live'):
+        """Guarda la idea en memoria y la agrega al final del archivo."""
+        entrada = {
+            'ingredients': list(ingredientes),
+            'name': idea['name'],
+            'description': idea['description'],
+            'source': source,
+            'created_at': int(time.time() * 1000)
+        }
+        linea = json.dumps(entrada, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._ideas[tuple(ingredientes)] = {'name': idea['name'], 'description': idea['description']}
+            try:
+                directorio = os.path.dirname(self.path)
+                if directorio:
+                    os.makedirs(directorio, exist_ok=True)
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(linea)
+            except OSError as e:
+                logger.error(f"No se pudo guardar la idea en el catálogo '{self.path}': {e}")
+
+    def stats(self):
+        return {'size': len(self._ideas), 'hits': self.hits}
@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+"""
+Ideas de pizza (nombre + descripción) generadas con Gemini para /generate_pizza_idea.
+
+- Caché por conjunto de ingredientes normalizado (minúsculas, sin repetidos,
+  ordenado): "Queso, jamón" y "jamón ,queso" son la misma idea.
+- Las peticiones iguales que llegan a la vez comparten una sola llamada al modelo.
+- Las llamadas salen por un pool de GEMINI_MAX_CONCURRENCY hilos y cada espera
+  tiene un límite de tiempo; los objetos GenerativeModel se crean una vez.
+- Un circuit breaker por modelo: si un modelo falla varias veces seguidas se deja
+  de llamar un rato y se pasa directo al siguiente (fallback).
+- Antes de generar se consulta el catálogo persistente (app/pizza_catalog.py) y
+  cada idea nueva con ingredientes del menú se agrega a él.
+- El generador es intercambiable: PIZZA_IDEA_GENERATOR=stub usa uno local
+  determinista, sin red ni API key.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import google.generativeai as genai
+
+from config import (
+    GEMINI_API_KEY, GEMINI_MODELS, GEMINI_TIMEOUT, GEMINI_MAX_CONCURRENCY, GEMINI_BREAKER_THRESHOLD,
+    GEMINI_BREAKER_RESET, PIZZA_IDEA_CACHE_SIZE, PIZZA_IDEA_CACHE_TTL, PIZZA_IDEA_GENERATOR,
+    PIZZA_IDEA_CATALOG
+)
+from app.cache import LRUTTLCache
+from app.pizza_catalog import IdeaCatalog, ingredientes_del_menu
+
+logger = logging.getLogger(__name__)
+
+MAX_INGREDIENTES = 20
+MAX_LARGO_INGREDIENTE = 60
+
+
+class IdeaUnavailable(Exception):
+    """No hay ningún modelo disponible (todos fallaron o tienen el circuito abierto)."""
+
+
+class IdeaFormatError(ValueError):
+    """El modelo respondió, pero no con un JSON con 'name' y 'description'."""
+
+
+def normalizar_ingredientes(ingredients):
+    """
+    Tupla ordenada y sin repetidos de ingredientes en minúsculas (clave de caché).
+    Lanza ValueError si la lista no es válida.
+    """
+    if not isinstance(ingredients, list) or len(ingredients) == 0:
+        raise ValueError("El campo 'ingredients' debe ser una lista no vacía.")
+    normalizados = set()
+    for ingrediente in ingredients:
+        if not isinstance(ingrediente, str):
+            raise ValueError("Cada ingrediente debe ser un texto.")
+        limpio = " ".join(ingrediente.split()).lower()
+        if not limpio:
+            continue
+        if len(limpio) > MAX_LARGO_INGREDIENTE:
+            raise ValueError(f"Ingrediente demasiado largo: '{limpio[:20]}...'.")
+        normalizados.add(limpio)
+    if not normalizados:
+        raise ValueError("El campo 'ingredients' debe ser una lista no vacía.")
+    if len(normalizados) > MAX_INGREDIENTES:
+        raise ValueError(f"Máximo {MAX_INGREDIENTES} ingredientes.")
+    return tuple(sorted(normalizados))
+
+
+def construir_prompt(ingredientes):
+    ingredients_text = ", ".join(ingredientes)
+    return (
+        f"Eres un chef de pizzas experto y creativo. "
+        f"Tu tarea es inventar un nombre y una descripción para una nueva pizza basada en una lista de ingredientes. "
+        f"Ingredientes: {ingredients_text}. "
+        f"Por favor, responde únicamente con un objeto JSON válido que contenga dos claves: 'name' (el nombre de la pizza) y 'description' (una descripción corta y apetitosa). "
+        f"No incluyas ninguna otra palabra, explicación o formato markdown como ```json."
+    )
+
+
+def parsear_idea(texto):
+    """Extrae {'name', 'description'} de la respuesta del modelo."""
+    # Limpiar la respuesta para asegurarse de que es un JSON válido
+    cleaned = texto.strip().replace("```json", "").replace("```", "").strip()
+    try:
+        idea = json.loads(cleaned)
+    except json.JSONDecodeError:
+        raise IdeaFormatError(f"Respuesta no es JSON: {texto[:200]!r}")
+    if not isinstance(idea, dict) or 'name' not in idea or 'description' not in idea:
+        raise IdeaFormatError("La respuesta de la IA no contiene 'name' o 'description'.")
+    return {'name': str(idea['name']), 'description': str(idea['description'])}
+
+
+class CircuitBreaker:
+    """
+    Cerrado: se llama normalmente. Tras `failure_threshold` fallos seguidos se abre
+    y no se llama durante `reset_timeout` s; luego deja pasar una prueba (semiabierto):
+    si sale bien se cierra, si falla vuelve a abrirse.
+    """
+
+    def __init__(self, failure_threshold=GEMINI_BREAKER_THRESHOLD, reset_timeout=GEMINI_BREAKER_RESET, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if self._clock() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self._probing:
+                self._probing = True  # Solo una llamada de prueba a la vez
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._probing or self.failures >= self.failure_threshold:
+                self.opened_at = self._clock()
+            self._probing = False
+
+
+class GeminiIdeaGenerator:
+    """Llama a los modelos en orden, saltando los que tienen el circuito abierto."""
+
+    # Sus ideas se guardan en el catálogo
+    persist_results = True
+
+    def __init__(self, models=GEMINI_MODELS, timeout=GEMINI_TIMEOUT, api_key=GEMINI_API_KEY):
+        genai.configure(api_key=api_key) # type: ignore
+        self.models = list(models)
+        self.timeout = timeout
+        self.breakers = {name: CircuitBreaker() for name in self.models}
+        self._instances = {}
+
+    def _model(self, name):
+        model = self._instances.get(name)
+        if model is None:
+            model = self._instances[name] = genai.GenerativeModel(name) # type: ignore
+        return model
+
+    def generate(self, ingredientes):
+        prompt = construir_prompt(ingredientes)
+        last_error = None
+        for name in self.models:
+            breaker = self.breakers[name]
+            if not breaker.allow():
+                continue
+            try:
+                response = self._model(name).generate_content(prompt, request_options={'timeout': self.timeout})
+                # Una respuesta que no se puede usar (bloqueada, sin JSON) cuenta como fallo del
+                # modelo: si se repite, el circuito se abre y se pasa directo al siguiente
+                idea = parsear_idea(response.text)
+            except Exception as e:
+                breaker.record_failure()
+                logger.error(f"Error al llamar a Gemini ({name}): {e}")
+                last_error = e
+                continue
+            breaker.record_success()
+            return idea
+        raise IdeaUnavailable("Ningún modelo de Gemini pudo generar la idea.") from last_error
+
+    def stats(self):
+        return {name: {'state': b.state, 'failures': b.failures} for name, b in self.breakers.items()}
+
+
+class StubIdeaGenerator:
+    """Generador local determinista (pruebas / desarrollo sin Gemini)."""
+
+    persist_results = False
+
+    def generate(self, ingredientes):
+        principales = [i.title() for i in ingredientes[:2]]
+        return {
+            'name': f"Pizza {' y '.join(principales)}",
+            'description': f"Masa artesanal con {', '.join(ingredientes)}, horneada al momento."
+        }
+
+    def stats(self):
+        return {}
+
+
+class PizzaIdeaService:
+    def __init__(self, generator, max_concurrency=GEMINI_MAX_CONCURRENCY, timeout=GEMINI_TIMEOUT,
+                 cache_size=PIZZA_IDEA_CACHE_SIZE, cache_ttl=PIZZA_IDEA_CACHE_TTL, catalog=None):
+        self.generator = generator
+        self.catalog = catalog
+        self.timeout = timeout
+        # Máximo de ideas distintas esperando turno: más allá se responde "ocupado"
+        self.max_pending = max_concurrency * 4
+        self.cache = LRUTTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="gemini")
+        self._en_curso = {}  # ingredientes -> concurrent.futures.Future
+        self._lock = threading.Lock()
+        self._metrics = {'generated': 0, 'coalesced': 0, 'failed': 0, 'timeouts': 0, 'rejected': 0}
+
+    def _terminar(self, clave, future):
+        with self._lock:
+            self._en_curso.pop(clave, None)
+        if future.cancelled() or future.exception() is not None:
+            self._metrics['failed'] += 1
+            return
+        self._metrics['generated'] += 1
+        self.cache.set(clave, future.result())
+        if (self.catalog is not None and getattr(self.generator, 'persist_results', False)
+                and self.catalog.admite(clave)):
+            self.catalog.add(clave, future.result())
+
+    def _future_para(self, ingredientes):
+        """Future de la generación en curso para estos ingredientes (la crea si no hay)."""
+        with self._lock:
+            future = self._en_curso.get(ingredientes)
+            if future is not None:
+                self._metrics['coalesced'] += 1
+                return future
+            if len(self._en_curso) >= self.max_pending:
+                self._metrics['rejected'] += 1
+                raise IdeaUnavailable("Demasiadas ideas en generación; intenta de nuevo en unos segundos.")
+            future = self._executor.submit(self.generator.generate, ingredientes)
+            self._en_curso[ingredientes] = future
+        future.add_done_callback(lambda f: self._terminar(ingredientes, f))
+        return future
+
+    async def generar(self, ingredientes):
+        """
+        Idea para una tupla de ingredientes ya normalizada (ver normalizar_ingredientes).
+        Lanza IdeaUnavailable o asyncio.TimeoutError.
+        """
+        if self.catalog is not None:
+            idea = self.catalog.get(ingredientes)
+            if idea is not None:
+                return idea
+        idea = self.cache.get(ingredientes)
+        if idea is not None:
+            return dict(idea)
+        future = self._future_para(ingredientes)
+        try:
+            # shield: si esta petición se rinde, la generación sigue para las demás (y llena la caché)
+            idea = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), self.timeout)
+        except asyncio.TimeoutError:
+            self._metrics['timeouts'] += 1
+            raise
+        return dict(idea)
+
+    def stats(self):
+        stats = dict(self._metrics)
+        stats['in_flight'] = len(self._en_curso)
+        stats['cache'] = self.cache.stats()
+        stats['catalog'] = self.catalog.stats() if self.catalog is not None else None
+        stats['models'] = self.generator.stats()
+        return stats
+
+
+def crear_generador(tipo=PIZZA_IDEA_GENERATOR):
+    if tipo == 'stub':
+        logger.info("Ideas de pizza con el generador local (PIZZA_IDEA_GENERATOR=stub).")
+        return StubIdeaGenerator()
+    return GeminiIdeaGenerator()
+
+
+def _cargar_catalogo(path=PIZZA_IDEA_CATALOG):
+    if not path:
+        return None
+    try:
+        return IdeaCatalog(path, vocabulario=normalizar_ingredientes(ingredientes_del_menu()))
+    except Exception as e:
+        logger.error(f"No se pudo cargar el catálogo de ideas '{path}': {e}", exc_info=True)
+        return None
+
+
+# --- Instancia global ---
+servicio_ideas = PizzaIdeaService(crear_generador(), catalog=_cargar_catalogo())
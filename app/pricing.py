@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+"""
+Motor de precios del lado del servidor.
+
+Los precios del menú se convierten una vez (por versión del menú) a centavos
+enteros en una tabla de búsqueda por id; cotizar un carrito es una sola pasada
+sobre sus líneas con aritmética entera, sin floats. El total que envía el
+cliente ya no se usa para cobrar: solo se compara para detectar diferencias.
+"""
+import logging
+import threading
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+from config import PRICING_STRICT
+from app.menu_store import menu_store
+
+logger = logging.getLogger(__name__)
+
+MAX_QUANTITY = 99
+
+
+class PricingError(ValueError):
+    """El carrito no se puede cotizar (cantidad o precio inválido, producto desconocido en modo estricto)."""
+
+
+def a_centavos(monto):
+    """
+    Convierte un monto en Bs (int/float/str/Decimal) a centavos enteros, redondeando al centavo.
+    Lanza PricingError si no es un número finito.
+    """
+    if isinstance(monto, bool):
+        raise PricingError(f"Monto inválido: {monto!r}")
+    try:
+        valor = Decimal(str(monto).strip())
+    except (InvalidOperation, ValueError):
+        raise PricingError(f"Monto inválido: {monto!r}")
+    if not valor.is_finite():
+        raise PricingError(f"Monto inválido: {monto!r}")
+    return int((valor * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+
+def centavos_a_bs(centavos):
+    """Centavos enteros -> monto en Bs con 2 decimales (para guardar/mostrar)."""
+    return float(Decimal(centavos) / 100)
+
+
+class DescuentoPorcentaje:
+    """
+    Promoción: `porcentaje`% de descuento sobre las líneas de `categoria`
+    cuando el carrito tiene al menos `min_cantidad` unidades de esa categoría.
+    """
+
+    def __init__(self, nombre, categoria, porcentaje, min_cantidad=1):
+        self.nombre = nombre
+        self.categoria = categoria
+        self.porcentaje = Decimal(str(porcentaje))
+        self.min_cantidad = min_cantidad
+
+    def descuento(self, subtotal_categoria, unidades_categoria):
+        if unidades_categoria < self.min_cantidad or subtotal_categoria <= 0:
+            return 0
+        return int((subtotal_categoria * self.porcentaje / 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+
+# Promociones vigentes (los combos de 'promociones' ya son productos con su propio precio).
+REGLAS_PROMOCION = ()
+
+
+def _cantidad(valor, contexto):
+    try:
+        cantidad = int(valor)
+    except (TypeError, ValueError):
+        raise PricingError(f"Cantidad inválida en {contexto}: {valor!r}")
+    if cantidad < 1 or cantidad > MAX_QUANTITY:
+        raise PricingError(f"Cantidad fuera de rango en {contexto}: {cantidad}")
+    return cantidad
+
+
+class PricingEngine:
+    """Cotizador ligado a una versión del menú."""
+
+    def __init__(self, snapshot, reglas=REGLAS_PROMOCION, strict=PRICING_STRICT):
+        self.version = snapshot.version
+        self.strict = strict
+        # id -> (centavos, nombre, emoji, categoría)
+        self._tabla = {
+            product_id: (a_centavos(item['price']), item.get('name'), item.get('emoji'), snapshot.category_of[product_id])
+            for product_id, item in snapshot.by_id.items()
+        }
+        self._reglas_por_categoria = {}
+        for regla in reglas:
+            self._reglas_por_categoria.setdefault(regla.categoria, []).append(regla)
+
+    def _precio(self, product_id, linea, contexto):
+        entrada = self._tabla.get(product_id)
+        if entrada is not None:
+            return entrada, True
+        if self.strict or linea.get('price') is None:
+            raise PricingError(f"Producto desconocido en {contexto}: {product_id!r}")
+        # Productos fuera del menú (ej. pizza personalizada): se usa el precio del cliente y se marca
+        centavos = a_centavos(linea['price'])
+        if centavos <= 0:
+            raise PricingError(f"Precio inválido en {contexto}: {linea['price']!r}")
+        return (centavos, linea.get('name'), linea.get('emoji'), None), False
+
+    def price_cart(self, items):
+        """
+        Cotiza las líneas del carrito en una sola pasada.
+        Cada línea: { 'id', 'quantity', 'adicionales': [id | {'id', 'quantity'}] (opcional) }.
+        Devuelve las líneas normalizadas (precios del menú) y los totales en centavos.
+        """
+        if not isinstance(items, list) or not items:
+            raise PricingError("El pedido no tiene items.")
+
+        lineas = []
+        subtotal = 0
+        no_verificados = []
+        por_categoria = {}  # categoría -> [subtotal, unidades]
+
+        for posicion, linea in enumerate(items):
+            if not isinstance(linea, dict):
+                raise PricingError(f"Item #{posicion + 1} inválido.")
+            product_id = linea.get('id')
+            contexto = f"item #{posicion + 1}"
+            cantidad = _cantidad(linea.get('quantity', 1), contexto)
+            (unitario, nombre, emoji, categoria), verificado = self._precio(product_id, linea, contexto)
+            if not verificado:
+                no_verificados.append(product_id)
+
+            extras = []
+            for extra in linea.get('adicionales') or ():
+                extra_linea = extra if isinstance(extra, dict) else {'id': extra}
+                extra_id = extra_linea.get('id')
+                extra_cantidad = _cantidad(extra_linea.get('quantity', 1), f"adicional de {contexto}")
+                (extra_unitario, extra_nombre, extra_emoji, _), extra_verificado = self._precio(extra_id, extra_linea, f"adicional de {contexto}")
+                if not extra_verificado:
+                    no_verificados.append(extra_id)
+                unitario += extra_unitario * extra_cantidad
+                extras.append({
+                    'id': extra_id,
+                    'name': extra_nombre,
+                    'emoji': extra_emoji,
+                    'quantity': extra_cantidad,
+                    'price_cents': extra_unitario
+                })
+
+            total_linea = unitario * cantidad
+            subtotal += total_linea
+            if categoria in self._reglas_por_categoria:
+                acumulado = por_categoria.setdefault(categoria, [0, 0])
+                acumulado[0] += total_linea
+                acumulado[1] += cantidad
+
+            normalizada = dict(linea)
+            normalizada.update({
+                'name': nombre if nombre is not None else linea.get('name'),
+                'emoji': emoji if emoji is not None else linea.get('emoji'),
+                'quantity': cantidad,
+                'price': centavos_a_bs(unitario),
+                'unit_price_cents': unitario,
+                'line_total_cents': total_linea
+            })
+            if extras:
+                normalizada['adicionales'] = extras
+            lineas.append(normalizada)
+
+        descuentos = []
+        descuento_total = 0
+        for categoria, (subtotal_categoria, unidades) in por_categoria.items():
+            for regla in self._reglas_por_categoria[categoria]:
+                monto = regla.descuento(subtotal_categoria, unidades)
+                if monto:
+                    descuentos.append({'name': regla.nombre, 'amount_cents': monto})
+                    descuento_total += monto
+
+        total = max(0, subtotal - descuento_total)
+        return {
+            'items': lineas,
+            'subtotal_cents': subtotal,
+            'discounts': descuentos,
+            'discount_cents': descuento_total,
+            'total_cents': total,
+            'total': centavos_a_bs(total),
+            'menu_version': self.version,
+            'unverified_items': no_verificados
+        }
+
+
+_motor = None
+_motor_lock = threading.Lock()
+
+def obtener_motor():
+    """Cotizador para la versión vigente del menú (se reconstruye cuando el menú cambia)."""
+    global _motor
+    motor = _motor
+    if motor is None or motor.version != menu_store.version:
+        with _motor_lock:
+            if _motor is None or _motor.version != menu_store.version:
+                _motor = PricingEngine(menu_store.snapshot)
+            motor = _motor
+    return motor
+
+def cotizar_pedido(items):
+    """Cotiza las líneas de un pedido con los precios del menú vigente."""
+    return obtener_motor().price_cart(items)
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+Pub/sub en memoria para empujar cambios de pedidos y conductores a los clientes
+conectados por Server-Sent Events (ver /stream/... en routes.py).
+
+Cada suscripción tiene su propia cola acotada: si un cliente lento se atrasa, se
+descartan sus eventos más viejos en lugar de frenar a quien publica.
+Se publica desde cualquier hilo; `subscribe_async` entrega a una corrutina sin
+ocupar un hilo por suscriptor.
+"""
+import asyncio
+import itertools
+import json
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Tópico con todos los cambios de pedidos (panel de administración).
+TOPICO_PEDIDOS = 'pedidos'
+# Tópico con las ubicaciones de todos los conductores.
+TOPICO_CONDUCTORES = 'conductores'
+
+
+def topico_pedido(order_id):
+    return f"pedido:{order_id}"
+
+
+def topico_conductor(driver_id):
+    return f"conductor:{driver_id}"
+
+
+class Subscription:
+    """Cola de eventos de un suscriptor. Se usa como iterador con timeout."""
+
+    def __init__(self, bus, topics, maxsize):
+        self._bus = bus
+        self.topics = tuple(topics)
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def put(self, event):
+        while True:
+            try:
+                self.queue.put_nowait(event)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout=None):
+        """Devuelve el siguiente evento o None si no llegó nada en `timeout` segundos."""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self._bus.unsubscribe(self)
+
+
+class AsyncSubscription(Subscription):
+    """Suscripción para asyncio: quien publica (desde cualquier hilo) despierta al loop."""
+
+    def __init__(self, bus, topics, maxsize, loop):
+        super().__init__(bus, topics, maxsize)
+        self._loop = loop
+        self._aviso = asyncio.Event()
+
+    def put(self, event):
+        super().put(event)
+        try:
+            self._loop.call_soon_threadsafe(self._aviso.set)
+        except RuntimeError:
+            pass  # Loop cerrado: el suscriptor ya no existe
+
+    async def get_async(self, timeout=None):
+        """Como get(), sin bloquear el loop mientras espera."""
+        self._aviso.clear()
+        try:
+            return self.queue.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            await asyncio.wait_for(self._aviso.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        return self.get(timeout=0)
+
+
+class EventBus:
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subscribers = {}  # tópico -> set(Subscription)
+        self._ids = itertools.count(1)
+        self.published = 0
+
+    def subscribe(self, *topics):
+        return self._registrar(Subscription(self, topics, self.queue_size))
+
+    def subscribe_async(self, *topics):
+        """Suscripción para usar desde el loop de asyncio en curso."""
+        return self._registrar(AsyncSubscription(self, topics, self.queue_size, asyncio.get_running_loop()))
+
+    def _registrar(self, sub):
+        with self._lock:
+            for topic in sub.topics:
+                self._subscribers.setdefault(topic, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            for topic in sub.topics:
+                subs = self._subscribers.get(topic)
+                if subs is not None:
+                    subs.discard(sub)
+                    if not subs:
+                        del self._subscribers[topic]
+
+    def publish(self, topics, event_type, data):
+        """Publica un evento en uno o varios tópicos (sin bloquear)."""
+        if isinstance(topics, str):
+            topics = (topics,)
+        with self._lock:
+            targets = set()
+            for topic in topics:
+                targets.update(self._subscribers.get(topic, ()))
+            event = {'id': next(self._ids), 'type': event_type, 'data': data, 'ts': int(time.time() * 1000)}
+            self.published += 1
+        for sub in targets:
+            sub.put(event)
+
+    def stats(self):
+        with self._lock:
+            subs = set().union(*self._subscribers.values()) if self._subscribers else set()
+            return {
+                'topics': len(self._subscribers),
+                'subscribers': len(subs),
+                'published': self.published,
+                'dropped': sum(s.dropped for s in subs),
+            }
+
+
+def format_sse(event):
+    """Serializa un evento en el formato de Server-Sent Events."""
+    payload = json.dumps(event['data'], ensure_ascii=False, default=str)
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {payload}\n\n"
+
+
+# --- Instancia global ---
+event_bus = EventBus()
@@ -1,20 +1,17 @@
 import logging
 import asyncio
 import json
+import math
 import httpx
-import google.generativeai as genai
-from flask import request, jsonify, render_template_string
-from datetime import datetime
-import pytz
+from flask import request, jsonify
 import threading
 import time
-import math
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update, WebAppInfo
 
 # Importaciones de tu aplicación
 from app import app
-from config import RESTAURANT_CHAT_ID, GEMINI_API_KEY, RESTAURANT_LOCATION, RESTAURANT_MAP_LOCATION, WEBHOOK_PATH, WEBHOOK_SECRET_TOKEN, WEB_APP_URL
-from app.services import guardar_pedido_en_firestore, obtener_pedido_por_id, actualizar_estado_pedido, obtener_todos_los_pedidos, actualizar_ubicacion_conductor, obtener_conductores_activos, asignar_pedido_a_conductor, guardar_calificacion_pedido, asignar_pedido_al_conductor_mas_cercano
+from config import ADMIN_TOKEN, DISPATCH_MODE, MENU_CACHE_MAX_AGE, RESTAURANT_CHAT_ID, RESTAURANT_LOCATION, RESTAURANT_MAP_LOCATION, WEBHOOK_PATH, WEBHOOK_SECRET_TOKEN, WEB_APP_URL
+from app.services import guardar_pedido_en_firestore, obtener_pedido_por_id, actualizar_estado_pedido, obtener_todos_los_pedidos, actualizar_ubicacion_conductor, asignar_pedido_a_conductor, guardar_calificacion_pedido, asignar_pedido_al_conductor_mas_cercano, obtener_estadisticas_cache_pedidos, buffer_escrituras, obtener_pedidos_por_conductor, ConsultaInvalida, MAX_ESTADOS_FILTRO, obtener_pedidos_activos_conductor, obtener_pedidos_paginados, encolar_pedido_para_despacho, despachador, estimar_entrega, servicio_eta, obtener_pedidos_activos, estado_caliente, estadisticas_sincronizacion
 @app.route('/api/create_order', methods=['POST'])
 def create_order():
     """Crea un pedido y lo asigna automáticamente al conductor más cercano al restaurante."""
@@ -33,18 +30,30 @@ def create_order():
     except Exception as e:
         logger.error(f"Error en create_order: {e}")
         return jsonify({"status": "error", "message": str(e)}), 500
-from app.menu_data import products
+from app.menu_store import menu_store
+from app.pricing import cotizar_pedido, a_centavos, PricingError
+from app.timeutils import formatear_fecha_local, normalizar_iso, FORMATO_FECHA_CORTA
+from app.geocoding import geocoder, GeocodingError, GeocodingBusy
+from app.pizza_ideas import servicio_ideas
+from app.distance import distancia_km
+from app.simulation import simulador_en_segundo_plano, planificar, CHAT_ID_PRUEBA
+from app.invoices import total_linea, obtener_factura_preparada, estadisticas_facturas
+from app.async_services import guardar_pedido_en_firestore_async, obtener_conductores_cercanos_async, asignar_pedido_a_conductor_async
+from app.telegram_outbox import TelegramOutbox, PRIORIDAD_ALTA, PRIORIDAD_NORMAL, PRIORIDAD_BAJA
+from app.update_queue import UpdateDispatcher
+from app.http_cache import PreparedResponse, serve_prepared
+from app.pubsub import event_bus, topico_pedido, TOPICO_PEDIDOS
 
 logger = logging.getLogger(__name__)
 
-# --- Configuración de la API de Gemini ---
-genai.configure(api_key=GEMINI_API_KEY) # type: ignore
-
 class TelegramService:
     """Servicio para encapsular la lógica de envío de mensajes de Telegram."""
     def __init__(self):
         self.bot = None
         self.loop = None
+        self.outbox = None
+        self.application = None
+        self.updates = None
 
     def configure(self, bot, loop):
         """Configura el bot y el loop de eventos después de la inicialización."""
@@ -52,28 +61,53 @@ class TelegramService:
         self.loop = loop
         logger.info("El servicio de Telegram ha sido configurado exitosamente.")
 
-    def send_message(self, chat_id, text, parse_mode='HTML', reply_markup=None):
-        """Envía un mensaje de forma segura en el loop de eventos del bot."""
-        if not self.loop or not self.bot:
+    def start(self):
+        """
+        Inicia la cola de salida en el loop del bot. Debe llamarse desde ese loop
+        (run.py) después de asignar `bot` y `loop`.
+        """
+        if not self.outbox:
+            self.outbox = TelegramOutbox(self.bot, self.loop)
+        self.outbox.start()
+        if self.application and not self.updates:
+            self.updates = UpdateDispatcher(self.application, self.loop)
+            self.updates.start()
+
+    def send_message(self, chat_id, text, parse_mode='HTML', reply_markup=None, priority=PRIORIDAD_NORMAL):
+        """
+        Encola un mensaje en la cola de salida del bot (no bloquea).
+        La cola respeta los límites de Telegram y reintenta los errores temporales.
+        """
+        if not self.loop or not self.bot or not self.outbox:
             logger.warning("El bot o el loop de eventos no están disponibles. No se puede enviar el mensaje.")
             return
 
-        coro = self.bot.send_message(
-            chat_id=chat_id,
+        self.outbox.submit(
+            chat_id,
+            priority=priority,
             text=text,
             parse_mode=parse_mode,
             reply_markup=reply_markup
         )
-        asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def stats(self):
+        return self.outbox.stats() if self.outbox else {}
+
+    def update_stats(self):
+        return self.updates.stats() if self.updates else {}
 
 # --- Instancia del Servicio de Telegram ---
 # Se crea una instancia vacía que será configurada en run.py
 telegram_service = TelegramService()
 
 @app.route(WEBHOOK_PATH, methods=['POST'])
-async def telegram_webhook():
+def telegram_webhook():
     """
     Endpoint para recibir actualizaciones de Telegram vía Webhook.
+    Valida, encola y responde de inmediato; los workers del bot procesan la cola.
+    Es síncrono a propósito: solo encola (no consulta Firestore; el procesamiento
+    corre en el loop del bot), y una vista async de Flask correría igual en el hilo
+    WSGI compartido de WsgiToAsgi.
     """
     # Verificar el token secreto (seguridad)
     secret_token = request.headers.get("X-Telegram-Bot-Api-Secret-Token")
@@ -81,29 +115,25 @@ async def telegram_webhook():
         logger.warning("Intento de acceso no autorizado al webhook")
         return jsonify({"status": "error", "message": "Unauthorized"}), 403
 
-    # Procesar la actualización
-    if request.method == "POST":
-        try:
-            # Recuperar la aplicación desde el servicio (inyectada en run.py)
-            if not hasattr(telegram_service, 'application') or not telegram_service.application: # type: ignore
-                logger.error("La aplicación de Telegram no está inicializada en el servicio")
-                return jsonify({"status": "error", "message": "Service unavailable"}), 503
+    try:
+        # La cola se crea en run.py junto con la aplicación de Telegram
+        if not telegram_service.updates:
+            logger.error("La cola de actualizaciones de Telegram no está inicializada en el servicio")
+            return jsonify({"status": "error", "message": "Service unavailable"}), 503
 
-            if not telegram_service.bot:
-                logger.error("El bot no está inicializado en el servicio")
-                return jsonify({"status": "error", "message": "Bot unavailable"}), 503
+        if not telegram_service.bot:
+            logger.error("El bot no está inicializado en el servicio")
+            return jsonify({"status": "error", "message": "Bot unavailable"}), 503
 
-            update = Update.de_json(request.get_json(force=True), telegram_service.bot)
-            
-            # Procesar la actualización en el loop del bot
-            await telegram_service.application.process_update(update) # type: ignore
-            
-            return jsonify({"status": "ok"}), 200
-        except Exception as e:
-            logger.error(f"Error procesando webhook: {e}", exc_info=True)
-            return jsonify({"status": "error", "message": str(e)}), 500
-    
-    return jsonify({"status": "ok"}), 200
+        update = Update.de_json(request.get_json(force=True), telegram_service.bot)
+        if update is None:
+            return jsonify({"status": "error", "message": "Invalid update"}), 400
+
+        telegram_service.updates.submit(update)
+        return jsonify({"status": "ok"}), 200
+    except Exception as e:
+        logger.error(f"Error procesando webhook: {e}", exc_info=True)
+        return jsonify({"status": "error", "message": str(e)}), 500
 
 def generate_telegram_invoice_text(order):
     """Genera el texto de la factura para ser enviado por Telegram."""
@@ -111,7 +141,7 @@ def generate_telegram_invoice_text(order):
     
     items_list = []
     for item in order.get('items', []):
-        item_total = item['price'] * item['quantity']
+        item_total = total_linea(item)
         # Usamos formato de ancho fijo simple con `ljust` para alinear
         name_part = f"{item.get('emoji', '🍕')} {item['name']}"
         price_part = f"x{item['quantity']} ... {currency} {item_total:.2f}"
@@ -124,27 +154,8 @@ def generate_telegram_invoice_text(order):
         location = order['location']
         address_text = f"Lat: {location.get('latitude')}, Lon: {location.get('longitude')}"
 
-    # Formatear fecha con zona horaria de Bolivia
-    date_ts = order.get('date_ts')
-    date_str = order.get('date')
-    
-    try:
-        if isinstance(date_ts, (int, float)):
-             # Si viene timestamp en ms
-            dt_utc = datetime.fromtimestamp(date_ts / 1000, tz=pytz.utc)
-        elif date_str:
-             # Si viene string ISO
-            dt_utc = datetime.fromisoformat(date_str.replace('Z', '+00:00'))
-        else:
-            dt_utc = datetime.now(pytz.utc)
-
-        # Convertir a America/La_Paz
-        bolivia_tz = pytz.timezone('America/La_Paz')
-        dt_local = dt_utc.astimezone(bolivia_tz)
-        date_formatted = dt_local.strftime("%d/%m/%Y %H:%M")
-    except Exception as e:
-        logger.error(f"Error formateando fecha: {e}")
-        date_formatted = "Fecha desconocida"
+    # Fecha en hora de Bolivia
+    date_formatted = formatear_fecha_local(order, FORMATO_FECHA_CORTA)
 
     # Datos del Cliente
     customer_name = order.get('customer_name', 'Cliente')
@@ -175,125 +186,72 @@ def generate_telegram_invoice_text(order):
     return invoice_text
 
 
-# Función auxiliar para generar el HTML de la factura (para reutilizar)
-def generate_invoice_html(order):
-    """Genera una factura simple en HTML"""
-    currency = order.get('currency', 'Bs')
-    
-    # Función para formatear ítems de la factura
-    items_html = ""
-    for item in order.get('items', []):
-        total_item = item['price'] * item['quantity']
-        items_html += f"""
-        <tr>
-            <td style="text-align: left; padding: 8px 0;">{item['name']} ({item.get('emoji', '🍕')})</td>
-            <td style="text-align: center;">{item['quantity']}</td>
-            <td style="text-align: right;">{currency} {item['price']:.2f}</td>
-            <td style="text-align: right;">{currency} {total_item:.2f}</td>
-        </tr>
-        """
-
-    # Formatear fecha con zona horaria de Bolivia
-    date_ts = order.get('date_ts')
-    date_str = order.get('date')
-    
-    try:
-        if isinstance(date_ts, (int, float)):
-             # Si viene timestamp en ms
-            dt_utc = datetime.fromtimestamp(date_ts / 1000, tz=pytz.utc)
-        elif date_str:
-             # Si viene string ISO
-            dt_utc = datetime.fromisoformat(date_str.replace('Z', '+00:00'))
-        else:
-            dt_utc = datetime.now(pytz.utc)
-
-        # Convertir a America/La_Paz
-        bolivia_tz = pytz.timezone('America/La_Paz')
-        dt_local = dt_utc.astimezone(bolivia_tz)
-        invoice_date = dt_local.strftime("%d/%m/%Y %H:%M:%S")
-    except Exception as e:
-        logger.error(f"Error formateando fecha HTML: {e}")
-        invoice_date = "Fecha desconocida"
-
-    # Datos del Cliente
-    customer_name = order.get('customer_name', 'Cliente')
-    customer_nit = order.get('customer_nit', 'S/N')
-    customer_phone = order.get('customer_phone', 'No registrado')
-
-    # Estilo de la factura (se recomienda usar estilos inline para PDFs)
-    html_content = f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>Factura Pizzeria Nova #{order['id']}</title>
-        <style>
-            body {{ font-family: sans-serif; margin: 20px; }}
-            .container {{ max-width: 600px; margin: auto; padding: 20px; border: 1px solid #ddd; box-shadow: 0 0 10px rgba(0,0,0,0.1); }}
-            h1 {{ color: #E94E1B; text-align: center; border-bottom: 2px solid #ddd; padding-bottom: 10px; }}
-            table {{ width: 100%; border-collapse: collapse; margin-top: 20px; }}
-            th, td {{ border-bottom: 1px solid #eee; padding: 8px; }}
-            th {{ background-color: #f5f5f5; text-align: left; }}
-            .summary-table td {{ border: none; font-weight: bold; }}
-            .total-row td {{ border-top: 2px solid #333; font-size: 1.2em; }}
-            .client-info {{ background-color: #f9f9f9; padding: 10px; border-radius: 5px; margin-bottom: 20px; }}
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <h1>🍕 Factura Pizzeria Nova</h1>
-            
-            <div class="client-info">
-                <p><strong>Factura N°:</strong> {order['id']}</p>
-                <p><strong>Fecha/Hora:</strong> {invoice_date}</p>
-                <p><strong>Cliente:</strong> {customer_name}</p>
-                <p><strong>NIT/CI:</strong> {customer_nit}</p>
-                <p><strong>Teléfono:</strong> {customer_phone}</p>
-            </div>
-
-            <p><strong>Dirección de Entrega:</strong> {order.get('address', 'No especificada')}</p>
-            <p><strong>Método de Pago:</strong> {order['paymentMethod']}</p>
-            
-            <table>
-                <thead>
-                    <tr>
-                        <th>Producto</th>
-                        <th style="text-align: center;">Cant.</th>
-                        <th style="text-align: right;">Precio Unit.</th>
-                        <th style="text-align: right;">Total Item</th>
-                    </tr>
-                </thead>
-                <tbody>
-                    {items_html}
-                </tbody>
-            </table>
-
-            <table class="summary-table" style="margin-top: 20px; float: right; width: 50%;">
-                <tr class="total-row">
-                    <td>Total a Pagar:</td>
-                    <td style="text-align: right;">{currency} {order.get('total', 0):.2f}</td>
-                </tr>
-            </table>
-            <div style="clear: both;"></div>
-            
-            <p style="text-align: center; margin-top: 30px; font-size: 0.8em; color: #777;">
-                Gracias por tu pedido. Este documento es un comprobante de venta simplificado.
-            </p>
-        </div>
-    </body>
-    </html>
-    """
-    return html_content
-
 @app.route('/')
 def index():
     return "¡El servidor Backend de Pizzería está funcionando!"
 
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Métricas internas del backend (cachés, colas) para monitoreo.
+    """
+    return jsonify({
+        "order_cache": obtener_estadisticas_cache_pedidos(),
+        "hot_state": estado_caliente.stats(),
+        "firestore_sync": estadisticas_sincronizacion(),
+        "invoice_cache": estadisticas_facturas(),
+        "geocoder": geocoder.stats(),
+        "pizza_ideas": servicio_ideas.stats(),
+        "dispatch": despachador.stats(),
+        "eta": servicio_eta.stats(),
+        "write_buffer": buffer_escrituras.stats(),
+        "event_bus": event_bus.stats(),
+        "telegram_outbox": telegram_service.stats(),
+        "telegram_updates": telegram_service.update_stats()
+    })
+
+# --- Menú pre-serializado ---
+# El JSON del menú (y su versión gzip) se genera una vez por versión del menú;
+# cada petición solo compara el ETag.
+# (versión, respuesta): una sola tupla para que leer ambos valores sea atómico.
+_menu_cache = (None, None)
+
+def reconstruir_menu_cache(snapshot=None):
+    """Serializa el menú vigente y recalcula su ETag y variantes comprimidas."""
+    global _menu_cache
+    snapshot = snapshot or menu_store.snapshot
+    prepared = PreparedResponse(app.json.dumps(snapshot.to_dict()), 'application/json')
+    _menu_cache = (snapshot.version, prepared)
+    logger.info(f"Menú v{snapshot.version} serializado ({len(prepared.body)} bytes, ETag {prepared.etag}).")
+    return prepared
+
+menu_store.on_change(reconstruir_menu_cache)
+
 @app.route('/get_products', methods=['GET'])
 def get_products():
     """
     Endpoint para obtener la lista completa de productos del menú.
+    Responde 304 si el cliente envía If-None-Match con el ETag vigente.
+    """
+    version, prepared = _menu_cache
+    if prepared is None or version != menu_store.version:
+        prepared = reconstruir_menu_cache()
+    return serve_prepared(prepared, f"public, max-age={MENU_CACHE_MAX_AGE}")
+
+@app.route('/admin/menu/reload', methods=['POST'])
+def reload_menu():
     """
-    return jsonify(products)
+    Recarga el menú desde su fuente (MENU_SOURCE) sin reiniciar el servidor.
+    Requiere la cabecera X-Admin-Token con el valor de ADMIN_TOKEN.
+    """
+    if not ADMIN_TOKEN or request.headers.get("X-Admin-Token") != ADMIN_TOKEN:
+        logger.warning("Intento no autorizado de recargar el menú")
+        return jsonify({"status": "error", "message": "Unauthorized"}), 403
+    try:
+        snapshot = menu_store.reload()
+        return jsonify({"status": "success", "version": snapshot.version, "products": len(snapshot)})
+    except Exception as e:
+        return jsonify({"status": "error", "message": f"No se pudo recargar el menú: {e}"}), 500
 
 @app.route('/api/rate_order', methods=['POST'])
 def rate_order():
@@ -338,14 +296,14 @@ def rate_order():
 
                     # 1. Notificar al Restaurante
                     if RESTAURANT_CHAT_ID:
-                        telegram_service.send_message(chat_id=RESTAURANT_CHAT_ID, text=msg_rating)
+                        telegram_service.send_message(chat_id=RESTAURANT_CHAT_ID, text=msg_rating, priority=PRIORIDAD_BAJA)
                         logger.info(f"Calificación notificada al restaurante ({RESTAURANT_CHAT_ID})")
 
                     # 2. Notificar al Conductor (si existe y es un ID válido de Telegram)
                     driver_id = order.get('driver_id')
                     if driver_id:
                         # Asumimos que driver_id es el chat_id del conductor
-                        telegram_service.send_message(chat_id=driver_id, text=msg_rating)
+                        telegram_service.send_message(chat_id=driver_id, text=msg_rating, priority=PRIORIDAD_BAJA)
                         logger.info(f"Calificación notificada al conductor ({driver_id})")
                     else:
                         logger.warning(f"El pedido {order_id} fue calificado pero NO tiene conductor asignado (driver_id). No se notificó al delivery.")
@@ -373,9 +331,8 @@ def get_invoice(order_id):
         if not order:
             return f"Error 404: Pedido #{order_id} no encontrado.", 404
 
-        # 2. Generar y devolver el HTML
-        html_content = generate_invoice_html(order)
-        return render_template_string(html_content)
+        # 2. Devolver el HTML (renderizado una sola vez mientras el pedido no cambie)
+        return serve_prepared(obtener_factura_preparada(order), "no-cache")
 
     except Exception as e:
         logger.error(f"Error al generar factura para {order_id}: {e}", exc_info=True)
@@ -394,8 +351,16 @@ def process_order_status_update(order_id, nuevo_estado, driver_location=None):
             return False
 
         # 2. Actualizar en BD
-        if not actualizar_estado_pedido(order_id, nuevo_estado, driver_location):
+        if not actualizar_estado_pedido(order_id, nuevo_estado, driver_location, driver_id=order.get('driver_id')):
             return False
+
+        # Avisar a quienes siguen el pedido por /stream (cliente y panel), con la ETA recalculada
+        eta = estimar_entrega({**order, 'status': nuevo_estado, 'driver_location': driver_location or order.get('driver_location')})
+        event_bus.publish(
+            [topico_pedido(order_id), TOPICO_PEDIDOS],
+            'status' if order.get('status') != nuevo_estado else 'driver_location',
+            {'order_id': order_id, 'status': nuevo_estado, 'driver_id': order.get('driver_id'), 'driver_location': driver_location, 'eta': eta}
+        )
         
         # 3. Notificar al cliente
         # Solo notificamos si cambia el estado (para no spammear con actualizaciones de ubicación)
@@ -403,7 +368,7 @@ def process_order_status_update(order_id, nuevo_estado, driver_location=None):
             chat_id = order.get('chat_id')
             estado_anterior = order.get('status')
             
-            if chat_id and estado_anterior != nuevo_estado:
+            if chat_id and chat_id != CHAT_ID_PRUEBA and estado_anterior != nuevo_estado:
                 mensajes_estado = {
                     "Confirmado": f"✅ ¡Tu pedido #{order_id} ha sido confirmado por el local!",
                     "En preparación": f"👨‍🍳 ¡Estamos preparando tu pedido #{order_id}!",
@@ -437,109 +402,25 @@ def process_order_status_update(order_id, nuevo_estado, driver_location=None):
         logger.error(f"Error CRÍTICO en process_order_status_update: {e}", exc_info=True)
         return False
 
-def calculate_distance(lat1, lon1, lat2, lon2):
-    """
-    Calcula la distancia en kilómetros entre dos puntos usando la fórmula de Haversine.
-    """
-    R = 6371  # Radio de la Tierra en km
-    dlat = math.radians(lat2 - lat1)
-    dlon = math.radians(lon2 - lon1)
-    a = math.sin(dlat / 2) * math.sin(dlat / 2) + \
-        math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * \
-        math.sin(dlon / 2) * math.sin(dlon / 2)
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    distance = R * c
-    return distance
+# Distancia Haversine en km entre dos puntos (ver app/distance.py)
+calculate_distance = distancia_km
 
 def run_order_simulation(order_id):
     """
     Simula el ciclo de vida de un pedido basándose en la distancia real y tiempos de preparación.
-    Usa un factor de aceleración para que la prueba no dure horas reales.
+    Se agenda en el simulador compartido (app/simulation.py): todos los pedidos simulados
+    avanzan en un mismo loop, sin un hilo dormido por pedido. Devuelve un Future, o None
+    si el pedido no existe.
     """
     logger.info(f"Iniciando simulación REALISTA para el pedido {order_id}")
-    
-    # Configuración de la Simulación
-    RESTAURANT_LAT = -17.7833  # Plaza 24 de Septiembre, Santa Cruz
-    RESTAURANT_LON = -63.1821
-    AVG_SPEED_KMH = 30.0       # Velocidad promedio de la moto
-    PREP_TIME_BASE = 15.0      # Minutos base de preparación
-    TIME_SCALE = 1.0           # 1 segundo simulado = 1 minuto real (Para demos rápidas)
-    
     try:
         order = obtener_pedido_por_id(order_id)
         if not order:
-            return
-
-        # 1. Calcular Tiempos Reales
-        num_items = sum(item['quantity'] for item in order.get('items', []))
-        prep_time_minutes = PREP_TIME_BASE + (2 * max(0, num_items - 1))
-        
-        # Tiempo de viaje: Basado en distancia
-        client_lat = RESTAURANT_LAT # Default si no hay ubicación
-        client_lon = RESTAURANT_LON
-        
-        location = order.get('location')
-        if location and 'latitude' in location and 'longitude' in location:
-            client_lat = float(location['latitude'])
-            client_lon = float(location['longitude'])
-            distance_km = calculate_distance(RESTAURANT_LAT, RESTAURANT_LON, client_lat, client_lon)
-            travel_time_minutes = (distance_km / AVG_SPEED_KMH) * 60
-            travel_time_minutes *= 1.2 # Colchón de tráfico
-        else:
-            distance_km = 5.0
-            travel_time_minutes = 15.0
-            # Simular un punto a 5km
-            client_lat = RESTAURANT_LAT + 0.045
-            client_lon = RESTAURANT_LON + 0.045
-
-        logger.info(f"Simulación {order_id}: Distancia {distance_km:.2f}km. Prep: {prep_time_minutes}m. Viaje: {travel_time_minutes:.2f}m.")
-
-        # 2. Ejecutar Secuencia (Acelerada)
-        
-        # Paso 1: Confirmar
-        # time.sleep(2) 
-        # process_order_status_update(order_id, "Confirmado")
-        
-        # Paso 2: Preparación
-        # wait_prep = prep_time_minutes * TIME_SCALE
-        # logger.info(f"Simulación {order_id}: Cocinando por {wait_prep:.1f}s simulados")
-        # time.sleep(wait_prep)
-        # process_order_status_update(order_id, "En preparación")
-
-        # Paso 2.5: Repartidor Asignado (Simulación de aceptación)
-        # Simulamos que el repartidor tarda un poco en aceptar después de que empieza la preparación
-        # time.sleep(5) 
-        # process_order_status_update(order_id, "Repartidor Asignado")
-        
-        # Paso 3: En Camino (Inicio)
-        # Esperamos a que termine la preparación para salir
-        time.sleep(3)
-        process_order_status_update(order_id, "En camino", driver_location={"latitude": RESTAURANT_LAT, "longitude": RESTAURANT_LON})
-        
-        # Paso 4: Viaje con Interpolación (Movimiento suave)
-        wait_travel = travel_time_minutes * TIME_SCALE
-        logger.info(f"Simulación {order_id}: Viajando por {wait_travel:.1f}s simulados")
-        
-        # Dividimos el viaje en pasos de actualización (ej. cada 3 segundos reales)
-        UPDATE_INTERVAL_REAL = 3.0 
-        steps = int(wait_travel / UPDATE_INTERVAL_REAL)
-        if steps < 1: steps = 1
-        
-        for i in range(1, steps + 1):
-            time.sleep(UPDATE_INTERVAL_REAL)
-            # Interpolación Lineal
-            fraction = i / steps
-            current_lat = RESTAURANT_LAT + (client_lat - RESTAURANT_LAT) * fraction
-            current_lon = RESTAURANT_LON + (client_lon - RESTAURANT_LON) * fraction
-            
-            process_order_status_update(order_id, "En camino", driver_location={"latitude": current_lat, "longitude": current_lon})
-            logger.info(f"Simulación {order_id}: Driver en {current_lat:.5f}, {current_lon:.5f}")
-
-        # Paso 5: Entregado
-        process_order_status_update(order_id, "Entregado", driver_location={"latitude": client_lat, "longitude": client_lon})
-
+            return None
+        return simulador_en_segundo_plano().submit(planificar(order))
     except Exception as e:
         logger.error(f"Error en simulación del pedido {order_id}: {e}", exc_info=True)
+        return None
 
 @app.route('/update_status/<string:order_id>', methods=['POST'])
 def update_order_status(order_id):
@@ -577,7 +458,11 @@ def update_order_status(order_id):
         if not nuevo_estado:
              return jsonify({"status": "error", "message": "Falta el campo 'status'"}), 400
 
-        if process_order_status_update(order_id, nuevo_estado):
+        driver_location = data.get('driver_location')
+        if driver_location is not None and not isinstance(driver_location, dict):
+             return jsonify({"status": "error", "message": "'driver_location' debe ser un objeto"}), 400
+
+        if process_order_status_update(order_id, nuevo_estado, driver_location=driver_location):
              return jsonify({"status": "success"})
         else:
              return jsonify({"status": "error", "message": "No se pudo actualizar el estado"}), 500
@@ -591,10 +476,37 @@ def update_order_status(order_id):
 def get_orders():
     """
     Endpoint para obtener todos los pedidos, diseñado para el panel de administración.
+
+    Sin parámetros devuelve la lista de los 50 más recientes (compatibilidad).
+    Con `scope=active` devuelve todos los pedidos en curso (desde memoria, sin Firestore).
+    Con `since`, `cursor` o `limit` devuelve el feed paginado:
+      { "orders": [...], "next_cursor": "...", "sync_token": 1716197400000 }
+    `cursor` es el `next_cursor` de la página anterior; uno inválido responde 400.
+    El panel guarda `sync_token` y lo envía como `since` para recibir lo que cambió (con un
+    margen hacia atrás, así que puede recibir pedidos repetidos: reemplazarlos por 'id').
     """
     try:
-        pedidos = obtener_todos_los_pedidos()
-        return jsonify(pedidos)
+        if request.args.get('scope') == 'active':
+            return jsonify(obtener_pedidos_activos())
+
+        since = request.args.get('since')
+        cursor = request.args.get('cursor')
+        limit = request.args.get('limit')
+
+        if since is None and cursor is None and limit is None:
+            pedidos = obtener_todos_los_pedidos()
+            return jsonify(pedidos)
+
+        try:
+            since = int(since) if since else None
+            limite = min(max(int(limit or 50), 1), 200)
+        except ValueError:
+            return jsonify({"status": "error", "message": "'since' y 'limit' deben ser números"}), 400
+
+        try:
+            return jsonify(obtener_pedidos_paginados(since=since, cursor=cursor, limite=limite))
+        except ConsultaInvalida as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
     except Exception as e:
         logger.error(f"Error en /get_orders: {e}", exc_info=True)
         return jsonify({"status": "error", "message": "Error interno del servidor al obtener los pedidos."}), 500
@@ -616,14 +528,19 @@ def get_order(order_id):
         # Inyectar la ubicación del restaurante (Fuente de Verdad)
         order['restaurant_location'] = RESTAURANT_LOCATION
         order['restaurant_map_location'] = RESTAURANT_MAP_LOCATION
+        # Hora estimada de entrega (se mueve con cada 'driver_location' del repartidor)
+        order['eta'] = estimar_entrega(order)
         
         return jsonify(order)
     except Exception as e:
         logger.error(f"Error en /get_order/{order_id}: {e}", exc_info=True)
         return jsonify({"status": "error", "message": "Error interno del servidor."}), 500
 
+# Los streams SSE (/stream/order/<id> y /stream/orders) se atienden fuera de Flask:
+# ver app/sse.py y app/asgi.py.
+
 @app.route('/submit_order', methods=['POST'])
-def submit_order():
+async def submit_order():
     """
     Este endpoint recibe el pedido desde la WebApp (Netlify) y lo guarda en Firestore.
     """
@@ -681,22 +598,56 @@ def submit_order():
             order['id'] = generated_id
             logger.warning(f"Pedido recibido sin ID. Se generó uno automático: {generated_id}")
 
+        # Cotizar en el servidor con los precios del menú (no se confía en precios ni total del cliente)
+        try:
+            cotizacion = cotizar_pedido(order.get('items'))
+        except PricingError as e:
+            logger.warning(f"Pedido {order.get('id')} rechazado al cotizar: {e}")
+            return jsonify({"status": "error", "message": str(e)}), 400
+
+        client_total = order.get('total')
+        try:
+            client_total_cents = a_centavos(client_total) if client_total is not None else None
+        except PricingError as e:
+            logger.warning(f"Pedido {order.get('id')} rechazado: total del cliente inválido ({e})")
+            return jsonify({"status": "error", "message": f"Total inválido: {e}"}), 400
+        order['items'] = cotizacion['items']
+        order['total'] = cotizacion['total']
+        order['total_cents'] = cotizacion['total_cents']
+        order['subtotal_cents'] = cotizacion['subtotal_cents']
+        if cotizacion['discounts']:
+            order['discounts'] = cotizacion['discounts']
+        if cotizacion['unverified_items']:
+            order['pricing_unverified'] = cotizacion['unverified_items']
+            logger.warning(f"Pedido {order.get('id')} con productos fuera del menú (precio del cliente): {cotizacion['unverified_items']}")
+        if client_total_cents is not None and client_total_cents != cotizacion['total_cents']:
+            order['client_total'] = client_total
+            logger.warning(f"Pedido {order.get('id')}: total del cliente {client_total} != total calculado {cotizacion['total']}")
+
         logger.info(f"Nuevo pedido recibido del chat_id: {chat_id}")
         logger.info(f"Datos del pedido a guardar: {order}")
 
-        # 1. Guardar en la Base de Datos
-        try:
-            exito_db = guardar_pedido_en_firestore(order)
-            if not exito_db:
-                logger.error("guardar_pedido_en_firestore devolvió False")
-                return jsonify({"status": "error", "message": "Error al guardar en la base de datos (Firebase no conectó)"}), 500
-        except Exception as e_db:
-            logger.error(f"Excepción al llamar guardar_pedido_en_firestore: {e_db}", exc_info=True)
+        # Ubicación del cliente (para la asignación por cercanía)
+        cliente_location = order.get('location')
+        cliente_valida = isinstance(cliente_location, dict) and 'lat' in cliente_location and 'lng' in cliente_location
+
+        # 1. Guardar en la Base de Datos y, en paralelo, buscar el conductor libre más cercano
+        resultado_db, resultado_cercanos = await asyncio.gather(
+            guardar_pedido_en_firestore_async(order),
+            obtener_conductores_cercanos_async(cliente_location['lat'], cliente_location['lng'], k=1) if cliente_valida and DISPATCH_MODE != 'batch' else asyncio.sleep(0, result=[]),
+            return_exceptions=True
+        )
+
+        if isinstance(resultado_db, Exception):
+            logger.error(f"Excepción al llamar guardar_pedido_en_firestore: {resultado_db}", exc_info=resultado_db)
             return jsonify({"status": "error", "message": "Excepción al guardar en BD."}), 500
+        if not resultado_db:
+            logger.error("guardar_pedido_en_firestore devolvió False")
+            return jsonify({"status": "error", "message": "Error al guardar en la base de datos (Firebase no conectó)"}), 500
         
         # 2. Notificar al Cliente con la Factura detallada
         try:
-            if chat_id == "LOCAL_TEST":
+            if chat_id == CHAT_ID_PRUEBA:
                 logger.info(f"Omitiendo notificación Telegram para chat_id de prueba: {chat_id}")
             else:
                 invoice_text = generate_telegram_invoice_text(order)
@@ -711,12 +662,13 @@ def submit_order():
                 telegram_service.send_message(
                     chat_id=chat_id, 
                     text=invoice_text, 
-                    reply_markup=reply_markup
+                    reply_markup=reply_markup,
+                    priority=PRIORIDAD_ALTA
                 )
                 
                 # 3. Notificar al Restaurante (Alerta)
                 # Usamos Bs en lugar de $
-                items_summary = "\n".join([f"  - {item['name']} (x{item['quantity']}) - Bs {item['price'] * item['quantity']:.2f}" for item in order.get('items', [])])
+                items_summary = "\n".join([f"  - {item['name']} (x{item['quantity']}) - Bs {total_linea(item):.2f}" for item in order.get('items', [])])
                 address_text = order.get('address', f"Coords: {order.get('location', 'N/A')}")
                 
                 # Datos del cliente para el restaurante
@@ -734,7 +686,8 @@ def submit_order():
                 # Usamos el servicio para notificar al restaurante
                 telegram_service.send_message(
                     chat_id=RESTAURANT_CHAT_ID, 
-                    text=restaurant_alert
+                    text=restaurant_alert,
+                    priority=PRIORIDAD_ALTA
                 )
         except Exception as e_notify:
             logger.error(f"Error al enviar notificaciones para pedido {order.get('id')}: {e_notify}", exc_info=True)
@@ -742,51 +695,25 @@ def submit_order():
         # 4. Asignación Automática de Conductor (POR CERCANÍA AL CLIENTE)
         try:
             logger.info(f"🔍 Intentando asignar pedido {order.get('id')} automáticamente...")
-            drivers = obtener_conductores_activos()
-            logger.info(f"📊 Conductores disponibles encontrados: {len(drivers)}")
-            
-            if drivers:
-                # Obtener ubicación del cliente desde el pedido
-                cliente_location = order.get('location')
-                logger.info(f"📍 Ubicación del cliente: {cliente_location}")
-                
-                if cliente_location and 'lat' in cliente_location and 'lng' in cliente_location:
-                    cliente_lat = cliente_location['lat']
-                    cliente_lon = cliente_location['lng']
-                    
-                    drivers_with_distance = []
-                    for driver in drivers:
-                        d_loc = driver.get('location')
-                        if d_loc and 'latitude' in d_loc and 'longitude' in d_loc:
-                            # Calcular distancia del conductor AL CLIENTE
-                            dist = calculate_distance(cliente_lat, cliente_lon, d_loc['latitude'], d_loc['longitude'])
-                            driver['distance_km'] = dist
-                            drivers_with_distance.append(driver)
-                            logger.info(f"  - Conductor {driver['id']}: {dist:.2f}km del cliente")
-                        else:
-                            # Si no tiene ubicación válida, lo ponemos al final con distancia infinita
-                            driver['distance_km'] = 999999
-                            drivers_with_distance.append(driver)
-                            logger.warning(f"  - Conductor {driver.get('id')} sin ubicación válida")
-                    
-                    if drivers_with_distance:
-                        # Ordenar conductores por distancia (menor a mayor)
-                        drivers_with_distance.sort(key=lambda x: x['distance_km'])
-                        
-                        # Seleccionar el más cercano
-                        closest_driver = drivers_with_distance[0]
-                        
-                        logger.info(f"📍 Ubicación cliente: {cliente_lat}, {cliente_lon}")
-                        logger.info(f"🚗 Conductores LIBRES ordenados por distancia al cliente: {[(d['id'], f'{d['distance_km']:.2f}km') for d in drivers_with_distance]}")
-                        
-                        asignar_pedido_a_conductor(order.get('id'), closest_driver['id'])
-                        logger.info(f"✅ Pedido asignado al conductor más cercano LIBRE: {closest_driver['id']} a {closest_driver['distance_km']:.2f}km")
-                    else:
-                        logger.warning(f"⚠️ No hay conductores con ubicación válida disponibles.")
+            logger.info(f"📍 Ubicación del cliente: {cliente_location}")
+
+            if isinstance(resultado_cercanos, Exception):
+                raise resultado_cercanos
+
+            if cliente_valida and DISPATCH_MODE == 'batch':
+                # Se asigna junto con los demás pedidos que lleguen en la ventana de despacho
+                encolar_pedido_para_despacho(order.get('id'), cliente_location['lat'], cliente_location['lng'])
+            elif cliente_valida:
+                # Resultado de la consulta k-NN sobre el índice espacial (solo conductores LIBRES)
+                if resultado_cercanos:
+                    closest_driver = resultado_cercanos[0]
+
+                    await asignar_pedido_a_conductor_async(order.get('id'), closest_driver['id'])
+                    logger.info(f"✅ Pedido asignado al conductor más cercano LIBRE: {closest_driver['id']} a {closest_driver['distance_km']:.2f}km")
                 else:
-                    logger.warning(f"⚠️ Pedido sin ubicación del cliente válida. No se puede asignar por cercanía. Location: {cliente_location}")
+                    logger.warning("⚠️ No hay conductores LIBRES disponibles (todos están ocupados con pedidos activos o no tienen ubicación).")
             else:
-                logger.warning("⚠️ No hay conductores LIBRES disponibles (todos están ocupados con pedidos activos o no tienen ubicación).")
+                logger.warning(f"⚠️ Pedido sin ubicación del cliente válida. No se puede asignar por cercanía. Location: {cliente_location}")
 
         except Exception as e_assign:
             logger.error(f"❌ Error en asignación automática: {e_assign}", exc_info=True)
@@ -797,75 +724,17 @@ def submit_order():
         logger.error(f"Error crítico en /submit_order: {e}", exc_info=True)
         return jsonify({"status": "error", "message": "Error interno del servidor."}), 500
 
-@app.route('/generate_pizza_idea', methods=['POST'])
-def generate_pizza_idea():
-    """
-    Endpoint para generar una idea de pizza (nombre y descripción) usando Gemini.
-    Recibe una lista de ingredientes en el cuerpo de la solicitud.
-    """
-    response = None
-    try:
-        # 1. Obtener los ingredientes del request
-        data = request.get_json()
-        if not data or 'ingredients' not in data:
-            return jsonify({"error": "La lista de 'ingredients' es requerida."}), 400
-
-        ingredients = data['ingredients']
-        if not isinstance(ingredients, list) or len(ingredients) == 0:
-            return jsonify({"error": "El campo 'ingredients' debe ser una lista no vacía."}), 400
-
-        ingredients_text = ", ".join(ingredients)
-        logger.info(f"Generando idea de pizza con ingredientes: {ingredients_text}")
-
-        # 2. Crear el prompt para Gemini
-        prompt = (
-            f"Eres un chef de pizzas experto y creativo. "
-            f"Tu tarea es inventar un nombre y una descripción para una nueva pizza basada en una lista de ingredientes. "
-            f"Ingredientes: {ingredients_text}. "
-            f"Por favor, responde únicamente con un objeto JSON válido que contenga dos claves: 'name' (el nombre de la pizza) y 'description' (una descripción corta y apetitosa). "
-            f"No incluyas ninguna otra palabra, explicación o formato markdown como ```json."
-        )
-
-        # 3. Llamar a la API de Gemini
-        # Usamos gemini-2.0-flash por ser más rápido y actual
-        model = genai.GenerativeModel('gemini-2.0-flash') # type: ignore
-        try:
-            response = model.generate_content(prompt)
-        except Exception as e:
-             logger.error(f"Error al llamar a Gemini (2.0-flash): {e}")
-             # Si falla, intentamos con gemini-flash-latest como fallback
-             try:
-                logger.info("Intentando fallback a gemini-flash-latest...")
-                model = genai.GenerativeModel('gemini-flash-latest') # type: ignore
-                response = model.generate_content(prompt)
-             except Exception as e2:
-                raise e # Lanzamos el error original si ambos fallan
-
-        # 4. Procesar la respuesta
-        # Limpiar la respuesta para asegurarse de que es un JSON válido
-        cleaned_response_text = response.text.strip().replace("```json", "").replace("```", "").strip()
-        
-        idea = json.loads(cleaned_response_text)
-
-        if 'name' not in idea or 'description' not in idea:
-                raise ValueError("La respuesta de la IA no contiene 'name' o 'description'.")
-
-        logger.info(f"Idea generada: {idea}")
-        return jsonify(idea)
-
-    except json.JSONDecodeError:
-        error_text = response.text if response else "No response"
-        logger.error(f"Error al decodificar la respuesta de Gemini: {error_text}")
-        return jsonify({"error": "No se pudo procesar la respuesta del servicio de IA. Inténtalo de nuevo."}), 500
-    except Exception as e:
-        logger.error(f"Error en /generate_pizza_idea: {e}", exc_info=True)
-        return jsonify({"error": "Ocurrió un error inesperado al generar la idea."}), 500
+# /generate_pizza_idea se atiende fuera de Flask (puede esperar a Gemini varios
+# segundos y ocuparía el hilo WSGI compartido): ver app/asgi.py.
 
 @app.route('/reverse_geocode', methods=['GET'])
-async def reverse_geocode():
+def reverse_geocode():
     """
     Proxy para realizar geocodificación inversa usando Nominatim (OpenStreetMap).
     Esto evita problemas de CORS en el frontend al realizar la petición desde el servidor.
+    Las respuestas se cachean por coordenadas redondeadas (ver app/geocoding.py).
+    Es síncrono a propósito: no consulta Firestore, y una vista async de Flask correría
+    igual en el hilo WSGI compartido de WsgiToAsgi (ver app/asgi.py).
     """
     try:
         lat = request.args.get('lat')
@@ -881,39 +750,23 @@ async def reverse_geocode():
         except ValueError:
             return jsonify({"error": "Latitud y longitud deben ser números válidos."}), 400
 
-        # URL de Nominatim
-        nominatim_url = "https://nominatim.openstreetmap.org/reverse"
-        
-        # Headers requeridos por Nominatim (User-Agent es obligatorio)
-        headers = {
-            "User-Agent": "PizzeriaNovaBot/1.0 (hebertsb@gmail.com)" 
-        }
-        
-        params = {
-            "format": "json",
-            "lat": lat,
-            "lon": lon,
-            "zoom": 18,
-            "addressdetails": 1
-        }
-
-        async with httpx.AsyncClient() as client:
-            response = await client.get(nominatim_url, params=params, headers=headers, timeout=10.0)
-            
-            if response.status_code != 200:
-                logger.error(f"Error de Nominatim: {response.status_code} - {response.text}")
-                return jsonify({"error": "No se pudo obtener la dirección del servicio externo."}), 502
-            
-            data = response.json()
-            
-            # Extraer el nombre legible
-            display_name = data.get('display_name', 'Dirección desconocida')
-            
-            return jsonify({
-                "display_name": display_name,
-                "raw": data # Opcional: devolver datos crudos si el frontend los necesita
-            })
+        data = geocoder.reverse(lat, lon)
+
+        # Extraer el nombre legible
+        display_name = data.get('display_name', 'Dirección desconocida')
 
+        return jsonify({
+            "display_name": display_name,
+            "raw": data # Opcional: devolver datos crudos si el frontend los necesita
+        })
+
+    except GeocodingError:
+        return jsonify({"error": "No se pudo obtener la dirección del servicio externo."}), 502
+    except GeocodingBusy as e:
+        logger.warning(f"/reverse_geocode: {e}")
+        respuesta = jsonify({"error": "Servicio de mapas ocupado, intenta de nuevo en unos segundos."})
+        respuesta.headers['Retry-After'] = str(max(1, math.ceil(e.retry_after)))
+        return respuesta, 503
     except httpx.RequestError as e:
         logger.error(f"Error de conexión al llamar a Nominatim: {e}", exc_info=True)
         return jsonify({"error": "Error de conexión con el servicio de mapas."}), 503
@@ -926,7 +779,8 @@ async def reverse_geocode():
 @app.route('/driver/location', methods=['POST'])
 def update_driver_location_endpoint():
     """
-    Recibe la ubicación del conductor (Fake GPS) y actualiza en Firestore.
+    Recibe la ubicación del conductor (Fake GPS) y la encola para Firestore.
+    Responde en cuanto la actualización queda encolada (se escribe en lote).
     Payload: { "driver_id": "D1", "latitude": -17.x, "longitude": -63.x }
     """
     try:
@@ -952,31 +806,56 @@ def get_driver_orders(driver_id):
     """
     Obtiene los pedidos asignados a un conductor específico.
     Inyecta la ubicación del restaurante en cada pedido para que la App pueda trazar la ruta.
+
+    Parámetros opcionales (query string):
+      - active=1: solo pedidos en curso (servidos desde memoria, ideal para polling).
+      - status: estados separados por coma (ej. "En camino,Repartidor Asignado").
+      - since / until: rango de fechas ISO sobre 'date'.
+      - limit (máx. 100) y cursor: paginación; el siguiente cursor va en la cabecera X-Next-Cursor.
+        Un cursor desconocido (o de otro conductor) responde 400.
     """
     try:
         # Limpiar ID
         driver_id = driver_id.strip()
 
-        # Por simplicidad, buscamos en todos los pedidos. 
-        # En producción, haríamos una query filtrada en Firestore.
-        all_orders = obtener_todos_los_pedidos()
-        my_orders = []
-        
-        for o in all_orders:
-            # Filtramos pedidos asignados al conductor
-            # NOTA: Incluimos 'Entregado' si quieres que el conductor vea su historial reciente y calificaciones
-            if o.get('driver_id') == driver_id:
-                # Inyectar ubicación del restaurante (Fuente de Verdad)
-                o['restaurant_location'] = RESTAURANT_LOCATION
-                
-                # Asegurarnos de que el rating esté presente si existe
-                if 'rating' in o:
-                    # Estructura esperada por Flutter: { restaurant_rating, delivery_rating, comment }
-                    pass 
+        siguiente_cursor = None
+        if request.args.get('active') in ('1', 'true'):
+            my_orders = obtener_pedidos_activos_conductor(driver_id)
+        else:
+            estados = [e.strip() for e in request.args.get('status', '').split(',') if e.strip()]
+            if len(estados) > MAX_ESTADOS_FILTRO:
+                return jsonify({"status": "error", "message": f"Máximo {MAX_ESTADOS_FILTRO} estados en 'status'"}), 400
+            try:
+                limite = min(max(int(request.args.get('limit', 50)), 1), 100)
+            except ValueError:
+                return jsonify({"status": "error", "message": "'limit' debe ser un número"}), 400
+            try:
+                desde = normalizar_iso(request.args['since']) if request.args.get('since') else None
+                hasta = normalizar_iso(request.args['until']) if request.args.get('until') else None
+            except ValueError:
+                return jsonify({"status": "error", "message": "'since' y 'until' deben ser fechas ISO 8601"}), 400
 
-                my_orders.append(o)
-                
-        return jsonify(my_orders)
+            # NOTA: Incluye 'Entregado' para que el conductor vea su historial reciente y calificaciones
+            try:
+                my_orders, siguiente_cursor = obtener_pedidos_por_conductor(
+                    driver_id,
+                    estados=estados or None,
+                    desde=desde,
+                    hasta=hasta,
+                    limite=limite,
+                    cursor=request.args.get('cursor')
+                )
+            except ConsultaInvalida as e:
+                return jsonify({"status": "error", "message": str(e)}), 400
+
+        for o in my_orders:
+            # Inyectar ubicación del restaurante (Fuente de Verdad)
+            o['restaurant_location'] = RESTAURANT_LOCATION
+
+        response = jsonify(my_orders)
+        if siguiente_cursor:
+            response.headers['X-Next-Cursor'] = siguiente_cursor
+        return response
     except Exception as e:
         logger.error(f"Error en /driver/orders: {e}")
         return jsonify({"status": "error"}), 500
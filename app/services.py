@@ -1,7 +1,20 @@
 import logging
+import threading
+import time
 import firebase_admin
 from firebase_admin import credentials, firestore
-from config import FIREBASE_CREDENTIALS
+from config import FIREBASE_CREDENTIALS, ORDER_CACHE_SIZE, ORDER_CACHE_TTL, WRITE_BUFFER_INTERVAL, ORDER_FEED_SYNC_MARGIN, ETA_HISTORY_SIZE, FIRESTORE_SYNC
+from app.cache import LRUTTLCache
+from app.write_buffer import CoalescingWriteBuffer
+from app.pubsub import event_bus, topico_pedido, topico_conductor, TOPICO_CONDUCTORES, TOPICO_PEDIDOS
+from app.geo_index import DriverSpatialIndex
+from app.hot_store import HotStateStore, ESTADOS_CONDUCTOR_EN_LINEA
+from app.order_registry import ActiveOrderRegistry, ESTADOS_TERMINALES
+from app.dispatch import BatchDispatcher
+from app.distance import distancia_km
+from app.eta import EtaService, clave_estado
+from app.firestore_sync import FirestoreSync
+from app.timeutils import normalizar_fecha_pedido, fecha_pedido_ms, marca_a_ms
 
 # --- Configuración del Logging ---
 logger = logging.getLogger(__name__)
@@ -26,10 +39,39 @@ def _initialize_firebase():
 # Se inicializa una sola vez cuando el módulo es importado.
 db = _initialize_firebase()
 
+# --- Caché de Pedidos ---
+# Se llena al leer y se actualiza en cada escritura que hace este backend.
+cache_pedidos = LRUTTLCache(maxsize=ORDER_CACHE_SIZE, ttl=ORDER_CACHE_TTL, copy_values=True)
+
+# --- Estado Caliente ---
+# Pedidos no terminales y conductores en línea, en memoria (ver app/hot_store.py).
+# Se reconstruye desde Firestore al arrancar; los cambios de estado y de ubicación se
+# escriben por el buffer (los pedidos nuevos, directo en Firestore).
+estado_caliente = HotStateStore()
+
+# --- Escrituras Diferidas ---
+# Ubicaciones de conductores y del repartidor en un pedido: solo se guarda la última
+# por documento y se escriben en lote cada WRITE_BUFFER_INTERVAL segundos.
+buffer_escrituras = CoalescingWriteBuffer(lambda: db, interval=WRITE_BUFFER_INTERVAL)
+
+def vaciar_escrituras_diferidas():
+    """Detiene el buffer de escrituras y vacía lo pendiente (usar al apagar el servidor)."""
+    buffer_escrituras.stop()
+
+def obtener_estadisticas_cache_pedidos():
+    """Aciertos/fallos de la caché de pedidos (cada acierto es una lectura de Firestore ahorrada)."""
+    return cache_pedidos.stats()
+
+def _ahora_ms():
+    """Timestamp actual en milisegundos (se guarda en 'updated_at' en cada escritura)."""
+    return int(time.time() * 1000)
+
 def guardar_pedido_en_firestore(order_data):
     """
     Guarda un nuevo pedido en la colección 'pedidos' de Firestore.
     Verifica si la conexión a la base de datos está disponible.
+    La escritura es directa (no pasa por el buffer): el pedido solo se confirma al
+    cliente y se agrega a memoria si Firestore lo aceptó.
     """
     if not db:
         logger.error("No se puede guardar el pedido: La conexión con Firebase no está disponible o falló en el inicio.")
@@ -42,7 +84,18 @@ def guardar_pedido_en_firestore(order_data):
             logger.warning("El pedido no tiene un 'id' válido.")
             return False
             
+        # Con el estado ya cargado: una carga posterior no debe pisar este pedido
+        _asegurar_estado_caliente()
+        ahora = _ahora_ms()
+        # 'date_ts' y 'date' canónicos: nadie tiene que volver a parsear la fecha del cliente
+        normalizar_fecha_pedido(order_data, ahora_ms=ahora)
+        order_data['updated_at'] = ahora
+        if order_data.get('status'):
+            order_data['status_ts'] = {clave_estado(order_data['status']): ahora}
         db.collection('pedidos').document(order_id).set(order_data)
+        _guardar_en_memoria(order_id, order_data)
+        if order_data.get('driver_id'):
+            registro_pedidos_activos.track(order_id, order_data['driver_id'], order_data.get('status'))
         logger.info(f"Pedido {order_id} guardado exitosamente en Firestore.")
         return True
     except Exception as e:
@@ -52,19 +105,31 @@ def guardar_pedido_en_firestore(order_data):
 
 def obtener_pedido_por_id(order_id):
     """
-    Obtiene un pedido específico de Firestore por su ID.
+    Obtiene un pedido específico por su ID: de memoria si está activo, si no de la
+    caché o de Firestore.
     """
+    _asegurar_estado_caliente()
+    pedido = estado_caliente.get_order(order_id)
+    if pedido is not None:
+        return pedido
+
     if not db:
         logger.error("No se puede obtener el pedido: La conexión con Firebase no está disponible.")
         return None
         
+    cached = cache_pedidos.get(str(order_id))
+    if cached is not None:
+        return cached
+
     try:
         logger.info(f"Buscando pedido con ID: {order_id}")
         doc_ref = db.collection('pedidos').document(str(order_id))
         doc = doc_ref.get()
         if doc.exists:
             logger.info(f"Pedido {order_id} encontrado.")
-            return doc.to_dict()
+            order = doc.to_dict()
+            _guardar_en_memoria(order_id, order)
+            return order
         else:
             logger.warning(f"No se encontró ningún pedido con el ID: {order_id}")
             return None
@@ -72,30 +137,74 @@ def obtener_pedido_por_id(order_id):
         logger.error(f"Error al obtener el pedido {order_id} de Firestore: {e}", exc_info=True)
         return None
 
-def actualizar_estado_pedido(order_id, nuevo_estado, driver_location=None):
+def _guardar_en_memoria(order_id, pedido):
+    """Un pedido activo vive en el estado caliente; uno terminal, en la caché de pedidos."""
+    if estado_caliente.put_order(order_id, pedido):
+        cache_pedidos.invalidate(str(order_id))
+    else:
+        cache_pedidos.set(str(order_id), pedido)
+
+def _escribir_pedido(order_id, actual, cambios, ahora, driver_id=None):
     """
-    Actualiza el estado de un pedido en Firestore.
+    Aplica `cambios` al pedido `actual` en memoria (estado caliente, caché y registro
+    de ocupados) y encola la escritura en Firestore. Si cambia el estado, registra el
+    momento en 'status_ts.<estado>' (de ahí aprende la ETA). Devuelve el pedido resultante.
+    """
+    escritura = dict(cambios)
+    memoria = dict(cambios)
+    nuevo_estado = cambios.get('status')
+    if nuevo_estado and nuevo_estado != actual.get('status'):
+        clave = clave_estado(nuevo_estado)
+        escritura['status_ts'] = {clave: ahora}  # set(merge=True) conserva los demás
+        memoria['status_ts'] = {**(actual.get('status_ts') or {}), clave: ahora}
+    pedido = {**actual, **memoria}
+
+    buffer_escrituras.enqueue('pedidos', order_id, escritura)
+    _guardar_en_memoria(order_id, pedido)
+    if nuevo_estado:
+        registro_pedidos_activos.track(order_id, driver_id or pedido.get('driver_id'), nuevo_estado)
+    return pedido
+
+def actualizar_estado_pedido(order_id, nuevo_estado, driver_location=None, driver_id=None):
+    """
+    Actualiza el estado de un pedido (en memoria al instante, en Firestore por el buffer).
     Opcionalmente actualiza la ubicación del repartidor.
+    `driver_id` (si se conoce) mantiene al día el registro de conductores ocupados.
     """
     if not db:
         logger.error("No se puede actualizar el estado: La conexión con Firebase no está disponible.")
         return False
     
     try:
-        logger.info(f"Actualizando estado del pedido {order_id} a '{nuevo_estado}'")
-        doc_ref = db.collection('pedidos').document(str(order_id))
-        
-        update_data = {'status': nuevo_estado}
+        actual = obtener_pedido_por_id(order_id)
+        if actual is None:
+            logger.warning(f"No se puede actualizar el estado: el pedido {order_id} no existe.")
+            return False
+
+        ahora = _ahora_ms()
+        update_data = {'status': nuevo_estado, 'updated_at': ahora}
         
         # Si hay ubicación del repartidor, la agregamos
         if driver_location:
-            import time
-            update_data['driver_location'] = driver_location
-            update_data['driver_updated_at'] = int(time.time() * 1000) # Timestamp en ms
+            location_data = {
+                'driver_location': driver_location,
+                'driver_updated_at': ahora, # Timestamp en ms
+                'updated_at': ahora
+            }
+            update_data.update(location_data)
+
+            # Si el estado no cambia, es solo un movimiento del repartidor
+            if actual.get('status') == nuevo_estado:
+                buffer_escrituras.enqueue('pedidos', order_id, location_data)
+                estado_caliente.update_order(order_id, location_data)
+                cache_pedidos.update(str(order_id), location_data)
+                return True
             logger.info(f"Actualizando ubicación del driver para {order_id}: {driver_location}")
 
-        # Usamos update para modificar solo los campos necesarios
-        doc_ref.update(update_data)
+        logger.info(f"Actualizando estado del pedido {order_id} a '{nuevo_estado}'")
+        pedido = _escribir_pedido(order_id, actual, update_data, ahora, driver_id=driver_id)
+        if nuevo_estado == 'Entregado':
+            servicio_eta.aprender(pedido)
         
         logger.info(f"Estado del pedido {order_id} actualizado exitosamente.")
         return True
@@ -103,6 +212,11 @@ def actualizar_estado_pedido(order_id, nuevo_estado, driver_location=None):
         logger.error(f"Error al actualizar el estado del pedido {order_id}: {e}", exc_info=True)
         return False
 
+def obtener_pedidos_activos():
+    """Todos los pedidos no terminales, desde memoria, del más reciente al más antiguo."""
+    _asegurar_estado_caliente()
+    return estado_caliente.orders()
+
 def obtener_todos_los_pedidos():
     """
     Obtiene todos los pedidos de la colección 'pedidos' en Firestore,
@@ -136,30 +250,275 @@ def obtener_todos_los_pedidos():
             logger.error(f"Error crítico al obtener todos los pedidos (segundo intento): {e_inner}", exc_info=True)
             return []
 
+def obtener_pedidos_paginados(since=None, cursor=None, limite=50):
+    """
+    Feed paginado de pedidos para el panel de administración.
+
+    - Con `since` (sync token: 'updated_at' en ms): devuelve los pedidos creados o
+      modificados desde entonces, del más antiguo al más nuevo. La consulta empieza
+      ORDER_FEED_SYNC_MARGIN segundos antes de `since`: 'updated_at' se marca al encolar
+      la escritura (que llega a Firestore hasta WRITE_BUFFER_INTERVAL después) y con el
+      reloj de la réplica que escribe. Por eso el feed repite pedidos y el cliente debe
+      reemplazarlos por 'id'.
+    - Sin `since`: recorre el historial completo por 'date' descendente. El sync token
+      es la hora del servidor al pedir la primera página.
+    - `cursor`: el 'next_cursor' de la página anterior (opaco: lleva el sync token del
+      recorrido y el ID del último pedido).
+
+    Devuelve { 'orders', 'next_cursor', 'sync_token' }. Cuando next_cursor es None el
+    cliente está al día y debe guardar sync_token para la siguiente consulta.
+    Lanza ConsultaInvalida si el cursor no es válido o su pedido ya no existe.
+    Los pedidos anteriores a la introducción de 'updated_at' solo aparecen en el historial.
+    """
+    if not db:
+        logger.error("No se pueden obtener los pedidos: La conexión con Firebase no está disponible.")
+        return {'orders': [], 'next_cursor': None, 'sync_token': since}
+
+    coleccion = db.collection('pedidos')
+    cursor_doc = None
+    if cursor:
+        token, _, cursor_id = str(cursor).partition(':')
+        if not token.isdigit() or not cursor_id:
+            raise ConsultaInvalida(f"Cursor inválido: {cursor!r}.")
+        sync_token = int(token)
+        cursor_doc = coleccion.document(cursor_id).get()
+        if not cursor_doc.exists:
+            raise ConsultaInvalida(f"Cursor desconocido: {cursor!r}.")
+    else:
+        sync_token = int(since) if since is not None else _ahora_ms()
+
+    try:
+        if since is not None:
+            desde = int(since) - int(ORDER_FEED_SYNC_MARGIN * 1000)
+            query = coleccion.where('updated_at', '>=', desde).order_by('updated_at')
+        else:
+            query = coleccion.order_by('date', direction=firestore.Query.DESCENDING) # type: ignore
+        if cursor_doc is not None:
+            query = query.start_after(cursor_doc)
+
+        docs = list(query.limit(limite + 1).stream())
+        pagina = docs[:limite]
+        pedidos = [doc.to_dict() for doc in pagina]
+
+        # El token avanza con lo que ya se entregó y viaja en el cursor hasta la última página
+        for pedido in pedidos:
+            actualizado = pedido.get('updated_at')
+            if isinstance(actualizado, (int, float)) and actualizado > sync_token:
+                sync_token = int(actualizado)
+        next_cursor = f"{sync_token}:{pagina[-1].id}" if len(docs) > limite else None
+
+        logger.info(f"Feed de pedidos: {len(pedidos)} pedidos (since={since}, cursor={cursor}).")
+        return {'orders': pedidos, 'next_cursor': next_cursor, 'sync_token': sync_token}
+    except Exception as e:
+        logger.error(f"Error al obtener el feed paginado de pedidos: {e}", exc_info=True)
+        return {'orders': [], 'next_cursor': None, 'sync_token': since}
+
 # --- Gestión de Conductores ---
 
+# Índice espacial de los conductores 'disponible' y registro de pedidos activos por
+# conductor ("conductores ocupados"). Se cargan desde Firestore junto con el estado
+# caliente y luego los mantienen al día las funciones que cambian pedidos y conductores.
+indice_conductores = DriverSpatialIndex()
+registro_pedidos_activos = ActiveOrderRegistry()
+_estado_cargado = False
+_estado_lock = threading.Lock()
+
+def cargar_estado_caliente():
+    """
+    Reconstruye desde Firestore el estado en memoria: pedidos no terminales (estado
+    caliente y registro de ocupados) y conductores en línea (estado caliente e índice).
+    Devuelve True si pudo leer ambas colecciones.
+    """
+    if not db:
+        return False
+    try:
+        inicio = time.perf_counter()
+        pedidos = {doc.id: doc.to_dict() for doc in db.collection('pedidos').where('status', 'not-in', list(ESTADOS_TERMINALES)).stream()}
+        conductores = {
+            doc.id: doc.to_dict()
+            for doc in db.collection('drivers').where('status', 'in', list(ESTADOS_CONDUCTOR_EN_LINEA)).stream()
+        }
+    except Exception as e:
+        logger.error(f"Error al cargar el estado caliente desde Firestore: {e}", exc_info=True)
+        return False
+
+    estado_caliente.load(pedidos, conductores)
+    registro_pedidos_activos.clear()
+    for order_id, pedido in pedidos.items():
+        if pedido.get('driver_id'):
+            registro_pedidos_activos.track(order_id, pedido['driver_id'], pedido.get('status'))
+    indice_conductores.clear()
+    for conductor in estado_caliente.drivers(status='disponible'):
+        loc = conductor['location']
+        indice_conductores.upsert(conductor['id'], loc['latitude'], loc['longitude'])
+
+    logger.info(
+        f"Estado caliente cargado en {(time.perf_counter() - inicio) * 1000:.0f} ms: {len(pedidos)} pedidos activos, "
+        f"{len(conductores)} conductores en línea ({len(indice_conductores)} disponibles, "
+        f"{len(registro_pedidos_activos.busy_drivers())} ocupados)."
+    )
+    return True
+
+def _asegurar_estado_caliente():
+    """Carga el estado en memoria la primera vez que se necesita (si no se precargó al arrancar)."""
+    global _estado_cargado
+    if _estado_cargado or not db:
+        return
+    with _estado_lock:
+        if not _estado_cargado:
+            _estado_cargado = cargar_estado_caliente()
+
+def precargar_estado_caliente():
+    """
+    Carga el estado en memoria en segundo plano (al arrancar el servidor) y, con
+    FIRESTORE_SYNC, abre después los listeners de sincronización.
+    """
+    def _precargar():
+        _asegurar_estado_caliente()
+        if FIRESTORE_SYNC:
+            iniciar_sincronizacion()
+
+    threading.Thread(target=_precargar, name="hot-state-loader", daemon=True).start()
+
+# --- Sincronización entre réplicas ---
+# Cambios hechos por otras instancias (o el eco de los propios), recibidos por
+# on_snapshot (ver app/firestore_sync.py).
+
+def _aplicar_pedido_remoto(order_id, pedido):
+    """Alta o cambio de un pedido activo. False si es más viejo que lo que hay en memoria."""
+    local_ts = estado_caliente.order_updated_at(order_id)
+    if local_ts is not None and (pedido.get('updated_at') or 0) < local_ts:
+        return False
+    anterior = estado_caliente.get_order(order_id) or {}
+    _guardar_en_memoria(order_id, pedido)
+    registro_pedidos_activos.track(order_id, pedido.get('driver_id'), pedido.get('status'))
+
+    # Los clientes conectados a esta instancia por /stream también deben enterarse
+    if anterior.get('status') != pedido.get('status'):
+        evento = 'status'
+    elif anterior.get('driver_location') != pedido.get('driver_location'):
+        evento = 'driver_location'
+    else:
+        return True  # Eco de una escritura propia
+    _publicar_pedido_remoto(order_id, evento, pedido)
+    return True
+
+def _publicar_pedido_remoto(order_id, evento, pedido):
+    event_bus.publish(
+        [topico_pedido(order_id), TOPICO_PEDIDOS], evento,
+        {'order_id': order_id, 'status': pedido.get('status'), 'driver_id': pedido.get('driver_id'),
+         'driver_location': pedido.get('driver_location')}
+    )
+
+def _quitar_pedido_remoto(order_id):
+    """
+    El pedido dejó de estar activo (entregado, cancelado o borrado) en Firestore.
+    El cambio REMOVED trae el documento como estaba dentro de la consulta (todavía
+    activo), así que se lee el documento final: queda en la caché, se avisa el estado
+    terminal por /stream y, si se entregó, la ETA aprende de él. Si el pedido ya no
+    estaba en memoria, es el eco de un cambio de esta instancia (ya avisado).
+    """
+    registro_pedidos_activos.release(order_id)
+    if not estado_caliente.remove_order(order_id):
+        return
+    cache_pedidos.invalidate(str(order_id))
+    doc = db.collection('pedidos').document(str(order_id)).get() if db else None
+    if doc is None or not doc.exists:
+        return
+    pedido = doc.to_dict()
+    _guardar_en_memoria(order_id, pedido)
+    _publicar_pedido_remoto(order_id, 'status', pedido)
+    if pedido.get('status') == 'Entregado':
+        servicio_eta.aprender(pedido)
+
+def _aplicar_conductor_remoto(driver_id, conductor):
+    """Posición o estado de un conductor en línea. False si es más viejo que lo local."""
+    local_ts = estado_caliente.driver_updated_at(driver_id)
+    if local_ts is not None and (marca_a_ms(conductor.get('last_update')) or 0) < local_ts:
+        return False
+    anterior = estado_caliente.get_driver(driver_id)
+    if not estado_caliente.put_driver_doc(driver_id, conductor):
+        _quitar_conductor_remoto(driver_id)
+        return True
+    nuevo = estado_caliente.get_driver(driver_id)
+    lat, lon = nuevo['location']['latitude'], nuevo['location']['longitude']
+    if nuevo['status'] == 'disponible':
+        indice_conductores.upsert(driver_id, lat, lon)
+    else:
+        indice_conductores.remove(driver_id)
+    if anterior is None or anterior['location'] != nuevo['location'] or anterior['status'] != nuevo['status']:
+        _publicar_ubicacion_conductor(driver_id, lat, lon, nuevo['status'])
+    return True
+
+def _quitar_conductor_remoto(driver_id):
+    """El conductor se desconectó (o se borró) en Firestore."""
+    estado_caliente.remove_driver(driver_id)
+    indice_conductores.remove(driver_id)
+
+sincronizador = None
+
+def iniciar_sincronizacion(client=None):
+    """
+    Abre los listeners de 'pedidos' activos y 'drivers' en línea. `client` permite
+    usar otro cliente (ej. el emulador de Firestore o un fake en pruebas).
+    Devuelve el FirestoreSync, o None si no hay conexión.
+    """
+    global sincronizador
+    client = client or db
+    if not client:
+        logger.error("No se puede iniciar la sincronización: La conexión con Firebase no está disponible.")
+        return None
+    if sincronizador is None:
+        sincronizador = (
+            FirestoreSync(client)
+            .watch('pedidos', client.collection('pedidos').where('status', 'not-in', list(ESTADOS_TERMINALES)),
+                   _aplicar_pedido_remoto, _quitar_pedido_remoto)
+            .watch('drivers', client.collection('drivers').where('status', 'in', list(ESTADOS_CONDUCTOR_EN_LINEA)),
+                   _aplicar_conductor_remoto, _quitar_conductor_remoto)
+        )
+    sincronizador.start()
+    return sincronizador
+
+def estadisticas_sincronizacion():
+    return sincronizador.stats() if sincronizador is not None else None
+
 def actualizar_ubicacion_conductor(driver_id, lat, lon, status="disponible"):
     """
     Actualiza la ubicación y estado de un conductor en la colección 'drivers'.
+    La escritura se encola en el buffer diferido; el estado caliente y el índice
+    espacial se actualizan al instante.
     """
     if not db:
         return False
     
     try:
-        doc_ref = db.collection('drivers').document(str(driver_id))
+        _asegurar_estado_caliente()
         data = {
             'id': driver_id,
             'location': {'latitude': lat, 'longitude': lon},
             'status': status,
             'last_update': firestore.SERVER_TIMESTAMP # type: ignore
         }
-        doc_ref.set(data, merge=True)
-        logger.info(f"Ubicación del conductor {driver_id} actualizada: {lat}, {lon}")
+        buffer_escrituras.enqueue('drivers', driver_id, data)
+        estado_caliente.put_driver(driver_id, lat, lon, status, updated_ms=_ahora_ms())
+        if status == 'disponible':
+            indice_conductores.upsert(driver_id, lat, lon)
+        else:
+            indice_conductores.remove(driver_id)
+        _publicar_ubicacion_conductor(driver_id, lat, lon, status)
+        logger.debug(f"Ubicación del conductor {driver_id} encolada: {lat}, {lon}")
         return True
     except Exception as e:
         logger.error(f"Error al actualizar conductor {driver_id}: {e}", exc_info=True)
         return False
 
+def _publicar_ubicacion_conductor(driver_id, lat, lon, status):
+    """Empuja la nueva posición a los suscriptores del conductor y de sus pedidos activos."""
+    evento = {'driver_id': driver_id, 'location': {'latitude': lat, 'longitude': lon}, 'status': status}
+    topicos = [topico_conductor(driver_id), TOPICO_CONDUCTORES]
+    topicos.extend(topico_pedido(order_id) for order_id in registro_pedidos_activos.active_orders(driver_id))
+    event_bus.publish(topicos, 'driver_location', evento)
+
 def obtener_conductores_activos():
     """
     Obtiene lista de conductores que han actualizado su ubicación recientemente
@@ -169,20 +528,10 @@ def obtener_conductores_activos():
         return []
         
     try:
-        # Obtener todos los conductores disponibles
-        drivers_ref = db.collection('drivers').where('status', '==', 'disponible').stream()
-        drivers = [doc.to_dict() for doc in drivers_ref]
-        
-        # Filtrar solo los que NO tienen pedidos activos
-        conductores_libres = []
-        for driver in drivers:
-            driver_id = driver.get('id')
-            if not tiene_pedidos_activos(driver_id):
-                conductores_libres.append(driver)
-            else:
-                logger.info(f"Conductor {driver_id} tiene pedidos activos, saltando...")
-        
-        return conductores_libres
+        _asegurar_estado_caliente()
+        # Desde memoria: los ocupados se descartan con el registro de pedidos activos
+        ocupados = registro_pedidos_activos.busy_drivers()
+        return [driver for driver in estado_caliente.drivers(status='disponible') if driver['id'] not in ocupados]
     except Exception as e:
         logger.error(f"Error al obtener conductores activos: {e}", exc_info=True)
         return []
@@ -191,67 +540,151 @@ def tiene_pedidos_activos(driver_id):
     """
     Verifica si un conductor tiene pedidos en proceso (no entregados ni cancelados).
     """
+    _asegurar_estado_caliente()
+    return registro_pedidos_activos.is_busy(driver_id)
+
+# Firestore admite como máximo 10 valores en un filtro 'in'.
+MAX_ESTADOS_FILTRO = 10
+
+class ConsultaInvalida(ValueError):
+    """Parámetros de consulta que el cliente debe corregir (cursor desconocido, demasiados estados...)."""
+
+def obtener_pedidos_por_conductor(driver_id, estados=None, desde=None, hasta=None, limite=50, cursor=None):
+    """
+    Consulta en Firestore los pedidos de un conductor, del más reciente al más antiguo.
+
+    - estados: lista opcional de estados a incluir (máx. MAX_ESTADOS_FILTRO).
+    - desde / hasta: límites opcionales (inclusive) sobre el campo 'date' (ISO canónico, ver timeutils).
+    - limite: tamaño de página.
+    - cursor: ID del último pedido de la página anterior.
+
+    Devuelve (pedidos, siguiente_cursor); siguiente_cursor es None en la última página.
+    Lanza ConsultaInvalida si hay demasiados estados o el cursor no es un pedido del conductor.
+    Requiere índices compuestos (driver_id + date, y driver_id + status + date si se
+    filtra por estado). Si faltan, se consulta solo por igualdad (driver_id y status,
+    que Firestore resuelve sin índice compuesto) y el rango de fechas y el orden se
+    aplican aquí.
+    """
     if not db:
-        return False
-    
+        logger.error("No se pueden obtener los pedidos del conductor: La conexión con Firebase no está disponible.")
+        return [], None
+
+    estados = list(estados or [])
+    if len(estados) > MAX_ESTADOS_FILTRO:
+        raise ConsultaInvalida(f"Máximo {MAX_ESTADOS_FILTRO} estados por consulta.")
+
+    cursor_doc = None
+    if cursor:
+        cursor_doc = db.collection('pedidos').document(str(cursor)).get()
+        if not cursor_doc.exists or (cursor_doc.to_dict() or {}).get('driver_id') != driver_id:
+            raise ConsultaInvalida(f"Cursor desconocido: {cursor!r}.")
+
+    igualdad = db.collection('pedidos').where('driver_id', '==', driver_id)
+    if estados:
+        igualdad = igualdad.where('status', 'in', estados)
+
     try:
-        # Buscar pedidos del conductor que NO estén entregados ni cancelados
-        pedidos_ref = db.collection('pedidos').where('driver_id', '==', driver_id).stream()
-        
-        for pedido_doc in pedidos_ref:
-            pedido = pedido_doc.to_dict()
-            estado = pedido.get('status', pedido.get('estado', ''))
-            
-            # Si tiene algún pedido que no está entregado ni cancelado, está ocupado
-            if estado not in ['Entregado', 'Cancelado']:
-                logger.info(f"Conductor {driver_id} tiene pedido activo: {pedido_doc.id} en estado '{estado}'")
-                return True
-        
-        return False
+        query = igualdad
+        if desde:
+            query = query.where('date', '>=', desde)
+        if hasta:
+            query = query.where('date', '<=', hasta)
+        query = query.order_by('date', direction=firestore.Query.DESCENDING) # type: ignore
+        if cursor_doc is not None:
+            query = query.start_after(cursor_doc)
+        docs = list(query.limit(limite + 1).stream())
+        pedidos = [doc.to_dict() for doc in docs[:limite]]
+        siguiente = docs[limite - 1].id if len(docs) > limite else None
+        return pedidos, siguiente
     except Exception as e:
-        logger.error(f"Error al verificar pedidos activos del conductor {driver_id}: {e}", exc_info=True)
-        return False
+        logger.warning(f"Consulta ordenada de pedidos del conductor {driver_id} falló ({e}). Filtrando y ordenando en memoria.")
+
+    try:
+        docs = [(doc.id, doc.to_dict()) for doc in igualdad.stream()]
+        docs = [
+            (doc_id, p) for doc_id, p in docs
+            if (not desde or (p.get('date') or '') >= desde) and (not hasta or (p.get('date') or '') <= hasta)
+        ]
+        # Orden (fecha, id) descendente; el cursor se ubica por su clave, como start_after
+        clave = lambda doc_id, p: (fecha_pedido_ms(p) or 0, doc_id)
+        docs.sort(key=lambda item: clave(*item), reverse=True)
+        if cursor_doc is not None:
+            tope = clave(cursor_doc.id, cursor_doc.to_dict())
+            docs = [item for item in docs if clave(*item) < tope]
+        pagina = docs[:limite]
+        siguiente = pagina[-1][0] if len(docs) > limite else None
+        return [p for _, p in pagina], siguiente
+    except Exception as e:
+        logger.error(f"Error al obtener los pedidos del conductor {driver_id}: {e}", exc_info=True)
+        return [], None
+
+def obtener_pedidos_activos_conductor(driver_id):
+    """
+    Pedidos activos (no entregados ni cancelados) del conductor, usando el registro
+    y el estado caliente en memoria: no consulta Firestore.
+    """
+    _asegurar_estado_caliente()
+    pedidos = []
+    for order_id in registro_pedidos_activos.active_orders(driver_id):
+        pedido = obtener_pedido_por_id(order_id)
+        if pedido:
+            pedidos.append(pedido)
+    pedidos.sort(key=lambda p: fecha_pedido_ms(p) or 0, reverse=True)
+    return pedidos
 
-def calcular_distancia_km(lat1, lon1, lat2, lon2):
-    """Calcula la distancia en kilómetros entre dos puntos usando la fórmula de Haversine."""
-    from math import radians, sin, cos, sqrt, atan2
-    R = 6371.0  # Radio de la Tierra en km
-    dlat = radians(lat2 - lat1)
-    dlon = radians(lon2 - lon1)
-    a = sin(dlat / 2) ** 2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon / 2) ** 2
-    c = 2 * atan2(sqrt(a), sqrt(1 - a))
-    return R * c
+# Distancia Haversine en km entre dos puntos (ver app/distance.py)
+calcular_distancia_km = distancia_km
+
+def obtener_conductores_cercanos(lat, lon, k=1):
+    """
+    Devuelve hasta `k` conductores libres (disponibles y sin pedidos activos)
+    ordenados por distancia al punto dado, usando el índice espacial.
+    Cada conductor es un dict { 'id', 'location', 'distance_km' }.
+    """
+    _asegurar_estado_caliente()
+    cercanos = indice_conductores.nearest(lat, lon, k=k, accept=lambda d: not registro_pedidos_activos.is_busy(d))
+    libres = []
+    for driver_id, dist in cercanos:
+        d_lat, d_lon = indice_conductores.position(driver_id) or (None, None)
+        libres.append({
+            'id': driver_id,
+            'location': {'latitude': d_lat, 'longitude': d_lon},
+            'distance_km': dist
+        })
+    return libres
+
+def _registrar_asignacion(order_id, driver_id):
+    """Marca el pedido como 'Repartidor Asignado' a `driver_id`. False si el pedido no existe."""
+    actual = obtener_pedido_por_id(order_id)
+    if actual is None:
+        logger.warning(f"No se puede asignar el pedido {order_id}: no existe.")
+        return False
+    ahora = _ahora_ms()
+    asignacion = {
+        'driver_id': driver_id,
+        'status': 'Repartidor Asignado',
+        'updated_at': ahora
+    }
+    _escribir_pedido(order_id, actual, asignacion, ahora, driver_id=driver_id)
+    return True
 
 def asignar_pedido_al_conductor_mas_cercano(order_id, restaurant_location):
     """Busca el conductor más cercano al restaurante y asigna el pedido."""
     if not db:
         return False
     try:
-        conductores = obtener_conductores_activos()
-        if not conductores:
-            logger.warning("No hay conductores disponibles para asignar el pedido.")
-            return False
         lat_rest = restaurant_location['latitude']
         lon_rest = restaurant_location['longitude']
-        min_dist = None
-        conductor_cercano = None
-        for conductor in conductores:
-            loc = conductor.get('location')
-            if loc:
-                dist = calcular_distancia_km(lat_rest, lon_rest, loc['latitude'], loc['longitude'])
-                if min_dist is None or dist < min_dist:
-                    min_dist = dist
-                    conductor_cercano = conductor
-        if not conductor_cercano:
-            logger.warning("No se encontró conductor con ubicación válida.")
+        cercanos = obtener_conductores_cercanos(lat_rest, lon_rest, k=1)
+        if not cercanos:
+            logger.warning("No hay conductores disponibles con ubicación válida para asignar el pedido.")
             return False
+        conductor_cercano = cercanos[0]
+        min_dist = conductor_cercano['distance_km']
         driver_id = conductor_cercano['id']
         # Asignar el pedido
-        order_ref = db.collection('pedidos').document(str(order_id))
-        order_ref.update({
-            'driver_id': driver_id,
-            'status': 'Repartidor Asignado'
-        })
+        if not _registrar_asignacion(order_id, driver_id):
+            return False
         logger.info(f"Pedido {order_id} asignado automáticamente al conductor más cercano: {driver_id} (distancia: {min_dist:.2f} km)")
         return True
     except Exception as e:
@@ -267,11 +700,8 @@ def asignar_pedido_a_conductor(order_id, driver_id):
         
     try:
         # 1. Actualizar el Pedido
-        order_ref = db.collection('pedidos').document(str(order_id))
-        order_ref.update({
-            'driver_id': driver_id,
-            'status': 'Repartidor Asignado'
-        })
+        if not _registrar_asignacion(order_id, driver_id):
+            return False
         
         # 2. Actualizar el Conductor (Opcional: Marcarlo como ocupado)
         # driver_ref = db.collection('drivers').document(str(driver_id))
@@ -283,6 +713,59 @@ def asignar_pedido_a_conductor(order_id, driver_id):
         logger.error(f"Error al asignar pedido {order_id} a conductor {driver_id}: {e}", exc_info=True)
         return False
 
+# --- Despacho por Lotes ---
+# Los pedidos nuevos se juntan unos segundos y se asignan en conjunto (ver app/dispatch.py).
+
+def _candidatos_despacho(lat, lon, k):
+    return [
+        (c['id'], c['location']['latitude'], c['location']['longitude'])
+        for c in obtener_conductores_cercanos(lat, lon, k=k)
+    ]
+
+def _pedido_ya_resuelto(order_id):
+    """True si el pedido ya tiene conductor o terminó (ej. cancelado) mientras esperaba el lote."""
+    if registro_pedidos_activos.driver_of(order_id) is not None:
+        return True
+    if order_id in estado_caliente:
+        return False
+    pedido = cache_pedidos.peek(str(order_id))
+    return bool(pedido) and pedido.get('status') in ESTADOS_TERMINALES
+
+despachador = BatchDispatcher(_candidatos_despacho, asignar_pedido_a_conductor, ya_asignado=_pedido_ya_resuelto)
+
+def encolar_pedido_para_despacho(order_id, lat, lon):
+    """Agrega el pedido (con la ubicación del cliente) al próximo lote de asignación."""
+    despachador.enqueue(order_id, lat, lon)
+    logger.info(f"Pedido {order_id} en espera de asignación por lote.")
+
+def _pedidos_entregados_recientes(limite=ETA_HISTORY_SIZE):
+    """
+    Los últimos pedidos entregados (por 'updated_at'), para que la ETA aprenda tiempos reales.
+    Requiere el índice compuesto status + updated_at; si falta, se toman `limite` pedidos
+    entregados sin orden (pueden no ser los más recientes).
+    """
+    if not db:
+        return []
+    entregados = db.collection('pedidos').where('status', '==', 'Entregado')
+    try:
+        query = entregados.order_by('updated_at', direction=firestore.Query.DESCENDING) # type: ignore
+        return [doc.to_dict() for doc in query.limit(limite).stream()]
+    except Exception as e:
+        logger.warning(f"Consulta ordenada de pedidos entregados falló ({e}). El historial de la ETA se toma sin orden.")
+    return [doc.to_dict() for doc in entregados.limit(limite).stream()]
+
+# --- ETA ---
+# Aprende del historial la primera vez que se estima y luego de cada pedido entregado.
+servicio_eta = EtaService(cargar_historial=_pedidos_entregados_recientes)
+
+def estimar_entrega(pedido):
+    """ETA de un pedido (ver app/eta.py) o None si no aplica."""
+    try:
+        return servicio_eta.estimar(pedido)
+    except Exception as e:
+        logger.error(f"Error al estimar la entrega del pedido {pedido.get('id')}: {e}", exc_info=True)
+        return None
+
 def guardar_calificacion_pedido(order_id, rating_data):
     """
     Guarda la calificación del cliente para un pedido.
@@ -294,8 +777,8 @@ def guardar_calificacion_pedido(order_id, rating_data):
     try:
         order_ref = db.collection('pedidos').document(str(order_id))
         
-        # Verificar si el pedido existe
-        if not order_ref.get().exists:
+        # Verificar si el pedido existe (si está en caché no hace falta leer Firestore)
+        if cache_pedidos.peek(str(order_id)) is None and not order_ref.get().exists:
             logger.warning(f"Intento de calificar pedido inexistente: {order_id}")
             return False
 
@@ -305,10 +788,13 @@ def guardar_calificacion_pedido(order_id, rating_data):
                 'delivery_rating': rating_data.get('delivery_rating'),
                 'comment': rating_data.get('comment', ''),
                 'timestamp': firestore.SERVER_TIMESTAMP # type: ignore
-            }
+            },
+            'updated_at': _ahora_ms()
         }
         
         order_ref.update(update_data)
+        # El timestamp lo resuelve el servidor de Firestore: se invalida para releerlo completo
+        cache_pedidos.invalidate(str(order_id))
         logger.info(f"Calificación guardada para el pedido {order_id}")
         return True
     except Exception as e:
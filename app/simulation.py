@@ -0,0 +1,343 @@
+# -*- coding: utf-8 -*-
+"""
+Simulador del ciclo de vida de pedidos y conductores.
+
+Todos los pedidos simulados avanzan en un solo loop de asyncio: cada pedido es
+una corrutina que duerme hasta su próximo paso, así que simular 500 pedidos a la
+vez no necesita 500 hilos. Cada paso pasa por el camino normal de actualización
+(`process_order_status_update` dentro del proceso, o los endpoints HTTP si se
+apunta a un servidor con --base-url), lo que lo convierte en un generador de carga
+realista para todo el backend.
+
+TIME_SCALE = segundos reales por minuto simulado (1.0: un viaje de 15 min dura 15 s).
+
+Uso:
+    python -m app.simulation --orders 500 --time-scale 0.1 --base-url http://localhost:5000
+    python -m app.simulation --orders 20 --full          # dentro del proceso (usa Firestore directamente)
+"""
+import argparse
+import asyncio
+import inspect
+import logging
+import math
+import random
+import threading
+import time
+
+from config import RESTAURANT_LOCATION, SIMULATION_TIME_SCALE
+from app.distance import distancia_km, coordenadas
+from app.eta import cantidad_items, minutos_preparacion_base, ritmo_base
+
+logger = logging.getLogger(__name__)
+
+UPDATE_INTERVAL = 3.0      # Segundos reales entre actualizaciones de ubicación durante el viaje
+START_DELAY = 3.0          # Segundos reales antes de salir del restaurante
+
+# chat_id de pruebas: /submit_order y las notificaciones de estado no escriben a Telegram
+CHAT_ID_PRUEBA = "LOCAL_TEST"
+
+
+class PlanSimulacion:
+    """Datos de un pedido simulado: ruta y tiempos (en minutos simulados)."""
+
+    __slots__ = ('order_id', 'driver_id', 'origen', 'destino', 'distance_km', 'prep_minutes', 'travel_minutes')
+
+    def __init__(self, order_id, origen, destino, distance_km, prep_minutes, travel_minutes, driver_id=None):
+        self.order_id = order_id
+        self.driver_id = driver_id
+        self.origen = origen
+        self.destino = destino
+        self.distance_km = distance_km
+        self.prep_minutes = prep_minutes
+        self.travel_minutes = travel_minutes
+
+
+def planificar(order, restaurante=RESTAURANT_LOCATION):
+    """
+    Tiempos realistas a partir del pedido: preparación según cantidad de items y
+    viaje según la distancia real al cliente (si no tiene ubicación, un punto a ~5 km).
+    """
+    origen = (restaurante['latitude'], restaurante['longitude'])
+    prep_minutes = minutos_preparacion_base(cantidad_items(order))
+
+    destino = coordenadas(order.get('location'))
+    if destino is not None:
+        distance_km = distancia_km(origen[0], origen[1], destino[0], destino[1])
+        travel_minutes = distance_km * ritmo_base()
+    else:
+        distance_km = 5.0
+        travel_minutes = 15.0
+        destino = (origen[0] + 0.045, origen[1] + 0.045)
+
+    return PlanSimulacion(
+        order_id=order['id'], origen=origen, destino=destino, distance_km=distance_km,
+        prep_minutes=prep_minutes, travel_minutes=travel_minutes, driver_id=order.get('driver_id')
+    )
+
+
+class DestinoEnProceso:
+    """Aplica los pasos con las funciones del propio backend (en hilos, no bloquean el loop)."""
+
+    def __init__(self, actualizar_estado=None, mover_conductor=None, crear_pedido=None):
+        if actualizar_estado is None:
+            from app.routes import process_order_status_update as actualizar_estado
+        if mover_conductor is None:
+            from app.services import actualizar_ubicacion_conductor as mover_conductor
+        if crear_pedido is None:
+            from app.services import guardar_pedido_en_firestore as crear_pedido
+        self._actualizar_estado = actualizar_estado
+        self._mover_conductor = mover_conductor
+        self._crear_pedido = crear_pedido
+
+    @staticmethod
+    async def _llamar(func, *args, **kwargs):
+        resultado = func(*args, **kwargs) if inspect.iscoroutinefunction(func) else \
+            await asyncio.to_thread(func, *args, **kwargs)
+        if inspect.isawaitable(resultado):
+            resultado = await resultado
+        return resultado
+
+    async def crear_pedido(self, order):
+        return await self._llamar(self._crear_pedido, order)
+
+    async def actualizar_estado(self, order_id, estado, driver_location=None):
+        return await self._llamar(self._actualizar_estado, order_id, estado, driver_location=driver_location)
+
+    async def mover_conductor(self, driver_id, lat, lon):
+        return await self._llamar(self._mover_conductor, driver_id, lat, lon)
+
+    async def cerrar(self):
+        pass
+
+
+class DestinoHTTP:
+    """Aplica los pasos contra un servidor en marcha (mismo camino que las apps reales)."""
+
+    def __init__(self, base_url, timeout=30.0):
+        import httpx
+        self._client = httpx.AsyncClient(base_url=base_url.rstrip('/'), timeout=timeout)
+
+    async def crear_pedido(self, order):
+        response = await self._client.post('/submit_order', json={'chat_id': CHAT_ID_PRUEBA, 'order': order})
+        return response.status_code == 200
+
+    async def actualizar_estado(self, order_id, estado, driver_location=None):
+        payload = {'status': estado}
+        if driver_location is not None:
+            payload['driver_location'] = driver_location
+        response = await self._client.post(f'/update_status/{order_id}', json=payload)
+        return response.status_code == 200
+
+    async def mover_conductor(self, driver_id, lat, lon):
+        response = await self._client.post('/driver/location', json={'driver_id': driver_id, 'latitude': lat, 'longitude': lon})
+        return response.status_code == 200
+
+    async def cerrar(self):
+        await self._client.aclose()
+
+
+class OrderLifecycleSimulator:
+    """
+    Avanza pedidos simulados en el loop actual. `max_in_flight` limita cuántos pasos
+    se están aplicando a la vez (llamadas al backend), no cuántos pedidos hay en curso.
+    """
+
+    def __init__(self, destino, time_scale=SIMULATION_TIME_SCALE, update_interval=UPDATE_INTERVAL,
+                 start_delay=START_DELAY, full_lifecycle=False, max_in_flight=64):
+        self.destino = destino
+        self.time_scale = time_scale
+        self.update_interval = update_interval
+        self.start_delay = start_delay
+        self.full_lifecycle = full_lifecycle
+        self.max_in_flight = max_in_flight
+        self._semaforo = None
+        self._metrics = {
+            'orders_started': 0,
+            'orders_completed': 0,
+            'orders_failed': 0,
+            'updates_sent': 0,
+            'updates_failed': 0,
+            'update_ms_avg': 0.0,
+            'update_ms_max': 0.0,
+            'timer_lag_ms_max': 0.0,
+        }
+
+    async def _esperar(self, segundos):
+        objetivo = time.monotonic() + segundos
+        await asyncio.sleep(segundos)
+        lag_ms = (time.monotonic() - objetivo) * 1000
+        if lag_ms > self._metrics['timer_lag_ms_max']:
+            self._metrics['timer_lag_ms_max'] = lag_ms
+
+    async def _paso(self, coro_func, *args, **kwargs):
+        if self._semaforo is None:
+            self._semaforo = asyncio.Semaphore(self.max_in_flight)
+        async with self._semaforo:
+            inicio = time.monotonic()
+            try:
+                ok = await coro_func(*args, **kwargs)
+            except Exception as e:
+                logger.error(f"Simulación: paso {coro_func.__name__}{args[:2]} falló: {e}")
+                ok = False
+            duracion_ms = (time.monotonic() - inicio) * 1000
+        m = self._metrics
+        m['updates_sent'] += 1
+        if ok is False:
+            m['updates_failed'] += 1
+        m['update_ms_avg'] += (duracion_ms - m['update_ms_avg']) / m['updates_sent']
+        m['update_ms_max'] = max(m['update_ms_max'], duracion_ms)
+        return ok
+
+    async def _mover(self, plan, estado, lat, lon):
+        ubicacion = {"latitude": lat, "longitude": lon}
+        await self._paso(self.destino.actualizar_estado, plan.order_id, estado, driver_location=ubicacion)
+        if plan.driver_id:
+            await self._paso(self.destino.mover_conductor, plan.driver_id, lat, lon)
+
+    async def simular(self, plan):
+        """Recorre el ciclo de vida de un pedido ya guardado."""
+        self._metrics['orders_started'] += 1
+        order_id = plan.order_id
+        origen_lat, origen_lon = plan.origen
+        destino_lat, destino_lon = plan.destino
+        logger.info(f"Simulación {order_id}: Distancia {plan.distance_km:.2f}km. Prep: {plan.prep_minutes}m. Viaje: {plan.travel_minutes:.2f}m.")
+        try:
+            if self.full_lifecycle:
+                await self._paso(self.destino.actualizar_estado, order_id, "Confirmado")
+                await self._paso(self.destino.actualizar_estado, order_id, "En preparación")
+                await self._esperar(plan.prep_minutes * self.time_scale)
+                if plan.driver_id:
+                    await self._paso(self.destino.actualizar_estado, order_id, "Repartidor Asignado")
+
+            # Salida del restaurante
+            await self._esperar(self.start_delay)
+            await self._mover(plan, "En camino", origen_lat, origen_lon)
+
+            # Viaje con interpolación lineal, una actualización cada update_interval segundos
+            wait_travel = plan.travel_minutes * self.time_scale
+            steps = max(1, int(wait_travel / self.update_interval))
+            intervalo = wait_travel / steps
+            for i in range(1, steps + 1):
+                await self._esperar(intervalo)
+                fraction = i / steps
+                await self._mover(
+                    plan, "En camino",
+                    origen_lat + (destino_lat - origen_lat) * fraction,
+                    origen_lon + (destino_lon - origen_lon) * fraction
+                )
+
+            await self._paso(self.destino.actualizar_estado, order_id, "Entregado",
+                             driver_location={"latitude": destino_lat, "longitude": destino_lon})
+            self._metrics['orders_completed'] += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._metrics['orders_failed'] += 1
+            logger.error(f"Error en simulación del pedido {order_id}: {e}", exc_info=True)
+
+    async def run(self, plans):
+        await asyncio.gather(*(self.simular(plan) for plan in plans))
+        return self.stats()
+
+    def stats(self):
+        return {k: round(v, 2) if isinstance(v, float) else v for k, v in self._metrics.items()}
+
+
+class SimulationRunner:
+    """Loop de simulación en un hilo propio, para agendar pedidos desde código síncrono (Flask)."""
+
+    def __init__(self, simulator):
+        self.simulator = simulator
+        self._loop = None
+        self._lock = threading.Lock()
+
+    def _asegurar_loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="order-simulator", daemon=True).start()
+        return self._loop
+
+    def submit(self, plan):
+        """Agenda la simulación de un pedido; devuelve un concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(self.simulator.simular(plan), self._asegurar_loop())
+
+    def stats(self):
+        return self.simulator.stats()
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+def simulador_en_segundo_plano():
+    """Simulador compartido del servidor (usa process_order_status_update)."""
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            _runner = SimulationRunner(OrderLifecycleSimulator(DestinoEnProceso()))
+    return _runner
+
+
+# --- CLI: generador de carga ---
+
+def pedido_sintetico(indice, prefijo, rng, radio_km=6.0, restaurante=RESTAURANT_LOCATION):
+    """Pedido de prueba con una pizza del menú y un destino aleatorio dentro de `radio_km`."""
+    from app.menu_data import products
+    pizza = rng.choice(products['pizzas'])
+    distancia = radio_km * math.sqrt(rng.random())
+    angulo = rng.uniform(0, 2 * math.pi)
+    lat = restaurante['latitude'] + (distancia / 110.54) * math.sin(angulo)
+    lon = restaurante['longitude'] + (distancia / (111.32 * math.cos(math.radians(restaurante['latitude'])))) * math.cos(angulo)
+    return {
+        'id': f"{prefijo}-{indice:05d}",
+        'items': [{'id': pizza['id'], 'name': pizza['name'], 'price': pizza['price'],
+                   'emoji': pizza.get('emoji'), 'quantity': rng.randint(1, 3)}],
+        'location': {'lat': lat, 'lng': lon},
+        'address': "Simulación",
+        'paymentMethod': "Efectivo",
+        'status': "Pendiente",
+        'chat_id': CHAT_ID_PRUEBA
+    }
+
+
+async def _main_async(args):
+    rng = random.Random(args.seed)
+    prefijo = f"SIM-{int(time.time())}"
+    destino = DestinoHTTP(args.base_url) if args.base_url else DestinoEnProceso()
+    simulador = OrderLifecycleSimulator(destino, time_scale=args.time_scale, full_lifecycle=args.full,
+                                        update_interval=args.update_interval, max_in_flight=args.max_in_flight)
+    try:
+        pedidos = [pedido_sintetico(i, prefijo, rng) for i in range(args.orders)]
+        if args.drivers:
+            for i, pedido in enumerate(pedidos):
+                pedido['driver_id'] = f"SIM-D{i % args.drivers + 1}"
+        creados = await asyncio.gather(*(simulador._paso(destino.crear_pedido, p) for p in pedidos))
+        plans = [planificar(pedido) for pedido, ok in zip(pedidos, creados) if ok is not False]
+        logger.info(f"Simulando {len(plans)} pedidos ({len(pedidos) - len(plans)} no se pudieron crear).")
+        inicio = time.monotonic()
+        stats = await simulador.run(plans)
+        stats['elapsed_s'] = round(time.monotonic() - inicio, 2)
+        return stats
+    finally:
+        await destino.cerrar()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulador de pedidos / generador de carga.")
+    parser.add_argument('--orders', type=int, default=50, help="Pedidos simulados en paralelo")
+    parser.add_argument('--drivers', type=int, default=0, help="Conductores simulados (también envían su ubicación)")
+    parser.add_argument('--time-scale', type=float, default=SIMULATION_TIME_SCALE, help="Segundos reales por minuto simulado")
+    parser.add_argument('--update-interval', type=float, default=UPDATE_INTERVAL, help="Segundos reales entre ubicaciones")
+    parser.add_argument('--max-in-flight', type=int, default=64, help="Pasos aplicándose a la vez")
+    parser.add_argument('--full', action='store_true', help="Incluir Confirmado / En preparación / Repartidor Asignado")
+    parser.add_argument('--base-url', help="Servidor al que enviar los pasos por HTTP (si no, dentro del proceso)")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args(argv)
+
+    stats = asyncio.run(_main_async(args))
+    for clave, valor in stats.items():
+        print(f"{clave}: {valor}")
+
+
+if __name__ == '__main__':
+    main()
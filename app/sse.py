@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Streams Server-Sent Events (/stream/...) atendidos directamente por ASGI.
+
+Flask corre detrás de WsgiToAsgi, que ejecuta todas las peticiones WSGI en un
+único hilo compartido: un stream que espera eventos ahí deja en cola a todas las
+demás peticiones. Por eso los streams no pasan por Flask: app/asgi.py los atiende
+en el loop de uvicorn (cada conexión es una corrutina que espera su cola de
+eventos). La desconexión del cliente se detecta con el mensaje `http.disconnect`,
+sin esperar a que falle una escritura.
+"""
+import asyncio
+import json
+import logging
+
+from config import RESTAURANT_LOCATION, RESTAURANT_MAP_LOCATION
+from app.async_services import obtener_pedido_por_id_async
+from app.pubsub import event_bus, format_sse, topico_pedido, TOPICO_PEDIDOS, TOPICO_CONDUCTORES
+
+logger = logging.getLogger(__name__)
+
+# Cada cuántos segundos se envía un comentario SSE para mantener viva la conexión.
+SSE_KEEPALIVE_SECONDS = 15
+
+_CABECERAS_SSE = [
+    (b'content-type', b'text/event-stream; charset=utf-8'),
+    (b'cache-control', b'no-cache'),
+    (b'x-accel-buffering', b'no'),  # Evita que proxies (nginx) acumulen el stream
+    (b'access-control-allow-origin', b'*'),
+]
+
+
+async def _enviar(send, texto):
+    await send({'type': 'http.response.body', 'body': texto.encode('utf-8'), 'more_body': True})
+
+
+async def responder_json(send, status, data):
+    body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+    await send({'type': 'http.response.start', 'status': status, 'headers': [
+        (b'content-type', b'application/json'),
+        (b'content-length', str(len(body)).encode()),
+        (b'access-control-allow-origin', b'*'),
+    ]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _esperar_desconexion(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def transmitir(send, receive, subscription, initial_events=()):
+    """Envía los eventos de la suscripción hasta que el cliente se desconecta."""
+    async def producir():
+        await send({'type': 'http.response.start', 'status': 200, 'headers': _CABECERAS_SSE})
+        await _enviar(send, "retry: 3000\n\n")
+        for event in initial_events:
+            await _enviar(send, format_sse(event))
+        while True:
+            event = await subscription.get_async(timeout=SSE_KEEPALIVE_SECONDS)
+            await _enviar(send, ": keep-alive\n\n" if event is None else format_sse(event))
+
+    tareas = [asyncio.ensure_future(producir()), asyncio.ensure_future(_esperar_desconexion(receive))]
+    try:
+        hechas, _ = await asyncio.wait(tareas, return_when=asyncio.FIRST_COMPLETED)
+        for tarea in hechas:
+            if not tarea.cancelled() and tarea.exception() is not None:
+                logger.debug(f"Stream SSE cerrado por error: {tarea.exception()}")
+    finally:
+        for tarea in tareas:
+            tarea.cancel()
+        subscription.close()
+
+
+async def stream_order(order_id, receive, send):
+    """
+    Stream SSE con los cambios de estado y la ubicación del repartidor de un pedido.
+    Reemplaza el polling a /get_order/<id>: el primer evento ('snapshot') es el pedido actual.
+    """
+    order_id = order_id.strip()
+    # Suscribirse antes de leer para no perder cambios entre la lectura y el stream
+    subscription = event_bus.subscribe_async(topico_pedido(order_id))
+    try:
+        order = await obtener_pedido_por_id_async(order_id)
+    except Exception:
+        subscription.close()
+        raise
+    if not order:
+        subscription.close()
+        await responder_json(send, 404, {"status": "error", "message": "Pedido no encontrado"})
+        return
+
+    order['restaurant_location'] = RESTAURANT_LOCATION
+    order['restaurant_map_location'] = RESTAURANT_MAP_LOCATION
+    await transmitir(send, receive, subscription, [{'id': 0, 'type': 'snapshot', 'data': order}])
+
+
+async def stream_orders(receive, send):
+    """
+    Stream SSE para el panel de administración: cambios de todos los pedidos
+    y ubicaciones de todos los conductores.
+    """
+    await transmitir(send, receive, event_bus.subscribe_async(TOPICO_PEDIDOS, TOPICO_CONDUCTORES))
+
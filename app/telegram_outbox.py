@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+Cola de salida de mensajes de Telegram.
+
+Corre en el loop de asyncio del bot. Los mensajes se encolan desde cualquier hilo
+(las rutas de Flask) y se envían respetando los límites de Telegram: un cubo de
+tokens global (~30 msg/s) y uno por chat (~1 msg/s). Si Telegram responde 429
+se pausa solo ese chat durante `retry_after` y se reintenta (los demás chats siguen
+saliendo); los errores de red se reintentan con espera exponencial. Las facturas
+salen antes que los avisos de menor prioridad.
+"""
+import asyncio
+import itertools
+import logging
+import time
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TimedOut
+
+logger = logging.getLogger(__name__)
+
+# Prioridades (menor número = sale antes)
+PRIORIDAD_ALTA = 0     # Facturas y alertas de pedidos nuevos
+PRIORIDAD_NORMAL = 5   # Cambios de estado al cliente
+PRIORIDAD_BAJA = 9     # Avisos informativos (calificaciones al restaurante y al conductor)
+
+# Límites publicados por Telegram para bots
+GLOBAL_RATE_PER_SECOND = 30.0
+CHAT_RATE_PER_SECOND = 1.0
+
+MAX_RETRIES = 5
+# Buckets por chat sin uso durante este tiempo se descartan
+CHAT_BUCKET_IDLE_SECONDS = 300
+
+
+class TokenBucket:
+    """Cubo de tokens: permite ráfagas de `capacity` y un ritmo sostenido de `rate`/s."""
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._clock = clock
+        self.tokens = self.capacity
+        self.updated_at = clock()
+        self.paused_until = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def delay(self):
+        """Segundos que faltan para tener un token (0 si hay uno disponible)."""
+        now = self._clock()
+        self._refill(now)
+        wait = max(0.0, self.paused_until - now)
+        if self.tokens < 1:
+            wait = max(wait, (1 - self.tokens) / self.rate)
+        return wait
+
+    def consume(self):
+        self._refill(self._clock())
+        self.tokens -= 1
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, self._clock() + seconds)
+
+    def idle_for(self):
+        return self._clock() - self.updated_at
+
+
+def _seconds(value):
+    """retry_after puede venir como int o como timedelta según la versión de PTB."""
+    return value.total_seconds() if hasattr(value, 'total_seconds') else float(value)
+
+
+class TelegramOutbox:
+    def __init__(self, bot, loop, workers=4, global_rate=GLOBAL_RATE_PER_SECOND,
+                 chat_rate=CHAT_RATE_PER_SECOND, max_retries=MAX_RETRIES):
+        self.bot = bot
+        self.loop = loop
+        self.workers = workers
+        self.max_retries = max_retries
+        self._chat_rate = chat_rate
+        self._global_bucket = TokenBucket(global_rate)
+        self._chat_buckets = {}
+        self._queue = None
+        self._tasks = []
+        self._seq = itertools.count()
+        self._metrics = {
+            'enqueued': 0,
+            'sent': 0,
+            'failed': 0,
+            'retried': 0,
+            'rate_limited': 0,
+            'latency_ms_avg': 0.0,
+            'latency_ms_max': 0.0,
+        }
+
+    # --- Ciclo de vida (se llama desde el loop del bot) ---
+
+    def start(self):
+        if self._tasks:
+            return
+        self._queue = asyncio.PriorityQueue()
+        self._tasks = [self.loop.create_task(self._worker(i)) for i in range(self.workers)]
+        logger.info(f"Cola de salida de Telegram iniciada con {self.workers} workers.")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    # --- API (segura desde cualquier hilo) ---
+
+    def submit(self, chat_id, priority=PRIORIDAD_NORMAL, **kwargs):
+        """Encola un send_message. No bloquea ni espera el envío."""
+        item = (priority, next(self._seq), time.monotonic(), 0, chat_id, kwargs)
+        self.loop.call_soon_threadsafe(self._put, item)
+
+    def _put(self, item):
+        self._metrics['enqueued'] += 1
+        self._queue.put_nowait(item)
+
+    def _requeue_later(self, delay, item):
+        self.loop.call_later(delay, self._queue.put_nowait, item)
+
+    # --- Envío ---
+
+    def _chat_bucket(self, chat_id):
+        chat_id = str(chat_id)
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) > 1000:
+                for key in [k for k, b in self._chat_buckets.items() if b.idle_for() > CHAT_BUCKET_IDLE_SECONDS]:
+                    del self._chat_buckets[key]
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self._chat_rate)
+        return bucket
+
+    async def _worker(self, worker_id):
+        while True:
+            item = await self._queue.get()
+            try:
+                await self._process(item)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._metrics['failed'] += 1
+                logger.error(f"Error inesperado en la cola de Telegram (worker {worker_id}): {e}", exc_info=True)
+            finally:
+                self._queue.task_done()
+
+    async def _process(self, item):
+        priority, seq, enqueued_at, attempt, chat_id, kwargs = item
+
+        # Si el chat no tiene token, se reprograma sin bloquear al worker
+        chat_bucket = self._chat_bucket(chat_id)
+        chat_wait = chat_bucket.delay()
+        if chat_wait > 0:
+            self._requeue_later(chat_wait, item)
+            return
+
+        global_wait = self._global_bucket.delay()
+        while global_wait > 0:
+            await asyncio.sleep(global_wait)
+            global_wait = self._global_bucket.delay()
+
+        chat_bucket.consume()
+        self._global_bucket.consume()
+
+        try:
+            await self.bot.send_message(chat_id=chat_id, **kwargs)
+        except RetryAfter as e:
+            wait = _seconds(e.retry_after)
+            self._metrics['rate_limited'] += 1
+            logger.warning(f"Telegram pidió esperar {wait}s (429) para el chat {chat_id}.")
+            chat_bucket.pause(wait)
+            self._retry(item, wait)
+            return
+        except (BadRequest, Forbidden) as e:
+            # Errores definitivos (chat inexistente, bot bloqueado, HTML inválido): no se reintentan
+            self._metrics['failed'] += 1
+            logger.error(f"Telegram rechazó el mensaje para {chat_id}: {e}")
+            return
+        except (TimedOut, NetworkError) as e:
+            backoff = min(60.0, 2 ** attempt)
+            logger.warning(f"Error de red enviando a {chat_id} (intento {attempt + 1}): {e}. Reintentando en {backoff}s")
+            self._retry(item, backoff)
+            return
+        except Exception as e:
+            self._metrics['failed'] += 1
+            logger.error(f"Error al enviar mensaje de Telegram a {chat_id}: {e}", exc_info=True)
+            return
+
+        latency_ms = (time.monotonic() - enqueued_at) * 1000
+        self._metrics['sent'] += 1
+        sent = self._metrics['sent']
+        self._metrics['latency_ms_avg'] += (latency_ms - self._metrics['latency_ms_avg']) / sent
+        self._metrics['latency_ms_max'] = max(self._metrics['latency_ms_max'], latency_ms)
+
+    def _retry(self, item, delay):
+        priority, seq, enqueued_at, attempt, chat_id, kwargs = item
+        if attempt + 1 > self.max_retries:
+            self._metrics['failed'] += 1
+            logger.error(f"Mensaje para {chat_id} descartado tras {attempt + 1} intentos.")
+            return
+        self._metrics['retried'] += 1
+        self._requeue_later(delay, (priority, seq, enqueued_at, attempt + 1, chat_id, kwargs))
+
+    def stats(self):
+        metrics = dict(self._metrics)
+        metrics['latency_ms_avg'] = round(metrics['latency_ms_avg'], 2)
+        metrics['latency_ms_max'] = round(metrics['latency_ms_max'], 2)
+        metrics['queue_depth'] = self._queue.qsize() if self._queue else 0
+        return metrics
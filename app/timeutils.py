@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+Fechas de los pedidos.
+
+Cada pedido guarda su fecha de dos formas: 'date_ts' (ms desde epoch, UTC) y
+'date' (ISO 8601 UTC con milisegundos y 'Z', como `Date.toISOString()` del
+cliente, para que el orden alfabético coincida con el cronológico).
+`normalizar_fecha_pedido` las completa al guardar; después, ordenar, filtrar y
+mostrar no vuelven a parsear texto. Las conversiones que sí se repiten (facturas de un
+mismo pedido, strings ISO de pedidos antiguos) se memorizan.
+"""
+import time
+from datetime import datetime, timezone
+from functools import lru_cache
+
+import pytz
+
+# Resuelta una sola vez (pytz.timezone es costoso de llamar en cada factura).
+ZONA_BOLIVIA = pytz.timezone('America/La_Paz')
+
+FORMATO_FECHA_HORA = "%d/%m/%Y %H:%M:%S"
+FORMATO_FECHA_CORTA = "%d/%m/%Y %H:%M"
+
+
+@lru_cache(maxsize=4096)
+def iso_a_ms(date_str):
+    """
+    String ISO 8601 -> ms desde epoch. Acepta 'Z' y fechas sin zona (se asumen UTC).
+    Lanza ValueError si el texto no es una fecha.
+    """
+    dt = datetime.fromisoformat(date_str.strip().replace('Z', '+00:00'))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp() * 1000)
+
+
+def ms_a_iso(ms):
+    """ms desde epoch -> ISO 8601 UTC canónico ('2024-05-01T18:30:00.000Z')."""
+    dt = datetime.fromtimestamp(ms / 1000, tz=timezone.utc)
+    return dt.strftime('%Y-%m-%dT%H:%M:%S.') + f"{dt.microsecond // 1000:03d}Z"
+
+
+def marca_a_ms(valor):
+    """Timestamp de Firestore (datetime) o ms -> ms desde epoch; None si no hay."""
+    if hasattr(valor, 'timestamp'):
+        return int(valor.timestamp() * 1000)
+    return valor
+
+
+def normalizar_iso(valor):
+    """Lleva una fecha ISO cualquiera a la forma canónica (para comparar con 'date')."""
+    return ms_a_iso(iso_a_ms(valor))
+
+
+def fecha_pedido_ms(order):
+    """
+    Fecha del pedido en ms: 'date_ts' si existe, si no se parsea 'date'.
+    Devuelve None si el pedido no tiene una fecha válida.
+    """
+    date_ts = order.get('date_ts')
+    if isinstance(date_ts, (int, float)):
+        return int(date_ts)
+    date_str = order.get('date')
+    if isinstance(date_str, str) and date_str:
+        try:
+            return iso_a_ms(date_str)
+        except ValueError:
+            return None
+    return None
+
+
+def normalizar_fecha_pedido(order, ahora_ms=None):
+    """
+    Completa 'date_ts' y 'date' (forma canónica) en el pedido, en el lugar.
+    Si no trae ninguna fecha válida se usa la hora actual.
+    """
+    ms = fecha_pedido_ms(order)
+    if ms is None:
+        ms = ahora_ms if ahora_ms is not None else int(time.time() * 1000)
+    order['date_ts'] = ms
+    order['date'] = ms_a_iso(ms)
+    return order
+
+
+@lru_cache(maxsize=4096)
+def _formatear_ms(ms, formato):
+    return datetime.fromtimestamp(ms / 1000, tz=ZONA_BOLIVIA).strftime(formato)
+
+
+def formatear_fecha_local(order, formato=FORMATO_FECHA_HORA):
+    """
+    Fecha del pedido en hora de Bolivia con `formato`.
+    Pedidos sin fecha muestran la hora actual; con una fecha ilegible, "Fecha desconocida".
+    """
+    ms = fecha_pedido_ms(order)
+    if ms is not None:
+        return _formatear_ms(ms, formato)
+    if order.get('date'):
+        return "Fecha desconocida"
+    return datetime.now(ZONA_BOLIVIA).strftime(formato)
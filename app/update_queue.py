@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+Cola de actualizaciones del webhook de Telegram.
+
+El webhook solo valida, encola y responde 200; los workers en el loop del bot
+procesan las actualizaciones con `application.process_update`. Se descartan las
+actualizaciones repetidas (mismo update_id, ej. reenvíos de Telegram) y las de un
+mismo chat se procesan en orden, una a la vez, mientras chats distintos avanzan
+en paralelo.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+
+logger = logging.getLogger(__name__)
+
+# Cuántos update_id recientes se recuerdan para detectar duplicados.
+DEDUP_WINDOW = 10000
+
+
+class UpdateDispatcher:
+    def __init__(self, application, loop, workers=4, dedup_window=DEDUP_WINDOW):
+        self.application = application
+        self.loop = loop
+        self.workers = workers
+        self.dedup_window = dedup_window
+        self._seen = OrderedDict()
+        self._pending = {}      # clave de chat -> deque de (update, recibido_en)
+        self._ready = None      # cola de chats con trabajo y sin worker asignado
+        self._tasks = []
+        self._metrics = {
+            'received': 0,
+            'duplicates': 0,
+            'processed': 0,
+            'failed': 0,
+            'latency_ms_avg': 0.0,
+            'latency_ms_max': 0.0,
+            'processing_ms_avg': 0.0,
+        }
+
+    def start(self):
+        """Arranca los workers (llamar desde el loop del bot)."""
+        if self._tasks:
+            return
+        self._ready = asyncio.Queue()
+        self._tasks = [self.loop.create_task(self._worker(i)) for i in range(self.workers)]
+        logger.info(f"Cola de actualizaciones del webhook iniciada con {self.workers} workers.")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, update):
+        """Encola una actualización desde cualquier hilo (no bloquea)."""
+        self.loop.call_soon_threadsafe(self._accept, update, time.monotonic())
+
+    @staticmethod
+    def _chat_key(update):
+        chat = update.effective_chat
+        return chat.id if chat else f"update:{update.update_id}"
+
+    def _accept(self, update, received_at):
+        self._metrics['received'] += 1
+        update_id = update.update_id
+        if update_id in self._seen:
+            self._metrics['duplicates'] += 1
+            logger.info(f"Actualización {update_id} duplicada, se descarta.")
+            return
+        self._seen[update_id] = None
+        if len(self._seen) > self.dedup_window:
+            self._seen.popitem(last=False)
+
+        key = self._chat_key(update)
+        queue = self._pending.get(key)
+        if queue is None:
+            # El chat no tiene worker: se agenda
+            self._pending[key] = deque([(update, received_at)])
+            self._ready.put_nowait(key)
+        else:
+            queue.append((update, received_at))
+
+    async def _worker(self, worker_id):
+        while True:
+            key = await self._ready.get()
+            queue = self._pending[key]
+            try:
+                while queue:
+                    update, received_at = queue[0]
+                    await self._process(update, received_at)
+                    queue.popleft()
+            except asyncio.CancelledError:
+                raise
+            finally:
+                if not queue:
+                    del self._pending[key]
+                else:
+                    # Cancelado a mitad: que otro worker continúe con el chat
+                    self._ready.put_nowait(key)
+
+    async def _process(self, update, received_at):
+        started = time.monotonic()
+        try:
+            await self.application.process_update(update)
+        except Exception as e:
+            self._metrics['failed'] += 1
+            logger.error(f"Error procesando la actualización {update.update_id}: {e}", exc_info=True)
+            return
+        finished = time.monotonic()
+        self._metrics['processed'] += 1
+        n = self._metrics['processed']
+        latency_ms = (finished - received_at) * 1000
+        self._metrics['latency_ms_avg'] += (latency_ms - self._metrics['latency_ms_avg']) / n
+        self._metrics['latency_ms_max'] = max(self._metrics['latency_ms_max'], latency_ms)
+        self._metrics['processing_ms_avg'] += ((finished - started) * 1000 - self._metrics['processing_ms_avg']) / n
+
+    def stats(self):
+        metrics = {k: round(v, 2) if isinstance(v, float) else v for k, v in self._metrics.items()}
+        metrics['queue_depth'] = sum(len(q) for q in list(self._pending.values()))
+        metrics['active_chats'] = len(self._pending)
+        return metrics
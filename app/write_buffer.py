@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+Buffer de escritura diferida (write-behind) para Firestore.
+
+Las actualizaciones frecuentes (ubicación de conductores, posición del repartidor
+en un pedido) se acumulan por documento: si llegan varias antes del siguiente
+vaciado, solo se escribe la última. El vaciado se hace con escrituras en lote
+(batch) cada `interval` segundos y una última vez al apagar el servidor.
+
+Un lote es atómico: si Firestore rechaza un documento (error 4xx), falla el lote
+entero. En ese caso los documentos del lote se reintentan de a uno; los que siguen
+siendo rechazados vuelven a la cola y, tras `max_attempts` vaciados, pasan a la
+lista de descartados (`dead_letters()`) para no bloquear ni reintentar sin fin.
+Los errores transitorios (red, 429, 5xx) solo devuelven el lote a la cola.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import deque
+
+from google.api_core.exceptions import ClientError, Conflict, TooManyRequests
+
+logger = logging.getLogger(__name__)
+
+# Límite de operaciones por lote de Firestore.
+MAX_BATCH_SIZE = 500
+# Vaciados seguidos en los que puede fallar un documento antes de descartarlo.
+MAX_ATTEMPTS = 3
+# Escrituras descartadas que se conservan para inspección.
+MAX_DEAD_LETTERS = 1000
+
+
+def _mezclar(base, cambios):
+    """
+    Mezcla `cambios` en `base` como lo hace set(..., merge=True): los mapas anidados
+    se combinan (ej. 'status_ts') en lugar de reemplazarse.
+    """
+    for campo, valor in cambios.items():
+        anterior = base.get(campo)
+        if isinstance(valor, dict) and isinstance(anterior, dict):
+            base[campo] = _mezclar(dict(anterior), valor)
+        else:
+            base[campo] = valor
+    return base
+
+
+def es_error_permanente(error):
+    """True si reintentar la misma escritura no sirve (4xx salvo 409/429)."""
+    return isinstance(error, ClientError) and not isinstance(error, (Conflict, TooManyRequests))
+
+
+class CoalescingWriteBuffer:
+    """
+    Acumula escrituras `set(..., merge=True)` por (colección, documento)
+    y las vacía en lotes desde un hilo en segundo plano.
+    """
+
+    def __init__(self, get_client, interval=1.0, max_batch_size=MAX_BATCH_SIZE, max_attempts=MAX_ATTEMPTS):
+        self._get_client = get_client
+        self.interval = interval
+        self.max_batch_size = max_batch_size
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = {}  # (colección, doc_id) -> dict con los campos a escribir
+        self._attempts = {}  # (colección, doc_id) -> vaciados seguidos en los que falló
+        self._dead_letters = deque(maxlen=MAX_DEAD_LETTERS)
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats = {
+            'enqueued': 0,
+            'coalesced': 0,
+            'written': 0,
+            'batches': 0,
+            'errors': 0,
+            'retried': 0,
+            'dead_lettered': 0,
+            'last_flush_ms': 0.0,
+        }
+
+    def start(self):
+        """Arranca el hilo de vaciado (idempotente)."""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="firestore-write-buffer", daemon=True)
+            self._thread.start()
+        atexit.register(self.stop)
+
+    def enqueue(self, collection, doc_id, data):
+        """Encola una escritura; si ya había una pendiente para el documento se mezclan."""
+        key = (collection, str(doc_id))
+        with self._lock:
+            self._stats['enqueued'] += 1
+            pending = self._pending.get(key)
+            if pending is None:
+                self._pending[key] = dict(data)
+            else:
+                _mezclar(pending, data)
+                self._stats['coalesced'] += 1
+        if not self._thread:
+            self.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+    def flush(self):
+        """Escribe en Firestore todo lo pendiente. Devuelve el número de documentos escritos."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                pending, self._pending = self._pending, {}
+
+            client = self._get_client()
+            if not client:
+                logger.error("No se puede vaciar el buffer de escrituras: Firestore no está disponible.")
+                self._requeue(pending.items())
+                return 0
+
+            started = time.perf_counter()
+            items = list(pending.items())
+            written = 0
+            for start in range(0, len(items), self.max_batch_size):
+                chunk = items[start:start + self.max_batch_size]
+                try:
+                    batch = client.batch()
+                    for (collection, doc_id), data in chunk:
+                        batch.set(client.collection(collection).document(doc_id), data, merge=True)
+                    batch.commit()
+                    written += len(chunk)
+                    self._stats['batches'] += 1
+                    self._olvidar_intentos(key for key, _ in chunk)
+                except Exception as e:
+                    self._stats['errors'] += 1
+                    logger.error(f"Error al escribir lote de {len(chunk)} documentos en Firestore: {e}", exc_info=True)
+                    if es_error_permanente(e):
+                        written += self._escribir_de_a_uno(client, chunk)
+                    else:
+                        self._requeue(chunk)
+
+            self._stats['written'] += written
+            self._stats['last_flush_ms'] = round((time.perf_counter() - started) * 1000, 2)
+            return written
+
+    def _escribir_de_a_uno(self, client, items):
+        """Reintenta un lote fallido documento por documento. Devuelve cuántos se escribieron."""
+        written = 0
+        for (collection, doc_id), data in items:
+            self._stats['retried'] += 1
+            try:
+                client.collection(collection).document(doc_id).set(data, merge=True)
+                written += 1
+                self._olvidar_intentos([(collection, doc_id)])
+            except Exception as e:
+                self._fallo((collection, doc_id), data, e)
+        return written
+
+    def _fallo(self, key, data, error):
+        """Vuelve a encolar una escritura fallida o la descarta si ya agotó sus intentos."""
+        if not es_error_permanente(error):
+            self._requeue([(key, data)])
+            return
+        with self._lock:
+            intentos = self._attempts.get(key, 0) + 1
+            if intentos < self.max_attempts:
+                self._attempts[key] = intentos
+                requeue = True
+            else:
+                self._attempts.pop(key, None)
+                self._dead_letters.append({
+                    'collection': key[0], 'doc_id': key[1], 'data': data,
+                    'error': str(error), 'failed_at_ms': int(time.time() * 1000),
+                })
+                self._stats['dead_lettered'] += 1
+                requeue = False
+        if requeue:
+            self._requeue([(key, data)])
+        else:
+            logger.error(f"Escritura de {key[0]}/{key[1]} descartada tras {intentos} intentos: {error}")
+
+    def _olvidar_intentos(self, keys):
+        with self._lock:
+            for key in keys:
+                self._attempts.pop(key, None)
+
+    def _requeue(self, items):
+        """Devuelve escrituras fallidas a la cola sin pisar datos más nuevos."""
+        with self._lock:
+            for key, data in items:
+                newer = self._pending.get(key)
+                self._pending[key] = _mezclar(dict(data), newer) if newer else data
+
+    def dead_letters(self):
+        """Escrituras descartadas (las más recientes al final)."""
+        with self._lock:
+            return list(self._dead_letters)
+
+    def stop(self):
+        """Detiene el hilo y vacía lo pendiente (se llama también al salir del proceso)."""
+        self._stop.set()
+        thread = self._thread
+        if thread and thread.is_alive() and thread is not threading.current_thread():
+            thread.join(timeout=self.interval + 5)
+        self.flush()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, pending=len(self._pending), dead_letters=len(self._dead_letters),
+                        interval_seconds=self.interval)
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark del despacho por lotes: tiempo de resolver un lote pedidos x conductores
+y distancia total frente a la asignación codiciosa (un pedido a la vez).
+
+Uso (desde la raíz del proyecto):
+    python -m benchmarks.bench_dispatch [tamaño_del_lote]
+"""
+import math
+import random
+import sys
+import time
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+from config import RESTAURANT_LOCATION
+from app.distance import matriz_distancias_km
+
+
+def puntos_alrededor(cantidad, radio_km, rng, centro=RESTAURANT_LOCATION):
+    lat0, lon0 = centro['latitude'], centro['longitude']
+    puntos = []
+    for _ in range(cantidad):
+        distancia = radio_km * math.sqrt(rng.random())
+        angulo = rng.uniform(0, 2 * math.pi)
+        puntos.append((
+            lat0 + (distancia / 110.54) * math.sin(angulo),
+            lon0 + (distancia / (111.32 * math.cos(math.radians(lat0)))) * math.cos(angulo)
+        ))
+    return puntos
+
+
+def codicioso(distancias):
+    """Cada pedido, en orden de llegada, toma el conductor libre más cercano."""
+    libres = np.ones(distancias.shape[1], dtype=bool)
+    total = 0.0
+    for fila in distancias:
+        j = int(np.argmin(np.where(libres, fila, np.inf)))
+        libres[j] = False
+        total += fila[j]
+    return total
+
+
+def medir(func, repeticiones):
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        resultado = func()
+    return (time.perf_counter() - inicio) / repeticiones * 1000, resultado
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    rng = random.Random(42)
+    pedidos = puntos_alrededor(n, 6.0, rng)
+    conductores = puntos_alrededor(n, 6.0, rng)
+    lats_p, lons_p = zip(*pedidos)
+    lats_c, lons_c = zip(*conductores)
+
+    ms_matriz, distancias = medir(lambda: matriz_distancias_km(lats_p, lons_p, lats_c, lons_c), 20)
+    print(f"Lote {n}x{n}")
+    print(f"  {'matriz de distancias:':<30}{ms_matriz:8.2f} ms")
+
+    ms_scipy, (filas, columnas) = medir(lambda: linear_sum_assignment(distancias), 20)
+    print(f"  {'scipy linear_sum_assignment:':<30}{ms_scipy:8.2f} ms")
+
+    optimo = float(distancias[filas, columnas].sum())
+    greedy = codicioso(distancias)
+    print(f"  {'distancia total óptima:':<30}{optimo:8.1f} km ({optimo / n:.2f} km por pedido)")
+    print(f"  {'distancia total codiciosa:':<30}{greedy:8.1f} km ({greedy / n:.2f} km por pedido, +{(greedy / optimo - 1) * 100:.1f}%)")
+
+
+if __name__ == '__main__':
+    main()
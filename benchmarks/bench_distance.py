@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark de distancias: un pedido contra toda la flota, con la función escalar
+llamada conductor por conductor (como se hacía antes) frente a app.distance en bloque.
+
+Uso (desde la raíz del proyecto):
+    python -m benchmarks.bench_distance [numero_de_conductores]
+"""
+import random
+import sys
+import time
+from math import radians, sin, cos, sqrt, atan2
+
+import numpy as np
+
+from config import RESTAURANT_LOCATION
+from app.distance import distancia_km, distancias_km, mas_cercanos
+from benchmarks.bench_dispatch import puntos_alrededor
+
+
+def distancia_por_llamada(lat1, lon1, lat2, lon2):
+    """Copia de la versión escalar anterior de services (sin el import por llamada)."""
+    R = 6371.0
+    dlat = radians(lat2 - lat1)
+    dlon = radians(lon2 - lon1)
+    a = sin(dlat / 2) ** 2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon / 2) ** 2
+    return R * 2 * atan2(sqrt(a), sqrt(1 - a))
+
+
+def medir(func, repeticiones):
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        resultado = func()
+    return (time.perf_counter() - inicio) / repeticiones * 1000, resultado
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    rng = random.Random(7)
+    conductores = puntos_alrededor(n, 8.0, rng)
+    lat, lon = RESTAURANT_LOCATION['latitude'] + 0.01, RESTAURANT_LOCATION['longitude'] - 0.02
+    lats = np.array([c[0] for c in conductores])
+    lons = np.array([c[1] for c in conductores])
+
+    ms_bucle, en_bucle = medir(lambda: [distancia_por_llamada(lat, lon, d_lat, d_lon) for d_lat, d_lon in conductores], 10)
+    ms_escalar, _ = medir(lambda: [distancia_km(lat, lon, d_lat, d_lon) for d_lat, d_lon in conductores], 10)
+    ms_bloque, en_bloque = medir(lambda: distancias_km(lat, lon, lats, lons), 50)
+    ms_k, _ = medir(lambda: mas_cercanos(lat, lon, lats, lons, k=5), 50)
+    ms_mas_cercano_bucle, _ = medir(lambda: min(
+        range(n), key=lambda i: distancia_por_llamada(lat, lon, conductores[i][0], conductores[i][1])
+    ), 10)
+
+    error = float(np.max(np.abs(np.asarray(en_bucle) - en_bloque)))
+    print(f"Un pedido contra {n} conductores")
+    print(f"  {'bucle por llamada:':<34}{ms_bucle:8.2f} ms")
+    print(f"  {'bucle con distancia_km:':<34}{ms_escalar:8.2f} ms")
+    print(f"  {'distancias_km (numpy):':<34}{ms_bloque:8.2f} ms  (x{ms_bucle / ms_bloque:.0f})")
+    print(f"  {'más cercano, bucle:':<34}{ms_mas_cercano_bucle:8.2f} ms")
+    print(f"  {'5 más cercanos, mas_cercanos:':<34}{ms_k:8.2f} ms  (x{ms_mas_cercano_bucle / ms_k:.0f})")
+    print(f"  {'diferencia máxima:':<34}{error:8.2e} km")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark del motor de precios: cuántos carritos por segundo puede cotizar.
+
+Uso (desde la raíz del proyecto):
+    python -m benchmarks.bench_pricing [numero_de_carritos]
+"""
+import random
+import sys
+import time
+
+from app.menu_store import menu_store
+from app.pricing import PricingEngine
+
+
+def generar_carritos(snapshot, cantidad, semilla=42):
+    rng = random.Random(semilla)
+    principales = [pid for pid, cat in snapshot.category_of.items() if cat != 'adicionales']
+    adicionales = [pid for pid, cat in snapshot.category_of.items() if cat == 'adicionales']
+    carritos = []
+    for _ in range(cantidad):
+        carrito = []
+        for _ in range(rng.randint(1, 6)):
+            linea = {'id': rng.choice(principales), 'quantity': rng.randint(1, 3)}
+            if rng.random() < 0.4:
+                linea['adicionales'] = rng.sample(adicionales, rng.randint(1, 3))
+            carrito.append(linea)
+        carritos.append(carrito)
+    return carritos
+
+
+def main():
+    cantidad = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    snapshot = menu_store.snapshot
+    motor = PricingEngine(snapshot)
+    carritos = generar_carritos(snapshot, cantidad)
+
+    inicio = time.perf_counter()
+    for carrito in carritos:
+        motor.price_cart(carrito)
+    duracion = time.perf_counter() - inicio
+
+    lineas = sum(len(c) for c in carritos)
+    print(f"{cantidad} carritos ({lineas} líneas) en {duracion:.3f}s")
+    print(f"{cantidad / duracion:,.0f} carritos/s  ({duracion / cantidad * 1e6:.1f} µs por carrito)")
+
+
+if __name__ == "__main__":
+    main()
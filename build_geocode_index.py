@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+Genera el índice de geocodificación local (ver app/offline_geocoder.py).
+
+Entrada: un extracto de direcciones de OpenStreetMap de la ciudad, en CSV
+(columnas lat, lon, display_name) o GeoJSON con features de tipo Point
+(por ejemplo, `osmium export` de los nodos con addr:*). Solo se guardan los
+puntos a menos de --radius-km de RESTAURANT_LOCATION. Las etiquetas addr:*
+(o columnas road, house_number, suburb, city, postcode del CSV) se guardan
+como el diccionario 'address' de la respuesta, con las claves de Nominatim.
+
+Uso:
+    python build_geocode_index.py direcciones.geojson geocode_index/ [--radius-km 15] [--cell-deg 0.005]
+
+Luego configurar GEOCODE_OFFLINE_INDEX=geocode_index/ y reiniciar el servidor.
+"""
+import argparse
+import csv
+import json
+import math
+import os
+import sys
+
+import numpy as np
+
+from config import RESTAURANT_LOCATION
+
+
+def _etiqueta(props):
+    """Texto de la dirección a partir de las propiedades de OSM."""
+    if props.get('display_name'):
+        return props['display_name']
+    calle = props.get('addr:street')
+    numero = props.get('addr:housenumber')
+    partes = []
+    if props.get('name'):
+        partes.append(props['name'])
+    if calle:
+        partes.append(f"{calle} {numero}" if numero else calle)
+    for clave in ('addr:suburb', 'addr:city'):
+        if props.get(clave):
+            partes.append(props[clave])
+    return ", ".join(partes)
+
+
+# Etiqueta de OSM -> clave de 'address' en la respuesta de Nominatim
+_CAMPOS_DIRECCION = {
+    'addr:housenumber': 'house_number',
+    'addr:street': 'road',
+    'addr:suburb': 'suburb',
+    'addr:city': 'city',
+    'addr:postcode': 'postcode',
+}
+
+
+def _direccion(props):
+    """Diccionario 'address' (claves de Nominatim) a partir de las propiedades de OSM o del CSV."""
+    direccion = {}
+    for etiqueta_osm, clave in _CAMPOS_DIRECCION.items():
+        valor = props.get(etiqueta_osm) or props.get(clave)
+        if valor:
+            direccion[clave] = str(valor)
+    return direccion
+
+
+def leer_direcciones(path):
+    """Genera (lat, lon, etiqueta, dirección) desde un CSV o GeoJSON."""
+    if path.lower().endswith('.csv'):
+        with open(path, encoding='utf-8', newline='') as f:
+            for fila in csv.DictReader(f):
+                try:
+                    lat, lon = float(fila['lat']), float(fila['lon'])
+                except (KeyError, TypeError, ValueError):
+                    continue
+                etiqueta = _etiqueta(fila)
+                if etiqueta:
+                    yield lat, lon, etiqueta, _direccion(fila)
+        return
+
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    for feature in data.get('features', []):
+        geometry = feature.get('geometry') or {}
+        if geometry.get('type') != 'Point':
+            continue
+        lon, lat = geometry['coordinates'][:2]
+        props = feature.get('properties') or {}
+        etiqueta = _etiqueta(props)
+        if etiqueta:
+            yield float(lat), float(lon), etiqueta, _direccion(props)
+
+
+def _guardar_textos(destino, nombre_bin, nombre_offsets, textos):
+    """Guarda textos UTF-8 concatenados y sus N+1 desplazamientos."""
+    codificados = [t.encode('utf-8') for t in textos]
+    offsets = np.zeros(len(codificados) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(b) for b in codificados])
+    np.save(os.path.join(destino, nombre_offsets), offsets)
+    with open(os.path.join(destino, nombre_bin), 'wb') as f:
+        f.write(b''.join(codificados))
+
+
+def construir_indice(direcciones, destino, radius_km=15.0, cell_deg=0.005, centro=RESTAURANT_LOCATION):
+    lat_c, lon_c = centro['latitude'], centro['longitude']
+    cos_c = math.cos(math.radians(lat_c))
+    lats, lons, etiquetas, detalles = [], [], [], []
+    for lat, lon, etiqueta, direccion in direcciones:
+        dy = (lat - lat_c) * 110.54
+        dx = (lon - lon_c) * 111.32 * cos_c
+        if dx * dx + dy * dy <= radius_km * radius_km:
+            lats.append(lat)
+            lons.append(lon)
+            etiquetas.append(etiqueta)
+            detalles.append(direccion)
+    if not lats:
+        raise SystemExit("No hay direcciones dentro del radio indicado.")
+
+    lat = np.asarray(lats, dtype=np.float64)
+    lon = np.asarray(lons, dtype=np.float64)
+    meta = {
+        'lat_min': float(lat.min()), 'lat_max': float(lat.max()),
+        'lon_min': float(lon.min()), 'lon_max': float(lon.max()),
+        'lat0': float(lat.min()), 'lon0': float(lon.min()),
+        'cell_deg': cell_deg,
+        'center': [lat_c, lon_c],
+        'radius_km': radius_km,
+        'count': len(lats),
+    }
+    meta['nrows'] = int(math.floor((meta['lat_max'] - meta['lat0']) / cell_deg)) + 1
+    meta['ncols'] = int(math.floor((meta['lon_max'] - meta['lon0']) / cell_deg)) + 1
+
+    filas = np.floor((lat - meta['lat0']) / cell_deg).astype(np.int64)
+    columnas = np.floor((lon - meta['lon0']) / cell_deg).astype(np.int64)
+    cells = filas * meta['ncols'] + columnas
+    orden = np.argsort(cells, kind='stable')
+
+    os.makedirs(destino, exist_ok=True)
+    np.save(os.path.join(destino, 'lat.npy'), lat[orden])
+    np.save(os.path.join(destino, 'lon.npy'), lon[orden])
+    np.save(os.path.join(destino, 'cells.npy'), cells[orden])
+    _guardar_textos(destino, 'labels.bin', 'label_offsets.npy', [etiquetas[i] for i in orden])
+    _guardar_textos(destino, 'addresses.bin', 'address_offsets.npy',
+                    [json.dumps(detalles[i], ensure_ascii=False, separators=(',', ':')) for i in orden])
+    with open(os.path.join(destino, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Genera el índice de geocodificación local.")
+    parser.add_argument('entrada', help="CSV (lat,lon,display_name) o GeoJSON de puntos")
+    parser.add_argument('destino', help="Directorio donde guardar el índice")
+    parser.add_argument('--radius-km', type=float, default=15.0)
+    parser.add_argument('--cell-deg', type=float, default=0.005, help="Tamaño de celda en grados (0.005 ≈ 550 m)")
+    args = parser.parse_args(argv)
+
+    meta = construir_indice(leer_direcciones(args.entrada), args.destino, args.radius_km, args.cell_deg)
+    print(f"Índice generado en '{args.destino}': {meta['count']} direcciones, grilla {meta['nrows']}x{meta['ncols']}.")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+Genera por adelantado el catálogo de ideas de pizza (ver app/pizza_catalog.py).
+
+Por defecto toma los ingredientes de los adicionales del menú ("Extra Jamón" ->
+"jamón") y genera todas las combinaciones de 1 a --max-size ingredientes que
+todavía no estén en el catálogo. Con --combos se usa en su lugar un archivo con
+las combinaciones más pedidas (una por línea, separadas por comas).
+
+Uso:
+    python build_pizza_catalog.py [--max-size 3] [--extra "jalapeños,tocino"] [--combos combos.txt] [--delay 1.0] [--limit N]
+"""
+import argparse
+import itertools
+import sys
+import time
+
+from config import PIZZA_IDEA_CATALOG
+from app.pizza_catalog import IdeaCatalog, ingredientes_del_menu
+from app.pizza_ideas import IdeaUnavailable, normalizar_ingredientes, crear_generador
+
+
+def combinaciones_por_defecto(ingredientes, max_size):
+    vocabulario = normalizar_ingredientes(ingredientes)
+    for size in range(1, max_size + 1):
+        yield from itertools.combinations(vocabulario, size)
+
+
+def combinaciones_desde_archivo(path):
+    with open(path, encoding='utf-8') as f:
+        for linea in f:
+            partes = [p for p in linea.strip().split(',') if p.strip()]
+            if partes:
+                yield normalizar_ingredientes(partes)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pre-genera ideas de pizza para las combinaciones más comunes.")
+    parser.add_argument('--catalog', default=PIZZA_IDEA_CATALOG, help="Archivo del catálogo (JSON Lines)")
+    parser.add_argument('--max-size', type=int, default=3, help="Máximo de ingredientes por combinación")
+    parser.add_argument('--extra', default="", help="Ingredientes adicionales separados por comas")
+    parser.add_argument('--combos', help="Archivo con combinaciones (una por línea)")
+    parser.add_argument('--delay', type=float, default=1.0, help="Segundos entre llamadas al modelo")
+    parser.add_argument('--limit', type=int, default=None, help="Máximo de ideas a generar en esta corrida")
+    args = parser.parse_args(argv)
+
+    if not args.catalog:
+        raise SystemExit("PIZZA_IDEA_CATALOG está vacío: indica --catalog.")
+
+    catalogo = IdeaCatalog(args.catalog)
+    generador = crear_generador()
+    if not generador.persist_results:
+        raise SystemExit("PIZZA_IDEA_GENERATOR=stub no genera ideas reales; configura Gemini para llenar el catálogo.")
+
+    if args.combos:
+        combinaciones = combinaciones_desde_archivo(args.combos)
+    else:
+        extra = [i for i in args.extra.split(',') if i.strip()]
+        combinaciones = combinaciones_por_defecto(ingredientes_del_menu() + extra, args.max_size)
+
+    generadas = omitidas = fallidas = 0
+    for combinacion in combinaciones:
+        if combinacion in catalogo:
+            omitidas += 1
+            continue
+        if args.limit is not None and generadas >= args.limit:
+            break
+        try:
+            idea = generador.generate(combinacion)
+        except IdeaUnavailable as e:
+            fallidas += 1
+            print(f"✗ {', '.join(combinacion)}: {e}")
+            continue
+        catalogo.add(combinacion, idea, source='batch')
+        generadas += 1
+        print(f"✓ {', '.join(combinacion)} -> {idea['name']}")
+        time.sleep(args.delay)
+
+    print(f"Catálogo '{args.catalog}': {generadas} nuevas, {omitidas} ya existían, {fallidas} fallidas, {len(catalogo)} en total.")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
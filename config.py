@@ -63,3 +63,105 @@ RESTAURANT_MAP_LOCATION = {
   "latitude": RESTAURANT_LOCATION["latitude"] - 0.00035,
   "longitude": RESTAURANT_LOCATION["longitude"] + 0.0006
 }
+
+# --- CACHÉ DE PEDIDOS ---
+# Caché LRU+TTL de obtener_pedido_por_id (se actualiza en cada escritura del backend).
+ORDER_CACHE_SIZE = int(os.environ.get("ORDER_CACHE_SIZE", 2000))
+ORDER_CACHE_TTL = float(os.environ.get("ORDER_CACHE_TTL", 30))
+
+# --- ESCRITURAS DIFERIDAS ---
+# Cada cuántos segundos se vacían a Firestore (en lote) las ubicaciones de conductores/pedidos.
+WRITE_BUFFER_INTERVAL = float(os.environ.get("WRITE_BUFFER_INTERVAL", 1.0))
+
+# --- FEED DE PEDIDOS ---
+# 'updated_at' se marca al encolar la escritura (y con el reloj de cada réplica), así que un
+# pedido puede llegar a Firestore con una marca anterior al sync_token que ya tiene el panel.
+# Cada consulta con `since` vuelve a pedir este margen (segundos) hacia atrás.
+ORDER_FEED_SYNC_MARGIN = float(os.environ.get("ORDER_FEED_SYNC_MARGIN", 30))
+
+# --- SINCRONIZACIÓN ENTRE RÉPLICAS ---
+# Si es "true", cada instancia escucha los cambios de 'pedidos' y 'drivers' en Firestore
+# (on_snapshot) para mantener su memoria al día cuando hay más de una réplica.
+FIRESTORE_SYNC = os.environ.get("FIRESTORE_SYNC", "false").lower() == "true"
+
+# --- EJECUTOR DE FIRESTORE ---
+# Hilos dedicados a las llamadas bloqueantes de Firestore desde código async.
+FIRESTORE_EXECUTOR_WORKERS = int(os.environ.get("FIRESTORE_EXECUTOR_WORKERS", 8))
+
+# --- CACHÉ HTTP DEL MENÚ ---
+# Segundos que navegadores/CDN pueden reutilizar /get_products sin revalidar (luego usan ETag).
+MENU_CACHE_MAX_AGE = int(os.environ.get("MENU_CACHE_MAX_AGE", 300))
+
+# --- MENÚ ---
+# Fuente del menú: "module" (app/menu_data.py), "file" (JSON en MENU_FILE) o "firestore" (colección 'menu').
+MENU_SOURCE = os.environ.get("MENU_SOURCE", "module")
+MENU_FILE = os.environ.get("MENU_FILE", os.path.join(_project_root, "menu.json"))
+# Cada cuántos segundos se revisa si MENU_FILE cambió (0 = sin recarga automática).
+MENU_RELOAD_INTERVAL = float(os.environ.get("MENU_RELOAD_INTERVAL", 10))
+
+# --- ADMINISTRACIÓN ---
+# Token para endpoints de administración (ej. recargar el menú). Sin token, quedan deshabilitados.
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
+# --- PRECIOS ---
+# Por defecto se rechazan pedidos con productos que no están en el menú. Con "false" se aceptan
+# (ej. pizzas personalizadas) al precio del cliente, si es positivo, y se marcan como no verificados.
+PRICING_STRICT = os.environ.get("PRICING_STRICT", "true").lower() == "true"
+
+# --- GEOCODIFICACIÓN INVERSA (Nominatim) ---
+NOMINATIM_URL = os.environ.get("NOMINATIM_URL", "https://nominatim.openstreetmap.org/reverse")
+NOMINATIM_USER_AGENT = os.environ.get("NOMINATIM_USER_AGENT", "PizzeriaNovaBot/1.0 (hebertsb@gmail.com)")
+# Decimales a los que se redondean lat/lon para la caché (4 ≈ 11 m).
+GEOCODE_PRECISION = int(os.environ.get("GEOCODE_PRECISION", 4))
+GEOCODE_CACHE_SIZE = int(os.environ.get("GEOCODE_CACHE_SIZE", 5000))
+GEOCODE_CACHE_TTL = float(os.environ.get("GEOCODE_CACHE_TTL", 86400))
+# Política de Nominatim: como máximo 1 petición por segundo.
+GEOCODE_MIN_INTERVAL = float(os.environ.get("GEOCODE_MIN_INTERVAL", 1.0))
+# Máximo de segundos que una petición espera su turno antes de responder 503. La espera ocupa
+# el hilo WSGI compartido (bloquea a todas las rutas), así que por defecto no se espera.
+GEOCODE_MAX_WAIT = float(os.environ.get("GEOCODE_MAX_WAIT", 0))
+# Índice local de direcciones (generado con build_geocode_index.py). Sin valor, todo va a Nominatim.
+GEOCODE_OFFLINE_INDEX = os.environ.get("GEOCODE_OFFLINE_INDEX")
+# Distancia máxima (m) a la dirección indexada más cercana para responder sin Nominatim.
+GEOCODE_OFFLINE_MAX_DISTANCE = float(os.environ.get("GEOCODE_OFFLINE_MAX_DISTANCE", 150))
+
+# --- IDEAS DE PIZZA (Gemini) ---
+# "gemini" o "stub" (generador local determinista, para pruebas y desarrollo sin API key).
+PIZZA_IDEA_GENERATOR = os.environ.get("PIZZA_IDEA_GENERATOR", "gemini")
+# Modelos en orden de preferencia; los siguientes son fallback del primero.
+GEMINI_MODELS = [m.strip() for m in os.environ.get("GEMINI_MODELS", "gemini-2.0-flash,gemini-flash-latest").split(",") if m.strip()]
+GEMINI_TIMEOUT = float(os.environ.get("GEMINI_TIMEOUT", 15))
+GEMINI_MAX_CONCURRENCY = int(os.environ.get("GEMINI_MAX_CONCURRENCY", 4))
+# Fallos seguidos de un modelo antes de dejar de llamarlo, y segundos hasta volver a probarlo.
+GEMINI_BREAKER_THRESHOLD = int(os.environ.get("GEMINI_BREAKER_THRESHOLD", 3))
+GEMINI_BREAKER_RESET = float(os.environ.get("GEMINI_BREAKER_RESET", 30))
+PIZZA_IDEA_CACHE_SIZE = int(os.environ.get("PIZZA_IDEA_CACHE_SIZE", 1000))
+PIZZA_IDEA_CACHE_TTL = float(os.environ.get("PIZZA_IDEA_CACHE_TTL", 7 * 24 * 3600))
+# Catálogo de ideas ya generadas (JSON Lines, ver build_pizza_catalog.py). Vacío = sin catálogo.
+PIZZA_IDEA_CATALOG = os.environ.get("PIZZA_IDEA_CATALOG", os.path.join(_project_root, "pizza_ideas.jsonl"))
+
+# --- SIMULACIÓN ---
+# Segundos reales por minuto simulado en app/simulation.py (1.0 = un viaje de 15 min dura 15 s).
+SIMULATION_TIME_SCALE = float(os.environ.get("SIMULATION_TIME_SCALE", 1.0))
+
+# --- DESPACHO ---
+# "batch": los pedidos se juntan DISPATCH_WINDOW segundos y se asignan en conjunto (asignación óptima).
+# "greedy": cada pedido toma al instante el conductor libre más cercano.
+DISPATCH_MODE = os.environ.get("DISPATCH_MODE", "batch")
+DISPATCH_WINDOW = float(os.environ.get("DISPATCH_WINDOW", 2.0))
+DISPATCH_MAX_BATCH = int(os.environ.get("DISPATCH_MAX_BATCH", 200))
+# Conductores libres más cercanos que se consideran por pedido al armar la matriz.
+DISPATCH_CANDIDATES_PER_ORDER = int(os.environ.get("DISPATCH_CANDIDATES_PER_ORDER", 5))
+# No se asigna un conductor a más de esta distancia (km) del cliente.
+DISPATCH_MAX_KM = float(os.environ.get("DISPATCH_MAX_KM", 15))
+# Ventanas en las que se reintenta un pedido sin conductor libre antes de dejarlo sin asignar.
+DISPATCH_MAX_ATTEMPTS = int(os.environ.get("DISPATCH_MAX_ATTEMPTS", 30))
+
+# --- ETA ---
+# Radio (km) y lado de celda (m) de la grilla de tiempos de viaje desde el restaurante.
+ETA_GRID_RADIUS_KM = float(os.environ.get("ETA_GRID_RADIUS_KM", 15))
+ETA_GRID_CELL_M = float(os.environ.get("ETA_GRID_CELL_M", 200))
+# Pedidos recientes que se usan para aprender tiempos de preparación y de viaje.
+ETA_HISTORY_SIZE = int(os.environ.get("ETA_HISTORY_SIZE", 500))
+# Mínimo de muestras antes de reemplazar los tiempos por defecto por los aprendidos.
+ETA_MIN_SAMPLES = int(os.environ.get("ETA_MIN_SAMPLES", 20))
@@ -7,13 +7,16 @@ import os
 import subprocess
 import time
 import platform
+import signal
+import sys
 from telegram.ext import Application
 
 from app import app
 from app.bot import get_bot_handlers
 from app.routes import telegram_service
+from app.services import vaciar_escrituras_diferidas, precargar_estado_caliente
 from config import BOT_TOKEN, WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET_TOKEN
-from asgiref.wsgi import WsgiToAsgi
+from app.asgi import crear_app_asgi
 import os
 
 logger = logging.getLogger(__name__)
@@ -75,7 +78,8 @@ def run_flask():
     """Corre el servidor web Flask usando Uvicorn (compatible con async)"""
     port = int(os.environ.get("PORT", 5000))
     logger.info(f"Iniciando servidor Flask (Uvicorn) en http://0.0.0.0:{port}")
-    asgi_app = WsgiToAsgi(app)
+    # Los streams SSE y las ideas de pizza se atienden en el loop de uvicorn; el resto, Flask por WsgiToAsgi
+    asgi_app = crear_app_asgi(app)
     config = uvicorn.Config(asgi_app, host="0.0.0.0", port=port, log_level="info")
     server = uvicorn.Server(config)
     server.run()
@@ -96,6 +100,7 @@ async def run_telegram_bot_webhook(webhook_url):
     telegram_service.bot = application.bot
     telegram_service.loop = asyncio.get_running_loop()
     telegram_service.application = application # type: ignore
+    telegram_service.start()
     
     handlers = get_bot_handlers()
     for handler in handlers:
@@ -147,6 +152,7 @@ async def run_telegram_bot_polling():
     telegram_service.bot = application.bot
     telegram_service.loop = asyncio.get_running_loop()
     telegram_service.application = application # type: ignore
+    telegram_service.start()
     
     handlers = get_bot_handlers()
     for handler in handlers:
@@ -183,6 +189,13 @@ async def run_telegram_bot_polling():
 if __name__ == "__main__":
     logger.info("Iniciando la aplicación...")
 
+    # Pedidos activos y conductores en línea a memoria antes de las primeras peticiones
+    precargar_estado_caliente()
+
+    # SIGTERM (Railway, docker stop) terminaría el proceso sin pasar por atexit ni por el
+    # finally de abajo: se convierte en SystemExit para vaciar el buffer de escrituras
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
     # Iniciar Flask en un hilo separado
     flask_thread = threading.Thread(target=run_flask, daemon=True)
     flask_thread.start()
@@ -221,3 +234,6 @@ if __name__ == "__main__":
             
     except KeyboardInterrupt:
         logger.info("Cerrando la aplicación...")
+    finally:
+        # Escribir en Firestore las ubicaciones que queden en el buffer
+        vaciar_escrituras_diferidas()
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+import os
+import socket
+import sys
+import threading
+import time
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Antes de importar config: sin credenciales reales ni archivos del proyecto
+os.environ["FIREBASE_CREDENTIALS_BASE64"] = ""
+os.environ["PIZZA_IDEA_CATALOG"] = ""
+os.environ["PIZZA_IDEA_GENERATOR"] = "stub"
+os.environ.pop("GEOCODE_OFFLINE_INDEX", None)
+
+from fake_firestore import FakeFirestore  # noqa: E402
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    """services conectado a un Firestore en memoria, con el estado en memoria vacío."""
+    from app import services
+    from app.write_buffer import CoalescingWriteBuffer
+
+    client = FakeFirestore()
+    monkeypatch.setattr(services, 'db', client)
+    # Vaciado periódico en la práctica desactivado: las pruebas llaman a flush()
+    buffer = CoalescingWriteBuffer(lambda: client, interval=3600)
+    monkeypatch.setattr(services, 'buffer_escrituras', buffer)
+    monkeypatch.setattr(services, '_estado_cargado', False)
+    monkeypatch.setattr(services, 'sincronizador', None)
+    services.estado_caliente.clear()
+    services.registro_pedidos_activos.clear()
+    services.indice_conductores.clear()
+    services.cache_pedidos.clear()
+    yield client
+    if services.sincronizador is not None:
+        services.sincronizador.stop()
+
+
+@pytest.fixture
+def http(fake_db):
+    """Cliente de pruebas de Flask con todas las rutas registradas."""
+    import importlib
+    importlib.import_module('app.routes')
+    from app import app as flask_app
+    return flask_app.test_client()
+
+
+@pytest.fixture
+def servidor(http):
+    """La app ASGI de run.py servida por uvicorn en un puerto libre."""
+    import uvicorn
+    from app import app as flask_app
+    from app.asgi import crear_app_asgi
+
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        puerto = s.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(crear_app_asgi(flask_app), host='127.0.0.1', port=puerto,
+                                           log_level='warning', lifespan='off'))
+    hilo = threading.Thread(target=server.run, daemon=True)
+    hilo.start()
+    limite = time.time() + 10
+    while not server.started and time.time() < limite:
+        time.sleep(0.02)
+    yield f"http://127.0.0.1:{puerto}"
+    server.should_exit = True
+    hilo.join(timeout=10)
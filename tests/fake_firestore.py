@@ -0,0 +1,335 @@
+# -*- coding: utf-8 -*-
+"""
+Firestore en memoria para las pruebas.
+
+Implementa la parte de google-cloud-firestore que usa el backend: documentos
+(get / set con merge / update / delete), consultas (where, order_by, start_after,
+limit, stream), lotes y on_snapshot (entregado desde un hilo, como el cliente real).
+
+- `indices_compuestos=False`: las consultas que en Firestore necesitan un índice
+  compuesto (igualdad en un campo + rango u orden en otro) fallan con
+  FailedPrecondition, como lo haría el servidor.
+- `rechazar(coleccion, doc_id, datos)`: si devuelve True, la escritura falla con
+  InvalidArgument (y, en un lote, falla el lote completo).
+- `reloj()`: valor con el que se resuelve SERVER_TIMESTAMP.
+"""
+import copy
+import enum
+import queue
+import threading
+from datetime import datetime, timezone
+
+from google.api_core.exceptions import FailedPrecondition, InvalidArgument, NotFound
+from google.cloud.firestore_v1 import DELETE_FIELD, SERVER_TIMESTAMP
+
+ASCENDING = 'ASCENDING'
+DESCENDING = 'DESCENDING'
+
+_IGUALDAD = {'==', 'in'}
+_OPERADORES = {
+    '==': lambda x, v: x == v,
+    '!=': lambda x, v: x is not None and x != v,
+    'in': lambda x, v: x in v,
+    'not-in': lambda x, v: x is not None and x not in v,
+    '<': lambda x, v: x is not None and x < v,
+    '<=': lambda x, v: x is not None and x <= v,
+    '>': lambda x, v: x is not None and x > v,
+    '>=': lambda x, v: x is not None and x >= v,
+    'array_contains': lambda x, v: isinstance(x, list) and v in x,
+}
+
+
+def _resolver(valor, ahora):
+    if valor is SERVER_TIMESTAMP:
+        return ahora
+    if isinstance(valor, dict):
+        return {k: _resolver(v, ahora) for k, v in valor.items() if v is not DELETE_FIELD}
+    return copy.deepcopy(valor)
+
+
+def _mezclar(base, cambios, ahora):
+    for campo, valor in cambios.items():
+        if valor is DELETE_FIELD:
+            base.pop(campo, None)
+        elif isinstance(valor, dict) and isinstance(base.get(campo), dict):
+            _mezclar(base[campo], valor, ahora)
+        else:
+            base[campo] = _resolver(valor, ahora)
+    return base
+
+
+class DocumentSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+        self.exists = data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, campo):
+        return copy.deepcopy((self._data or {}).get(campo))
+
+
+class DocumentReference:
+    def __init__(self, client, coleccion, doc_id):
+        self._client = client
+        self.coleccion = coleccion
+        self.id = str(doc_id)
+
+    def get(self):
+        with self._client.lock:
+            self._client.reads += 1
+            datos = self._client.data.get(self.coleccion, {}).get(self.id)
+            return DocumentSnapshot(self, copy.deepcopy(datos))
+
+    def set(self, data, merge=False):
+        self._client._escribir([(self, 'set', data, merge)])
+
+    def update(self, data):
+        self._client._escribir([(self, 'update', data, False)])
+
+    def delete(self):
+        self._client._escribir([(self, 'delete', None, False)])
+
+
+class ChangeType(enum.Enum):
+    ADDED = 1
+    REMOVED = 2
+    MODIFIED = 3
+
+
+class DocumentChange:
+    def __init__(self, tipo, document):
+        self.type = tipo
+        self.document = document
+
+
+class Watch:
+    """Listener de una consulta: entrega los cambios en orden desde su propio hilo."""
+
+    def __init__(self, consulta, callback):
+        self._consulta = consulta
+        self._callback = callback
+        self._eventos = queue.Queue()
+        self.is_active = True
+        client = consulta._client
+        with client.lock:
+            iniciales = [
+                DocumentChange(ChangeType.ADDED, snap) for snap in consulta._resultados(contar=False)
+            ]
+            client._listeners.append(self)
+        self._eventos.put(iniciales)
+        self._hilo = threading.Thread(target=self._entregar, name="fake-firestore-watch", daemon=True)
+        self._hilo.start()
+
+    def _cambio(self, ref, antes, despues):
+        estaba = antes is not None and self._consulta._coincide(antes)
+        esta = despues is not None and self._consulta._coincide(despues)
+        if esta:
+            tipo = ChangeType.MODIFIED if estaba else ChangeType.ADDED
+            self._eventos.put([DocumentChange(tipo, DocumentSnapshot(ref, copy.deepcopy(despues)))])
+        elif estaba:
+            self._eventos.put([DocumentChange(ChangeType.REMOVED, DocumentSnapshot(ref, copy.deepcopy(antes)))])
+
+    def _entregar(self):
+        while True:
+            cambios = self._eventos.get()
+            try:
+                if cambios is None:
+                    return
+                if self.is_active:
+                    self._callback([], cambios, None)
+            finally:
+                self._eventos.task_done()
+
+    def esperar(self):
+        """Bloquea hasta que se hayan entregado los cambios pendientes."""
+        self._eventos.join()
+
+    def cerrar(self):
+        """Simula un listener que se cierra del todo (ej. error no recuperable)."""
+        self.is_active = False
+        client = self._consulta._client
+        with client.lock:
+            if self in client._listeners:
+                client._listeners.remove(self)
+        self._eventos.put(None)
+
+    def unsubscribe(self):
+        self.cerrar()
+
+
+class Query:
+    ASCENDING = ASCENDING
+    DESCENDING = DESCENDING
+
+    def __init__(self, client, coleccion, filtros=(), orden=(), limite=None, despues_de=None):
+        self._client = client
+        self.coleccion = coleccion
+        self._filtros = tuple(filtros)
+        self._orden = tuple(orden)
+        self._limite = limite
+        self._despues_de = despues_de
+
+    def _copia(self, **cambios):
+        args = dict(filtros=self._filtros, orden=self._orden, limite=self._limite, despues_de=self._despues_de)
+        args.update(cambios)
+        return Query(self._client, self.coleccion, **args)
+
+    def where(self, campo, op, valor):
+        if op not in _OPERADORES:
+            raise ValueError(f"Operador no soportado: {op}")
+        return self._copia(filtros=self._filtros + ((campo, op, valor),))
+
+    def order_by(self, campo, direction=ASCENDING):
+        return self._copia(orden=self._orden + ((campo, direction),))
+
+    def limit(self, n):
+        return self._copia(limite=n)
+
+    def start_after(self, snapshot):
+        return self._copia(despues_de=snapshot)
+
+    def _coincide(self, datos):
+        return all(_OPERADORES[op](datos.get(campo), valor) for campo, op, valor in self._filtros)
+
+    def _verificar_indice(self):
+        if self._client.indices_compuestos:
+            return
+        campos = {campo for campo, _, _ in self._filtros} | {campo for campo, _ in self._orden}
+        rango = any(op not in _IGUALDAD for _, op, _ in self._filtros) or bool(self._orden)
+        if len(campos) > 1 and rango:
+            raise FailedPrecondition("The query requires an index.")
+
+    def _ordenar(self, items):
+        items = sorted(items, key=lambda item: item[0])
+        for campo, direccion in reversed(self._orden):
+            items.sort(key=lambda item: item[1].get(campo), reverse=direccion == DESCENDING)
+        return items
+
+    def _resultados(self, contar=True):
+        self._verificar_indice()
+        with self._client.lock:
+            docs = self._client.data.get(self.coleccion, {})
+            items = [(doc_id, copy.deepcopy(d)) for doc_id, d in docs.items() if self._coincide(d)]
+        # Como en Firestore, order_by excluye los documentos sin el campo
+        items = [item for item in items if all(item[1].get(campo) is not None for campo, _ in self._orden)]
+        if self._despues_de is not None:
+            cursor = (self._despues_de.id, self._despues_de.to_dict() or {})
+            items = self._ordenar([item for item in items if item[0] != cursor[0]] + [cursor])
+            items = items[items.index(cursor) + 1:]
+        else:
+            items = self._ordenar(items)
+        if self._limite is not None:
+            items = items[:self._limite]
+        if contar:
+            self._client.reads += len(items)
+        return [DocumentSnapshot(DocumentReference(self._client, self.coleccion, doc_id), d) for doc_id, d in items]
+
+    def stream(self):
+        return iter(self._resultados())
+
+    def get(self):
+        return self._resultados()
+
+    def on_snapshot(self, callback):
+        return Watch(self, callback)
+
+
+class CollectionReference(Query):
+    def __init__(self, client, coleccion):
+        super().__init__(client, coleccion)
+
+    def document(self, doc_id):
+        return DocumentReference(self._client, self.coleccion, doc_id)
+
+
+class WriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._ops = []
+
+    def set(self, ref, data, merge=False):
+        self._ops.append((ref, 'set', data, merge))
+
+    def update(self, ref, data):
+        self._ops.append((ref, 'update', data, False))
+
+    def delete(self, ref):
+        self._ops.append((ref, 'delete', None, False))
+
+    def commit(self):
+        self._client._escribir(self._ops)
+        self._client.batches += 1
+
+
+class FakeFirestore:
+    def __init__(self, indices_compuestos=True):
+        self.data = {}
+        self.lock = threading.RLock()
+        self.indices_compuestos = indices_compuestos
+        self.rechazar = lambda coleccion, doc_id, datos: False
+        self.reloj = lambda: datetime.now(timezone.utc)
+        self.reads = 0
+        self.writes = 0
+        self.batches = 0
+        self._listeners = []
+
+    def collection(self, nombre):
+        return CollectionReference(self, nombre)
+
+    def batch(self):
+        return WriteBatch(self)
+
+    def sembrar(self, coleccion, documentos):
+        """Carga documentos directamente (sin contar escrituras ni avisar a listeners)."""
+        with self.lock:
+            self.data.setdefault(coleccion, {}).update({str(k): copy.deepcopy(v) for k, v in documentos.items()})
+
+    def doc(self, coleccion, doc_id):
+        with self.lock:
+            return copy.deepcopy(self.data.get(coleccion, {}).get(str(doc_id)))
+
+    def esperar_listeners(self):
+        for watch in list(self._listeners):
+            watch.esperar()
+
+    def _escribir(self, ops):
+        # Todas las operaciones se validan antes de aplicar ninguna (los lotes son atómicos)
+        for ref, tipo, datos, _ in ops:
+            if self.rechazar(ref.coleccion, ref.id, datos):
+                raise InvalidArgument(f"Documento inválido: {ref.coleccion}/{ref.id}")
+        avisos = []
+        with self.lock:
+            ahora = self.reloj()
+            for ref, tipo, datos, merge in ops:
+                docs = self.data.setdefault(ref.coleccion, {})
+                antes = docs.get(ref.id)
+                if tipo == 'delete':
+                    despues = None
+                elif tipo == 'update':
+                    if antes is None:
+                        raise NotFound(f"No existe el documento {ref.coleccion}/{ref.id}")
+                    despues = copy.deepcopy(antes)
+                    for campo, valor in datos.items():
+                        destino = despues
+                        *ruta, ultimo = campo.split('.')
+                        for parte in ruta:
+                            destino = destino.setdefault(parte, {})
+                        if valor is DELETE_FIELD:
+                            destino.pop(ultimo, None)
+                        else:
+                            destino[ultimo] = _resolver(valor, ahora)
+                else:
+                    base = copy.deepcopy(antes) if (merge and antes is not None) else {}
+                    despues = _mezclar(base, datos, ahora)
+                if despues is None:
+                    docs.pop(ref.id, None)
+                else:
+                    docs[ref.id] = despues
+                self.writes += 1
+                avisos.extend((watch, ref, antes, despues) for watch in self._listeners if watch._consulta.coleccion == ref.coleccion)
+            for watch, ref, antes, despues in avisos:
+                watch._cambio(ref, antes, despues)
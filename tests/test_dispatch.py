@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+import time
+
+import pytest
+
+from app.dispatch import BatchDispatcher, asignar_lote
+
+CENTRO = (-17.7832662, -63.1820985)
+CERCA = (-17.7900, -63.1700)      # ~1.5 km del centro
+LEJOS = (-17.7832662, -63.0500)   # ~14 km del centro
+
+
+class Flota:
+    """Conductores libres y asignaciones escritas, en memoria."""
+
+    def __init__(self, conductores=()):
+        self.libres = {driver_id: (lat, lon) for driver_id, lat, lon in conductores}
+        self.asignados = {}
+
+    def candidatos(self, lat, lon, k):
+        return [(driver_id, d_lat, d_lon) for driver_id, (d_lat, d_lon) in self.libres.items()][:k]
+
+    def asignar(self, order_id, driver_id):
+        self.libres.pop(driver_id)
+        self.asignados[order_id] = driver_id
+        return True
+
+
+@pytest.fixture
+def flota():
+    return Flota()
+
+
+def _despachador(flota, **kwargs):
+    kwargs.setdefault('window', 3600)
+    return BatchDispatcher(flota.candidatos, flota.asignar, **kwargs)
+
+
+def test_lote_minimiza_la_distancia_total():
+    # El conductor 'a' es el más cercano a ambos pedidos: el codicioso se lo da a p1 y deja a p2 con 'b'
+    pedidos = [('p1', *CENTRO), ('p2', *CERCA)]
+    conductores = [('a', -17.7890, -63.1710), ('b', -17.7800, -63.1900)]
+    pares = asignar_lote(pedidos, conductores)
+    assert {(o, d) for o, d, _ in pares} == {('p1', 'b'), ('p2', 'a')}
+
+
+def test_excluye_pares_a_mas_de_max_km(flota):
+    flota.libres = {'lejano': LEJOS}
+    despachador = _despachador(flota, max_km=5)
+    despachador.enqueue('p1', *CENTRO)
+    assert despachador.dispatch_once() == []
+    assert flota.asignados == {}
+    assert despachador.stats()['pending'] == 1
+
+    # Con un conductor dentro del radio, el lejano sigue sin usarse
+    flota.libres['cercano'] = CERCA
+    assert [(o, d) for o, d, _ in despachador.dispatch_once()] == [('p1', 'cercano')]
+    assert 'lejano' in flota.libres
+
+
+def test_reintenta_en_la_ventana_siguiente(flota):
+    despachador = _despachador(flota, window=0.05)
+    despachador.enqueue('p1', *CENTRO)
+    time.sleep(0.2)  # Pasan varias ventanas sin conductores libres
+    assert flota.asignados == {} and despachador.stats()['pending'] == 1
+
+    flota.libres['d1'] = CERCA
+    limite = time.time() + 5
+    while not flota.asignados and time.time() < limite:
+        time.sleep(0.01)
+    assert flota.asignados == {'p1': 'd1'}
+    stats = despachador.stats()
+    assert stats['pending'] == 0 and stats['assigned'] == 1 and stats['batches'] >= 2
+
+
+def test_descarta_tras_max_attempts(flota):
+    despachador = _despachador(flota, max_attempts=3)
+    despachador.enqueue('p1', *CENTRO)
+    for _ in range(2):
+        despachador.dispatch_once()
+    assert despachador.stats()['pending'] == 1
+
+    despachador.dispatch_once()
+    stats = despachador.stats()
+    assert stats['pending'] == 0 and stats['dropped'] == 1
+
+    # Ya no se intenta aunque aparezca un conductor
+    flota.libres['d1'] = CERCA
+    assert despachador.dispatch_once() == []
+
+
+def test_salta_pedidos_ya_asignados(flota):
+    flota.libres = {'d1': CERCA, 'd2': CENTRO}
+    resueltos = {'p1'}
+    despachador = _despachador(flota, ya_asignado=lambda order_id: order_id in resueltos)
+    despachador.enqueue('p1', *CENTRO)
+    despachador.enqueue('p2', *CERCA)
+
+    assert [(o, d) for o, d, _ in despachador.dispatch_once()] == [('p2', 'd1')]
+    assert 'p1' not in flota.asignados
+    stats = despachador.stats()
+    assert stats['pending'] == 0 and stats['dropped'] == 0
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from app import services
+from app.timeutils import ms_a_iso
+
+BASE_MS = 1_700_000_000_000
+
+
+def _sembrar_pedidos(db, n=5, driver_id='d1'):
+    pedidos = {}
+    for i in range(n):
+        ms = BASE_MS + i * 60_000
+        pedidos[f'p{i}'] = {'id': f'p{i}', 'driver_id': driver_id, 'status': 'Entregado', 'date': ms_a_iso(ms), 'date_ts': ms}
+    pedidos['otro'] = {'id': 'otro', 'driver_id': 'd2', 'status': 'Entregado', 'date': ms_a_iso(BASE_MS), 'date_ts': BASE_MS}
+    db.sembrar('pedidos', pedidos)
+
+
+def _todas_las_paginas(driver_id, **kwargs):
+    ids, cursor = [], None
+    while True:
+        pagina, cursor = services.obtener_pedidos_por_conductor(driver_id, limite=2, cursor=cursor, **kwargs)
+        ids.extend(p['id'] for p in pagina)
+        if cursor is None:
+            return ids
+
+
+@pytest.mark.parametrize('indices', [True, False])
+def test_paginas_sin_repetidos_con_y_sin_indice(fake_db, indices):
+    fake_db.indices_compuestos = indices
+    _sembrar_pedidos(fake_db)
+    assert _todas_las_paginas('d1') == ['p4', 'p3', 'p2', 'p1', 'p0']
+
+
+@pytest.mark.parametrize('indices', [True, False])
+def test_rango_de_fechas_con_y_sin_indice(fake_db, indices):
+    fake_db.indices_compuestos = indices
+    _sembrar_pedidos(fake_db)
+    desde, hasta = ms_a_iso(BASE_MS + 60_000), ms_a_iso(BASE_MS + 3 * 60_000)
+    assert _todas_las_paginas('d1', desde=desde, hasta=hasta) == ['p3', 'p2', 'p1']
+
+
+@pytest.mark.parametrize('cursor', ['no-existe', 'otro'])
+def test_cursor_desconocido_o_ajeno(fake_db, cursor):
+    _sembrar_pedidos(fake_db)
+    with pytest.raises(services.ConsultaInvalida):
+        services.obtener_pedidos_por_conductor('d1', cursor=cursor)
+
+
+def test_demasiados_estados(fake_db):
+    estados = [f'e{i}' for i in range(services.MAX_ESTADOS_FILTRO + 1)]
+    with pytest.raises(services.ConsultaInvalida):
+        services.obtener_pedidos_por_conductor('d1', estados=estados)
+
+
+def test_ruta_responde_400(fake_db, http):
+    _sembrar_pedidos(fake_db)
+    assert http.get('/driver/orders/d1?cursor=no-existe').status_code == 400
+    estados = ','.join(f'e{i}' for i in range(services.MAX_ESTADOS_FILTRO + 1))
+    assert http.get(f'/driver/orders/d1?status={estados}').status_code == 400
+    respuesta = http.get('/driver/orders/d1?limit=2')
+    assert respuesta.status_code == 200
+    assert respuesta.headers['X-Next-Cursor'] == 'p3'
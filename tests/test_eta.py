@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from app import services
+from app.distance import distancia_km
+from app.eta import (
+    CLAVE_CONFIRMADO, CLAVE_EN_CAMINO, EtaService, PrepTimeModel, minutos_preparacion_base, ritmo_base
+)
+
+AHORA = 1_700_000_000_000
+RESTAURANTE = {'latitude': -17.7832662, 'longitude': -63.1820985}
+CLIENTE = {'latitude': -17.7900, 'longitude': -63.1700}
+
+
+@pytest.fixture
+def eta():
+    return EtaService(restaurante=RESTAURANTE, radius_km=5, cell_m=200, min_samples=3)
+
+
+def test_preparando(eta):
+    pedido = {'status': 'Confirmado', 'location': CLIENTE, 'items': [{'quantity': 2}],
+              'status_ts': {CLAVE_CONFIRMADO: AHORA - 5 * 60000}}
+    estimacion = eta.estimar(pedido, ahora_ms=AHORA)
+    viaje = eta.grid.desde_origen(CLIENTE['latitude'], CLIENTE['longitude'])
+    assert estimacion['phase'] == 'preparing'
+    assert estimacion['prep_minutes'] == minutos_preparacion_base(2) == 17
+    # Empezó hace 5 minutos: faltan 12 de preparación más el viaje
+    assert estimacion['eta_ms'] == int(AHORA + (12 + viaje) * 60000)
+    # La grilla usa el centro de la celda: difiere poco del cálculo exacto
+    exacto = distancia_km(RESTAURANTE['latitude'], RESTAURANTE['longitude'], CLIENTE['latitude'], CLIENTE['longitude']) * ritmo_base()
+    assert viaje == pytest.approx(exacto, abs=0.5)
+
+
+def test_en_camino_con_repartidor(eta):
+    repartidor = {'latitude': -17.7890, 'longitude': -63.1710}
+    pedido = {'status': 'En camino', 'location': CLIENTE, 'driver_location': repartidor,
+              'status_ts': {CLAVE_EN_CAMINO: AHORA - 10 * 60000}}
+    estimacion = eta.estimar(pedido, ahora_ms=AHORA)
+    viaje = distancia_km(repartidor['latitude'], repartidor['longitude'], CLIENTE['latitude'], CLIENTE['longitude']) * ritmo_base()
+    assert estimacion['phase'] == 'on_the_way'
+    assert estimacion['prep_minutes'] == 0
+    assert estimacion['eta_ms'] == int(AHORA + viaje * 60000)
+    assert estimacion['minutes'] == 1
+
+
+def test_fuera_de_la_grilla(eta):
+    lejos = {'latitude': -17.7832662, 'longitude': -63.0500}  # ~14 km, la grilla cubre 5
+    assert eta.grid._celda(lejos['latitude'], lejos['longitude']) is None
+    pedido = {'status': 'En camino', 'location': lejos, 'status_ts': {CLAVE_EN_CAMINO: AHORA}}
+    estimacion = eta.estimar(pedido, ahora_ms=AHORA)
+    viaje = distancia_km(RESTAURANTE['latitude'], RESTAURANTE['longitude'], lejos['latitude'], lejos['longitude']) * ritmo_base()
+    assert estimacion['travel_minutes'] == round(viaje, 1)
+    assert estimacion['eta_ms'] == int(AHORA + viaje * 60000)
+
+
+def test_no_aplica(eta):
+    assert eta.estimar({'status': 'Entregado', 'location': CLIENTE}) is None
+    assert eta.estimar({'status': 'Confirmado'}) is None
+
+
+def test_preparacion_pasa_a_la_mediana():
+    modelo = PrepTimeModel(history=10, min_samples=3)
+    modelo.observar(1, 30)
+    modelo.observar(1, 10)
+    assert modelo.minutos(1) == minutos_preparacion_base(1)
+    modelo.observar(1, 12)
+    assert modelo.minutos(1) == 12
+    # Los demás grupos siguen con el valor por defecto; 7 items comparten grupo con 5
+    assert modelo.minutos(2) == minutos_preparacion_base(2)
+    for minutos in (40, 50, 45):
+        modelo.observar(7, minutos)
+    assert modelo.minutos(5) == modelo.minutos(9) == 45
+
+
+def test_historial_entregados_mas_recientes(fake_db):
+    fake_db.sembrar('pedidos', {
+        f'p{i}': {'id': f'p{i}', 'status': 'Entregado', 'updated_at': AHORA + i} for i in range(5)
+    })
+    fake_db.sembrar('pedidos', {'x': {'id': 'x', 'status': 'Cancelado', 'updated_at': AHORA + 10}})
+    assert [p['id'] for p in services._pedidos_entregados_recientes(limite=3)] == ['p4', 'p3', 'p2']
+
+    # Sin el índice compuesto: igual devuelve pedidos entregados
+    fake_db.indices_compuestos = False
+    pedidos = services._pedidos_entregados_recientes(limite=3)
+    assert len(pedidos) == 3 and all(p['status'] == 'Entregado' for p in pedidos)
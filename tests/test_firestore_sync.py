@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+import time
+
+import pytest
+
+from app import services
+from app.eta import CLAVE_CONFIRMADO, CLAVE_EN_CAMINO, CLAVE_ENTREGADO
+from app.firestore_sync import FirestoreSync
+from app.pubsub import event_bus, topico_pedido
+
+AHORA = 1_700_000_000_000
+CLIENTE = {'latitude': -17.7900, 'longitude': -63.1700}
+
+
+@pytest.fixture
+def sync(fake_db):
+    sincronizador = services.iniciar_sincronizacion(fake_db)
+    fake_db.esperar_listeners()
+    return sincronizador
+
+
+@pytest.fixture
+def eventos():
+    suscripcion = event_bus.subscribe(topico_pedido('A'))
+    recibidos = []
+
+    def pendientes():
+        while True:
+            evento = suscripcion.get(timeout=0)
+            if evento is None:
+                return recibidos
+            recibidos.append((evento['type'], evento['data']['status']))
+
+    yield pendientes
+    suscripcion.close()
+
+
+def _escribir_remoto(db, coleccion, doc_id, datos):
+    """Escritura de otra réplica: va directo a Firestore, no a la memoria de esta instancia."""
+    db.collection(coleccion).document(doc_id).set(datos, merge=True)
+    db.esperar_listeners()
+
+
+def test_alta_cambio_y_fin_de_un_pedido(fake_db, sync, eventos):
+    _escribir_remoto(fake_db, 'pedidos', 'A', {
+        'id': 'A', 'status': 'Confirmado', 'driver_id': 'd1', 'location': CLIENTE, 'items': [{'quantity': 1}],
+        'updated_at': AHORA, 'status_ts': {CLAVE_CONFIRMADO: AHORA},
+    })
+    assert services.estado_caliente.get_order('A')['status'] == 'Confirmado'
+    assert services.registro_pedidos_activos.active_orders('d1') == {'A'}
+    assert eventos() == [('status', 'Confirmado')]
+
+    _escribir_remoto(fake_db, 'pedidos', 'A', {
+        'status': 'En camino', 'updated_at': AHORA + 20 * 60000, 'status_ts': {CLAVE_EN_CAMINO: AHORA + 20 * 60000},
+    })
+    assert services.estado_caliente.get_order('A')['status'] == 'En camino'
+    assert eventos()[-1] == ('status', 'En camino')
+
+    aprendidos = services.servicio_eta.stats()['learned_orders']
+    _escribir_remoto(fake_db, 'pedidos', 'A', {
+        'status': 'Entregado', 'updated_at': AHORA + 35 * 60000, 'status_ts': {CLAVE_ENTREGADO: AHORA + 35 * 60000},
+    })
+    # Sale del estado caliente, queda en caché con el estado final y se avisa por /stream
+    assert 'A' not in services.estado_caliente
+    assert services.cache_pedidos.get('A')['status'] == 'Entregado'
+    assert not services.registro_pedidos_activos.active_orders('d1')
+    assert eventos()[-1] == ('status', 'Entregado')
+    assert services.servicio_eta.stats()['learned_orders'] == aprendidos + 1
+
+    stats = sync.stats()['pedidos']
+    assert (stats['added'], stats['modified'], stats['removed'], stats['errors']) == (1, 1, 1, 0)
+
+
+def test_pedido_borrado(fake_db, sync, eventos):
+    _escribir_remoto(fake_db, 'pedidos', 'A', {'id': 'A', 'status': 'Pendiente', 'updated_at': AHORA})
+    fake_db.collection('pedidos').document('A').delete()
+    fake_db.esperar_listeners()
+    assert 'A' not in services.estado_caliente
+    assert services.cache_pedidos.peek('A') is None
+    assert eventos() == [('status', 'Pendiente')]
+
+
+def test_cambios_atrasados_y_ecos(fake_db, sync, eventos):
+    assert services.guardar_pedido_en_firestore({'id': 'A', 'status': 'Pendiente', 'items': []})
+    fake_db.esperar_listeners()
+    # El alta propia vuelve como eco: no se publica de nuevo
+    assert eventos() == []
+
+    services.actualizar_estado_pedido('A', 'Confirmado')
+    assert eventos() == []  # La ruta es la que publica los cambios locales
+    local = services.estado_caliente.get_order('A')
+
+    # Una réplica escribe un valor más viejo que el que esta instancia tiene en memoria
+    _escribir_remoto(fake_db, 'pedidos', 'A', {'status': 'Pendiente', 'updated_at': local['updated_at'] - 1})
+    assert services.estado_caliente.get_order('A')['status'] == 'Confirmado'
+    assert sync.stats()['pedidos']['stale'] == 1
+    assert eventos() == []
+
+
+def test_fin_propio_no_se_repite(fake_db, sync, eventos):
+    services.guardar_pedido_en_firestore({'id': 'A', 'status': 'En camino', 'items': [], 'location': CLIENTE})
+    fake_db.esperar_listeners()
+    lecturas = fake_db.reads
+
+    # La entrega local ya aprende (si hay muestra); el eco REMOVED no debe aprender otra vez
+    services.actualizar_estado_pedido('A', 'Entregado')
+    aprendidos = services.servicio_eta.stats()['learned_orders']
+    services.buffer_escrituras.flush()
+    fake_db.esperar_listeners()
+
+    assert sync.stats()['pedidos']['removed'] == 1
+    assert eventos() == []
+    assert services.servicio_eta.stats()['learned_orders'] == aprendidos
+    assert fake_db.reads == lecturas
+
+
+def test_conductores_e_indice(fake_db, sync):
+    ubicacion = {'latitude': -17.78, 'longitude': -63.18}
+    _escribir_remoto(fake_db, 'drivers', 'd1', {'status': 'disponible', 'location': ubicacion, 'last_update': AHORA})
+    assert 'd1' in services.indice_conductores
+    assert services.estado_caliente.get_driver('d1')['status'] == 'disponible'
+
+    _escribir_remoto(fake_db, 'drivers', 'd1', {'status': 'ocupado', 'last_update': AHORA + 1})
+    assert 'd1' not in services.indice_conductores
+    assert services.estado_caliente.get_driver('d1')['status'] == 'ocupado'
+
+    _escribir_remoto(fake_db, 'drivers', 'd1', {'status': 'disponible', 'last_update': AHORA + 2})
+    assert 'd1' in services.indice_conductores
+
+    _escribir_remoto(fake_db, 'drivers', 'd1', {'status': 'desconectado', 'last_update': AHORA + 3})
+    assert 'd1' not in services.indice_conductores
+    assert services.estado_caliente.get_driver('d1') is None
+    assert sync.stats()['drivers']['removed'] == 1
+
+
+def test_vigilante_reabre_el_listener(fake_db):
+    recibidos = []
+    sync = FirestoreSync(fake_db, intervalo_vigilancia=0.05).watch(
+        'pedidos', fake_db.collection('pedidos'), lambda doc_id, datos: recibidos.append(doc_id), lambda doc_id: None
+    )
+    sync.start()
+    try:
+        primero = sync._suscripciones[0].watch
+        primero.cerrar()
+
+        limite = time.time() + 5
+        while sync._suscripciones[0].watch is primero and time.time() < limite:
+            time.sleep(0.01)
+        assert sync.stats()['pedidos']['restarts'] == 1
+        assert sync.stats()['pedidos']['active']
+
+        fake_db.collection('pedidos').document('B').set({'status': 'Pendiente'})
+        fake_db.esperar_listeners()
+        assert recibidos == ['B']
+    finally:
+        sync.stop()
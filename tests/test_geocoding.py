@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from app.geocoding import GeocodingBusy, ReverseGeocoder
+
+
+class StubNominatim:
+    """Servidor HTTP local con la forma de respuesta de Nominatim /reverse."""
+
+    def __init__(self, demora=0.0):
+        self.demora = demora
+        self.peticiones = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.peticiones += 1
+                time.sleep(stub.demora)
+                params = parse_qs(urlparse(self.path).query)
+                lat, lon = params['lat'][0], params['lon'][0]
+                body = json.dumps({
+                    'display_name': f"Calle {lat}, {lon}, Santa Cruz de la Sierra",
+                    'address': {'road': f"Calle {lat}", 'city': 'Santa Cruz de la Sierra', 'country_code': 'bo'},
+                }).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}/reverse"
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+@pytest.fixture
+def stub():
+    servidor = StubNominatim()
+    yield servidor
+    servidor.close()
+
+
+def _geocoder(stub, **kwargs):
+    kwargs.setdefault('min_interval', 0)
+    return ReverseGeocoder(url=stub.url, precision=4, cache_size=100, cache_ttl=60, **kwargs)
+
+
+def test_cache_por_celda(stub):
+    geocoder = _geocoder(stub)
+    primera = geocoder.reverse(-17.78321, -63.18209)
+    # Otro punto de la misma celda (4 decimales) sale de la caché
+    segunda = geocoder.reverse(-17.78324, -63.18211)
+    assert primera == segunda
+    assert stub.peticiones == 1
+    assert geocoder.stats()['cache']['hits'] == 1
+
+
+def test_single_flight(stub):
+    stub.demora = 0.3
+    geocoder = _geocoder(stub)
+    resultados = []
+    hilos = [threading.Thread(target=lambda: resultados.append(geocoder.reverse(-17.7832, -63.1820))) for _ in range(5)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    assert len(resultados) == 5 and all(r == resultados[0] for r in resultados)
+    assert stub.peticiones == 1
+    assert geocoder.stats()['coalesced'] == 4
+
+
+def test_limitador_no_duerme(stub):
+    geocoder = _geocoder(stub, min_interval=10, max_wait=0)
+    geocoder.reverse(-17.78, -63.18)
+    inicio = time.perf_counter()
+    with pytest.raises(GeocodingBusy) as error:
+        geocoder.reverse(-17.70, -63.10)
+    assert time.perf_counter() - inicio < 0.5
+    assert 9 < error.value.retry_after <= 10
+    assert stub.peticiones == 1
+
+
+def test_ruta_responde_503(stub, http, monkeypatch):
+    import app.routes as routes
+
+    monkeypatch.setattr(routes, 'geocoder', _geocoder(stub, min_interval=10, max_wait=0))
+    assert http.get('/reverse_geocode?lat=-17.78&lon=-63.18').status_code == 200
+    respuesta = http.get('/reverse_geocode?lat=-17.70&lon=-63.10')
+    assert respuesta.status_code == 503
+    assert 9 <= int(respuesta.headers['Retry-After']) <= 10
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+import gzip
+
+import pytest
+from flask import Flask
+
+from app.http_cache import PreparedResponse, serve_prepared
+
+app = Flask(__name__)
+CUERPO = ('{"menu": "' + 'x' * 2000 + '"}').encode()
+
+
+def _servir(prepared, **headers):
+    with app.test_request_context('/', headers=headers):
+        return serve_prepared(prepared, 'no-cache')
+
+
+@pytest.fixture
+def prepared():
+    return PreparedResponse(CUERPO, 'application/json')
+
+
+def test_etag_distinto_por_variante(prepared):
+    identidad = _servir(prepared)
+    comprimida = _servir(prepared, **{'Accept-Encoding': 'gzip'})
+    assert comprimida.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(comprimida.get_data()) == CUERPO
+    assert identidad.headers['ETag'] != comprimida.headers['ETag']
+    assert comprimida.headers['ETag'].startswith('"') and comprimida.headers['ETag'].endswith('-gzip"')
+
+
+def test_304_solo_para_la_misma_variante(prepared):
+    etag_gzip = _servir(prepared, **{'Accept-Encoding': 'gzip'}).headers['ETag']
+    assert _servir(prepared, **{'Accept-Encoding': 'gzip', 'If-None-Match': etag_gzip}).status_code == 304
+    # El cliente pide ahora sin comprimir: sus bytes cacheados no sirven
+    assert _servir(prepared, **{'If-None-Match': etag_gzip}).status_code == 200
+
+
+def test_q_cero_explicito_gana_al_comodin(prepared):
+    respuesta = _servir(prepared, **{'Accept-Encoding': '*'})
+    assert respuesta.headers.get('Content-Encoding') == 'gzip'
+    respuesta = _servir(prepared, **{'Accept-Encoding': '*;q=1, gzip;q=0'})
+    assert 'Content-Encoding' not in respuesta.headers
+    assert respuesta.get_data() == CUERPO
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import time
+
+import pytest
+
+from app.menu_data import products
+from app.menu_store import MenuSnapshot, MenuStore
+
+
+def test_raw_es_de_solo_lectura():
+    snapshot = MenuSnapshot(products, version=1)
+    categoria = next(iter(snapshot.raw))
+    with pytest.raises(TypeError):
+        snapshot.raw[categoria] = ()
+    with pytest.raises(TypeError):
+        snapshot.raw[categoria][0]['price'] = 0
+
+
+def test_to_dict_es_una_copia_serializable():
+    snapshot = MenuSnapshot(products, version=1)
+    copia = snapshot.to_dict()
+    assert json.dumps(copia) == json.dumps(products)
+    categoria = next(iter(copia))
+    copia[categoria][0]['price'] = 0
+    assert snapshot.raw[categoria][0]['price'] == products[categoria][0]['price']
+
+
+def test_watcher_registra_errores(tmp_path, caplog):
+    archivo = tmp_path / 'menu.json'
+    archivo.write_text(json.dumps(products), encoding='utf-8')
+    store = MenuStore(source='file', path=str(archivo))
+    store.reload()
+    with caplog.at_level(logging.ERROR, logger='app.menu_store'):
+        store.start_watcher(interval=0.02)
+        archivo.unlink()
+        limite = time.time() + 2
+        while not caplog.records and time.time() < limite:
+            time.sleep(0.02)
+    assert caplog.records and caplog.records[0].exc_info is not None
+    assert store.version == 2
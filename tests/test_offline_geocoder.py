@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+import json
+import math
+import os
+
+import numpy as np
+import pytest
+
+from build_geocode_index import construir_indice, leer_direcciones
+from app.offline_geocoder import OfflineGeocoder, celda, METROS_POR_GRADO_LAT, METROS_POR_GRADO_LON
+
+CELDA = 0.002  # ≈ 210 m
+
+
+def _feature(lat, lon, **props):
+    return {'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [lon, lat]}, 'properties': props}
+
+
+@pytest.fixture
+def geojson(tmp_path):
+    features = [
+        _feature(-17.7800, -63.1800, **{'addr:street': 'Calle Junín', 'addr:housenumber': '10', 'addr:city': 'Santa Cruz'}),
+        _feature(-17.7800, -63.1779, **{'addr:street': 'Calle Ayacucho', 'addr:suburb': 'Centro'}),
+        _feature(-17.7700, -63.1700, name='Sin calle'),
+        {'type': 'Feature', 'geometry': {'type': 'LineString', 'coordinates': [[-63.18, -17.78], [-63.17, -17.77]]}, 'properties': {'name': 'Ignorada'}},
+        _feature(-17.7750, -63.1750),  # Sin etiqueta: se descarta
+        _feature(-10.0, -60.0, name='Fuera del radio'),
+    ]
+    path = tmp_path / 'direcciones.geojson'
+    path.write_text(json.dumps({'type': 'FeatureCollection', 'features': features}), encoding='utf-8')
+    return str(path)
+
+
+def test_lectura_de_geojson_y_csv(geojson, tmp_path):
+    direcciones = list(leer_direcciones(geojson))
+    assert [d[2] for d in direcciones] == ['Calle Junín 10, Santa Cruz', 'Calle Ayacucho, Centro', 'Sin calle', 'Fuera del radio']
+    assert direcciones[0][3] == {'road': 'Calle Junín', 'house_number': '10', 'city': 'Santa Cruz'}
+
+    csv_path = tmp_path / 'direcciones.csv'
+    csv_path.write_text("lat,lon,display_name,road,city\n-17.78,-63.18,Plaza,Calle Sucre,Santa Cruz\nx,y,Mala,,\n", encoding='utf-8')
+    assert list(leer_direcciones(str(csv_path))) == [(-17.78, -63.18, 'Plaza', {'road': 'Calle Sucre', 'city': 'Santa Cruz'})]
+
+
+def test_construccion_del_indice(geojson, tmp_path):
+    destino = tmp_path / 'indice'
+    meta = construir_indice(leer_direcciones(geojson), str(destino), radius_km=15, cell_deg=CELDA)
+    assert meta['count'] == 3
+    assert sorted(os.listdir(destino)) == ['address_offsets.npy', 'addresses.bin', 'cells.npy', 'label_offsets.npy',
+                                           'labels.bin', 'lat.npy', 'lon.npy', 'meta.json']
+    cells = np.load(destino / 'cells.npy')
+    assert list(cells) == sorted(cells)
+    lat, lon = np.load(destino / 'lat.npy'), np.load(destino / 'lon.npy')
+    for i in range(len(cells)):
+        fila, columna = celda(lat[i], lon[i], meta)
+        assert 0 <= fila < meta['nrows'] and 0 <= columna < meta['ncols']
+        assert cells[i] == fila * meta['ncols'] + columna
+
+
+def test_vecino_de_otra_celda_gana(geojson, tmp_path):
+    construir_indice(leer_direcciones(geojson), str(tmp_path), cell_deg=CELDA)
+    geocoder = OfflineGeocoder(str(tmp_path), max_distance_m=150)
+
+    # El punto cae en la celda de 'Junín' (a ~200 m) pero 'Ayacucho' está a ~20 m en la celda vecina
+    consulta = (-17.7800, -63.1781)
+    assert celda(*consulta, geocoder.meta) != celda(-17.7800, -63.1779, geocoder.meta)
+    data = geocoder.reverse(*consulta)
+    assert data['display_name'] == 'Calle Ayacucho, Centro'
+    assert data['address'] == {'road': 'Calle Ayacucho', 'suburb': 'Centro'}
+    assert data['distance_m'] < 30
+    assert data['source'] == 'offline'
+
+    assert geocoder.reverse(-17.7750, -63.1750) is None  # Sin dirección a menos de 150 m
+    assert geocoder.reverse(-17.7000, -63.1000) is None  # Fuera del área indexada
+
+
+def test_coincide_con_busqueda_exhaustiva(tmp_path):
+    rng = np.random.default_rng(7)
+    puntos = [(-17.79 + rng.random() * 0.02, -63.19 + rng.random() * 0.02) for _ in range(400)]
+    construir_indice(((lat, lon, f"Dir {i}", {}) for i, (lat, lon) in enumerate(puntos)), str(tmp_path), cell_deg=CELDA)
+    geocoder = OfflineGeocoder(str(tmp_path), max_distance_m=200)
+    factor_lon = METROS_POR_GRADO_LON * geocoder._cos_lat
+    meta = geocoder.meta
+
+    for _ in range(300):
+        lat = meta['lat_min'] + rng.random() * (meta['lat_max'] - meta['lat_min'])
+        lon = meta['lon_min'] + rng.random() * (meta['lon_max'] - meta['lon_min'])
+        distancias = [math.hypot((p[0] - lat) * METROS_POR_GRADO_LAT, (p[1] - lon) * factor_lon) for p in puntos]
+        mejor = int(np.argmin(distancias))
+        data = geocoder.reverse(lat, lon)
+        if distancias[mejor] > geocoder.max_distance_m:
+            assert data is None
+        else:
+            assert data['display_name'] == f"Dir {mejor}"
+
+
+def test_indice_sin_direcciones_estructuradas(geojson, tmp_path):
+    construir_indice(leer_direcciones(geojson), str(tmp_path), cell_deg=CELDA)
+    os.remove(tmp_path / 'addresses.bin')
+    os.remove(tmp_path / 'address_offsets.npy')
+    data = OfflineGeocoder(str(tmp_path)).reverse(-17.7800, -63.1800)
+    assert data['display_name'] == 'Calle Junín 10, Santa Cruz'
+    assert data['address'] == {}
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+from app import services
+
+BASE_MS = 1_700_000_000_000
+
+
+def _pedido(order_id, updated_at):
+    return {'id': order_id, 'status': 'Pendiente', 'updated_at': updated_at, 'date_ts': updated_at}
+
+
+def test_escritura_atrasada_no_se_pierde(fake_db):
+    # B llega a Firestore antes que A, aunque A se marcó primero (buffer o reloj de otra réplica)
+    fake_db.sembrar('pedidos', {'B': _pedido('B', BASE_MS + 500)})
+    primera = services.obtener_pedidos_paginados(since=BASE_MS - 60_000)
+    assert [p['id'] for p in primera['orders']] == ['B']
+    assert primera['sync_token'] == BASE_MS + 500
+
+    fake_db.sembrar('pedidos', {'A': _pedido('A', BASE_MS)})
+    segunda = services.obtener_pedidos_paginados(since=primera['sync_token'])
+    assert 'A' in [p['id'] for p in segunda['orders']]
+    assert segunda['sync_token'] == BASE_MS + 500
+
+
+def test_fuera_del_margen_no_se_repite(fake_db):
+    margen_ms = int(services.ORDER_FEED_SYNC_MARGIN * 1000)
+    fake_db.sembrar('pedidos', {
+        'viejo': _pedido('viejo', BASE_MS - margen_ms - 1),
+        'nuevo': _pedido('nuevo', BASE_MS + 1),
+    })
+    feed = services.obtener_pedidos_paginados(since=BASE_MS)
+    assert [p['id'] for p in feed['orders']] == ['nuevo']
+
+
+def _recorrer(**kwargs):
+    paginas, cursor = [], None
+    while True:
+        feed = services.obtener_pedidos_paginados(cursor=cursor, limite=2, **kwargs)
+        paginas.append(feed)
+        cursor = feed['next_cursor']
+        if cursor is None:
+            return paginas
+
+
+def test_historial_conserva_el_token_hasta_la_ultima_pagina(fake_db, monkeypatch):
+    monkeypatch.setattr(services, '_ahora_ms', lambda: BASE_MS + 10_000)
+    fake_db.sembrar('pedidos', {
+        f'p{i}': dict(_pedido(f'p{i}', BASE_MS + i * 1000), date=f'2023-11-14T22:1{i}:00Z') for i in range(5)
+    })
+    paginas = _recorrer()
+    assert [p['id'] for pagina in paginas for p in pagina['orders']] == ['p4', 'p3', 'p2', 'p1', 'p0']
+    assert [pagina['sync_token'] for pagina in paginas] == [BASE_MS + 10_000] * 3
+
+
+def test_token_del_feed_incremental(fake_db):
+    fake_db.sembrar('pedidos', {f'p{i}': _pedido(f'p{i}', BASE_MS + i * 1000) for i in range(5)})
+    paginas = _recorrer(since=BASE_MS)
+    assert [p['id'] for pagina in paginas for p in pagina['orders']] == ['p0', 'p1', 'p2', 'p3', 'p4']
+    assert paginas[-1]['sync_token'] == BASE_MS + 4000
+
+
+def test_cursor_invalido_responde_400(fake_db, http):
+    fake_db.sembrar('pedidos', {f'p{i}': _pedido(f'p{i}', BASE_MS + i) for i in range(3)})
+    for cursor in ('no-existe', f'{BASE_MS}:no-existe', f'{BASE_MS}:'):
+        assert http.get(f'/get_orders?cursor={cursor}').status_code == 400
+    respuesta = http.get(f'/get_orders?since={BASE_MS}&limit=1')
+    assert respuesta.status_code == 200
+    siguiente = respuesta.get_json()['next_cursor']
+    assert http.get(f'/get_orders?since={BASE_MS}&limit=1&cursor={siguiente}').get_json()['orders'][0]['id'] == 'p1'
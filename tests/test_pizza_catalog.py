@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import json
+
+import pytest
+
+from app.pizza_catalog import IdeaCatalog, ingredientes_del_menu
+from app.pizza_ideas import PizzaIdeaService, StubIdeaGenerator, normalizar_ingredientes
+
+IDEA = {'name': 'Pizza de la Casa', 'description': 'Jamón y piña.'}
+
+
+class GeneradorPersistente(StubIdeaGenerator):
+    """Generador local cuyas ideas se guardan en el catálogo, como las de Gemini."""
+    persist_results = True
+
+    def __init__(self):
+        self.llamadas = 0
+
+    def generate(self, ingredientes):
+        self.llamadas += 1
+        return super().generate(ingredientes)
+
+
+@pytest.fixture
+def ruta(tmp_path):
+    return str(tmp_path / 'ideas' / 'catalogo.jsonl')
+
+
+def _servicio(catalogo, generador):
+    return PizzaIdeaService(generador, max_concurrency=1, timeout=5, catalog=catalogo)
+
+
+def test_agregar_y_recargar(ruta):
+    catalogo = IdeaCatalog(ruta)
+    catalogo.add(('jamón', 'piña'), IDEA)
+    catalogo.add(('jamón', 'piña'), {'name': 'Otra', 'description': 'La última gana.'})
+    catalogo.add(('queso',), IDEA, source='batch')
+
+    recargado = IdeaCatalog(ruta)
+    assert len(recargado) == 2
+    assert recargado.get(('jamón', 'piña')) == {'name': 'Otra', 'description': 'La última gana.'}
+    assert recargado.get(('queso',)) == IDEA
+    assert recargado.stats() == {'size': 2, 'hits': 2}
+
+
+def test_ultima_linea_cortada_se_ignora(ruta):
+    IdeaCatalog(ruta).add(('queso',), IDEA)
+    # Un apagado a mitad de escritura deja la última línea incompleta
+    with open(ruta, 'a', encoding='utf-8') as f:
+        f.write(json.dumps({'ingredients': ['jamón'], 'name': 'Cortada', 'description': 'x'})[:25])
+
+    catalogo = IdeaCatalog(ruta)
+    assert len(catalogo) == 1 and catalogo.get(('queso',)) == IDEA
+    assert ('jamón',) not in catalogo
+
+
+def test_acierto_del_catalogo_no_llama_al_generador(ruta):
+    catalogo = IdeaCatalog(ruta)
+    catalogo.add(('jamón', 'piña'), IDEA)
+    generador = GeneradorPersistente()
+    servicio = _servicio(catalogo, generador)
+
+    assert asyncio.run(servicio.generar(('jamón', 'piña'))) == IDEA
+    assert generador.llamadas == 0
+    assert servicio.stats()['catalog']['hits'] == 1
+
+
+def test_solo_se_guardan_ingredientes_del_menu(ruta):
+    vocabulario = normalizar_ingredientes(ingredientes_del_menu())
+    assert {'jamón', 'piña', 'pepperoni'} <= set(vocabulario)
+    catalogo = IdeaCatalog(ruta, vocabulario=vocabulario)
+    generador = GeneradorPersistente()
+    servicio = _servicio(catalogo, generador)
+
+    del_menu = ('jamón', 'piña')
+    libre = ('jamón', 'mi ingrediente secreto')
+    for clave in (del_menu, libre):
+        asyncio.run(servicio.generar(clave))
+    servicio._executor.shutdown(wait=True)
+
+    # La combinación de texto libre queda solo en la caché LRU
+    assert del_menu in catalogo and libre not in catalogo
+    assert servicio.cache.get(libre)['name'] == 'Pizza Jamón y Mi Ingrediente Secreto'
+    assert list(IdeaCatalog(ruta)._ideas) == [del_menu]
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import threading
+import time
+
+import httpx
+import pytest
+
+from app.pizza_ideas import (
+    CircuitBreaker, GeminiIdeaGenerator, IdeaUnavailable, PizzaIdeaService, StubIdeaGenerator
+)
+
+
+class GeneradorBloqueado(StubIdeaGenerator):
+    """Generador local que no responde hasta que se llama a liberar()."""
+
+    def __init__(self):
+        self.llamadas = 0
+        self._liberado = threading.Event()
+
+    def generate(self, ingredientes):
+        self.llamadas += 1
+        self._liberado.wait(5)
+        return super().generate(ingredientes)
+
+    def liberar(self):
+        self._liberado.set()
+
+
+@pytest.fixture
+def generador():
+    generador = GeneradorBloqueado()
+    yield generador
+    generador.liberar()
+
+
+def _ejecutar(corrutina):
+    return asyncio.run(corrutina)
+
+
+def test_peticiones_iguales_comparten_la_generacion(generador):
+    servicio = PizzaIdeaService(generador, max_concurrency=2, timeout=5)
+
+    async def escenario():
+        tareas = [asyncio.ensure_future(servicio.generar(('jamón', 'queso'))) for _ in range(3)]
+        await asyncio.sleep(0.05)
+        generador.liberar()
+        return await asyncio.gather(*tareas)
+
+    ideas = _ejecutar(escenario())
+    assert ideas[0] == ideas[1] == ideas[2] == {'name': 'Pizza Jamón y Queso',
+                                                'description': 'Masa artesanal con jamón, queso, horneada al momento.'}
+    assert generador.llamadas == 1
+    assert servicio.stats()['coalesced'] == 2
+
+    # La siguiente sale de la caché
+    assert _ejecutar(servicio.generar(('jamón', 'queso'))) == ideas[0]
+    assert generador.llamadas == 1
+
+
+def test_cola_llena_responde_ocupado(generador):
+    servicio = PizzaIdeaService(generador, max_concurrency=1, timeout=5)
+    for i in range(servicio.max_pending):
+        servicio._future_para((f'ingrediente {i}',))
+    with pytest.raises(IdeaUnavailable):
+        _ejecutar(servicio.generar(('otro',)))
+    assert servicio.stats()['rejected'] == 1
+
+
+def test_timeout_no_cancela_la_generacion(generador):
+    servicio = PizzaIdeaService(generador, max_concurrency=1, timeout=0.05)
+    with pytest.raises(asyncio.TimeoutError):
+        _ejecutar(servicio.generar(('piña',)))
+    assert servicio.stats()['timeouts'] == 1
+
+    # La generación siguió en segundo plano y llenó la caché
+    generador.liberar()
+    servicio._en_curso[('piña',)].result(timeout=5)
+    assert servicio.cache.get(('piña',))['name'] == 'Pizza Piña'
+
+
+@pytest.fixture
+def servicio_en_ruta(monkeypatch, generador):
+    """Servicio de ideas que atiende /generate_pizza_idea (app/asgi.py)."""
+    import app.asgi
+
+    servicio = PizzaIdeaService(generador, max_concurrency=1, timeout=0.05)
+    monkeypatch.setattr(app.asgi, 'servicio_ideas', servicio)
+    return servicio
+
+
+@pytest.mark.parametrize('lleno, status', [(True, 503), (False, 504)])
+def test_ruta_503_y_504(servidor, servicio_en_ruta, lleno, status):
+    if lleno:
+        for i in range(servicio_en_ruta.max_pending):
+            servicio_en_ruta._future_para((f'ingrediente {i}',))
+    respuesta = httpx.post(f"{servidor}/generate_pizza_idea", json={'ingredients': ['queso']}, timeout=5)
+    assert respuesta.status_code == status
+    assert respuesta.headers['access-control-allow-origin'] == '*'
+
+
+def test_ruta_valida_el_cuerpo(servidor, servicio_en_ruta):
+    with httpx.Client(base_url=servidor, timeout=5) as cliente:
+        assert cliente.post('/generate_pizza_idea', content=b'no es json').status_code == 400
+        assert cliente.post('/generate_pizza_idea', json={'ingredients': []}).status_code == 400
+        assert cliente.post('/generate_pizza_idea', json={'ingredients': ['x' * 20000]}).status_code == 413
+        preflight = cliente.options('/generate_pizza_idea', headers={
+            'Origin': 'https://app.example', 'Access-Control-Request-Method': 'POST',
+            'Access-Control-Request-Headers': 'content-type'})
+        assert preflight.status_code == 204
+        assert preflight.headers['access-control-allow-headers'] == 'content-type'
+
+
+def test_generacion_lenta_no_bloquea_a_flask(servidor, servicio_en_ruta, generador):
+    servicio_en_ruta.timeout = 5
+    with httpx.Client(base_url=servidor, timeout=10) as cliente:
+        resultado = {}
+        hilo = threading.Thread(target=lambda: resultado.update(
+            idea=cliente.post('/generate_pizza_idea', json={'ingredients': ['queso']})))
+        hilo.start()
+        time.sleep(0.2)
+        # Con la idea esperando al generador, una ruta de Flask responde enseguida
+        inicio = time.perf_counter()
+        assert cliente.get('/get_products').status_code == 200
+        assert time.perf_counter() - inicio < 1
+        generador.liberar()
+        hilo.join(timeout=10)
+    assert resultado['idea'].status_code == 200
+    assert resultado['idea'].json()['name'] == 'Pizza Queso'
+
+
+class Reloj:
+    def __init__(self):
+        self.ahora = 0.0
+
+    def __call__(self):
+        return self.ahora
+
+
+def test_circuit_breaker():
+    reloj = Reloj()
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=reloj)
+    assert breaker.state == 'closed'
+    breaker.record_failure()
+    assert breaker.state == 'closed' and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == 'open' and not breaker.allow()
+
+    # Semiabierto: una sola prueba a la vez
+    reloj.ahora = 10
+    assert breaker.state == 'half-open'
+    assert breaker.allow()
+    assert not breaker.allow()
+
+    # La prueba falla: se abre otra vez y la siguiente prueba vuelve a estar disponible
+    breaker.record_failure()
+    assert breaker.state == 'open' and not breaker._probing
+    reloj.ahora = 15
+    assert not breaker.allow()
+    reloj.ahora = 20
+    assert breaker.allow()
+
+    # La prueba sale bien: se cierra
+    breaker.record_success()
+    assert breaker.state == 'closed' and breaker.failures == 0 and not breaker._probing
+    assert breaker.allow() and breaker.allow()
+
+
+class Respuesta:
+    def __init__(self, text):
+        self.text = text
+
+
+class ModeloFalso:
+    def __init__(self, texto):
+        self.texto = texto
+        self.llamadas = 0
+
+    def generate_content(self, prompt, request_options=None):
+        self.llamadas += 1
+        return Respuesta(self.texto)
+
+
+def test_respuesta_invalida_cuenta_como_fallo():
+    generador = GeminiIdeaGenerator(models=['roto', 'sano'], api_key='test')
+    for breaker in generador.breakers.values():
+        breaker.failure_threshold = 2
+    roto = ModeloFalso("Lo siento, no puedo ayudar con eso.")
+    sano = ModeloFalso('```json\n{"name": "Pizza Sana", "description": "Rica."}\n```')
+    generador._instances = {'roto': roto, 'sano': sano}
+
+    for _ in range(3):
+        assert generador.generate(('queso',)) == {'name': 'Pizza Sana', 'description': 'Rica.'}
+    # Tras dos respuestas inválidas el circuito del modelo roto se abre y ya no se le llama
+    assert roto.llamadas == 2
+    assert generador.stats()['roto'] == {'state': 'open', 'failures': 2}
+    assert generador.stats()['sano'] == {'state': 'closed', 'failures': 0}
+
+
+def test_sin_modelos_disponibles():
+    generador = GeminiIdeaGenerator(models=['roto'], api_key='test')
+    generador._instances = {'roto': ModeloFalso('{"name": "Sin descripción"}')}
+    with pytest.raises(IdeaUnavailable):
+        generador.generate(('queso',))
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from app.menu_data import products
+from app.menu_store import MenuSnapshot, menu_store
+from app.pricing import PricingEngine, PricingError, a_centavos
+
+
+@pytest.fixture
+def snapshot():
+    return MenuSnapshot(products, version=1)
+
+
+def test_estricto_por_defecto(snapshot):
+    motor = PricingEngine(snapshot)
+    assert motor.strict
+    with pytest.raises(PricingError):
+        motor.price_cart([{'id': 'pizza-custom', 'quantity': 1, 'price': 50}])
+
+
+def test_precios_del_menu(snapshot):
+    cotizacion = PricingEngine(snapshot).price_cart([
+        {'id': 'pizza-1', 'quantity': 2, 'price': 1, 'adicionales': [{'id': 'adic-1', 'price': -100}]}
+    ])
+    assert cotizacion['total_cents'] == 2 * (6900 + 1000)
+    assert cotizacion['unverified_items'] == []
+
+
+@pytest.mark.parametrize('precio', [-49.99, 0, '0.00', 'abc', 'NaN', 'Infinity', '-Infinity', None, True])
+def test_precio_del_cliente_invalido(snapshot, precio):
+    motor = PricingEngine(snapshot, strict=False)
+    carrito = [{'id': 'pizza-1', 'quantity': 2, 'adicionales': [{'id': 'x', 'price': precio}]}]
+    with pytest.raises(PricingError):
+        motor.price_cart(carrito)
+
+
+def test_producto_fuera_del_menu_sin_modo_estricto(snapshot):
+    cotizacion = PricingEngine(snapshot, strict=False).price_cart([{'id': 'pizza-custom', 'quantity': 1, 'price': '55.50'}])
+    assert cotizacion['total_cents'] == 5550
+    assert cotizacion['unverified_items'] == ['pizza-custom']
+
+
+@pytest.mark.parametrize('monto', ['abc', 'NaN', 'inf', '', object()])
+def test_a_centavos_rechaza_no_numeros(monto):
+    with pytest.raises(PricingError):
+        a_centavos(monto)
+
+
+def _enviar_pedido(http, **order):
+    return http.post('/submit_order', json={'chat_id': 1, 'order': dict({'id': 'ORD-1'}, **order)})
+
+
+def test_ruta_responde_400(http, monkeypatch):
+    carrito = [{'id': 'pizza-1', 'quantity': 2, 'adicionales': [{'id': 'x', 'price': 'NaN'}]}]
+    respuesta = _enviar_pedido(http, items=carrito)
+    assert respuesta.status_code == 400
+    assert respuesta.get_json()['message'] == "Producto desconocido en adicional de item #1: 'x'"
+
+    # Sin modo estricto se usa el precio del cliente, y 'NaN' no es un precio
+    monkeypatch.setattr('app.pricing._motor', PricingEngine(menu_store.snapshot, strict=False))
+    respuesta = _enviar_pedido(http, items=carrito)
+    assert respuesta.status_code == 400
+    assert respuesta.get_json()['message'] == "Monto inválido: 'NaN'"
+
+
+@pytest.mark.parametrize('total', ['abc', 'NaN', True])
+def test_total_del_cliente_invalido(http, total):
+    respuesta = _enviar_pedido(http, items=[{'id': 'pizza-1', 'quantity': 1}], total=total)
+    assert respuesta.status_code == 400
+    assert respuesta.get_json()['message'].startswith("Total inválido: Monto inválido")
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+import time
+
+import httpx
+
+from app.pubsub import event_bus, TOPICO_PEDIDOS
+
+
+def _esperar(condicion, timeout=5.0):
+    limite = time.time() + timeout
+    while not condicion() and time.time() < limite:
+        time.sleep(0.02)
+    return condicion()
+
+
+def _lineas_hasta(lineas, prefijo):
+    for linea in lineas:
+        if linea.startswith(prefijo):
+            return linea
+
+
+def test_otras_peticiones_no_esperan_al_stream(servidor):
+    with httpx.Client(base_url=servidor, timeout=5) as cliente:
+        with cliente.stream('GET', '/stream/orders') as stream:
+            assert stream.status_code == 200
+            assert stream.headers['content-type'].startswith('text/event-stream')
+            lineas = stream.iter_lines()
+            assert _lineas_hasta(lineas, 'retry:')
+
+            # Con el stream abierto, una petición a Flask responde enseguida
+            inicio = time.perf_counter()
+            assert cliente.get('/').status_code == 200
+            assert time.perf_counter() - inicio < 2
+
+            event_bus.publish(TOPICO_PEDIDOS, 'status', {'order_id': 'A', 'status': 'En camino'})
+            assert _lineas_hasta(lineas, 'event:') == 'event: status'
+            assert '"En camino"' in _lineas_hasta(lineas, 'data:')
+
+    # Al desconectarse el cliente se libera la suscripción
+    assert _esperar(lambda: event_bus.stats()['subscribers'] == 0)
+
+
+def test_stream_de_pedido(servidor, fake_db):
+    fake_db.sembrar('pedidos', {'A': {'id': 'A', 'status': 'Pendiente'}})
+    with httpx.Client(base_url=servidor, timeout=5) as cliente:
+        assert cliente.get('/stream/order/no-existe').status_code == 404
+        with cliente.stream('GET', '/stream/order/A') as stream:
+            lineas = stream.iter_lines()
+            assert _lineas_hasta(lineas, 'event:') == 'event: snapshot'
+            assert '"Pendiente"' in _lineas_hasta(lineas, 'data:')
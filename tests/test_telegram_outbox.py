@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+from telegram.error import RetryAfter
+
+from app.telegram_outbox import PRIORIDAD_ALTA, PRIORIDAD_BAJA, TelegramOutbox
+
+
+class BotFalso:
+    def __init__(self, limitados=()):
+        self.limitados = set(limitados)
+        self.enviados = []
+
+    async def send_message(self, chat_id, **kwargs):
+        if chat_id in self.limitados:
+            self.limitados.discard(chat_id)
+            raise RetryAfter(1)
+        self.enviados.append((chat_id, kwargs['text']))
+
+
+def _ejecutar(escenario):
+    return asyncio.run(escenario())
+
+
+def test_429_pausa_solo_ese_chat():
+    async def escenario():
+        bot = BotFalso(limitados={'A'})
+        outbox = TelegramOutbox(bot, asyncio.get_running_loop(), workers=1)
+        outbox.start()
+        outbox.submit('A', text='a')
+        await asyncio.sleep(0.05)
+        outbox.submit('B', text='b')
+        await asyncio.sleep(0.2)
+        assert bot.enviados == [('B', 'b')]
+        await asyncio.sleep(1.0)
+        assert ('A', 'a') in bot.enviados
+        assert outbox.stats()['rate_limited'] == 1
+        await outbox.stop()
+
+    _ejecutar(escenario)
+
+
+def test_prioridad_alta_sale_primero():
+    async def escenario():
+        bot = BotFalso()
+        outbox = TelegramOutbox(bot, asyncio.get_running_loop(), workers=1)
+        outbox.start()
+        outbox.submit('conductor', priority=PRIORIDAD_BAJA, text='calificación')
+        outbox.submit('cliente', priority=PRIORIDAD_ALTA, text='factura')
+        await asyncio.sleep(0.1)
+        assert [texto for _, texto in bot.enviados] == ['factura', 'calificación']
+        await outbox.stop()
+
+    _ejecutar(escenario)
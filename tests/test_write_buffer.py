@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+import pytest
+from google.api_core.exceptions import ServiceUnavailable
+
+from app import services
+from app.write_buffer import CoalescingWriteBuffer
+
+
+def test_pedido_nuevo_se_escribe_al_momento(fake_db):
+    assert services.guardar_pedido_en_firestore({'id': 'A', 'status': 'Pendiente', 'items': []})
+    assert fake_db.doc('pedidos', 'A')['status'] == 'Pendiente'
+    assert services.buffer_escrituras.stats()['pending'] == 0
+
+
+def test_pedido_rechazado_no_se_confirma(fake_db):
+    fake_db.rechazar = lambda coleccion, doc_id, datos: doc_id == 'A'
+    assert not services.guardar_pedido_en_firestore({'id': 'A', 'status': 'Pendiente', 'driver_id': 'd1'})
+    assert fake_db.doc('pedidos', 'A') is None
+    assert services.estado_caliente.get_order('A') is None
+    assert not services.registro_pedidos_activos.active_orders('d1')
+
+
+@pytest.fixture
+def buffer(fake_db):
+    return CoalescingWriteBuffer(lambda: fake_db, interval=3600, max_attempts=3)
+
+
+def test_documento_rechazado_no_frena_el_lote(fake_db, buffer):
+    fake_db.rechazar = lambda coleccion, doc_id, datos: doc_id == 'malo'
+    for doc_id in ('a', 'malo', 'b'):
+        buffer.enqueue('drivers', doc_id, {'lat': 1})
+
+    assert buffer.flush() == 2
+    assert fake_db.doc('drivers', 'a') == fake_db.doc('drivers', 'b') == {'lat': 1}
+    assert buffer.stats()['pending'] == 1
+
+    # Un dato más nuevo para el documento fallido se mezcla con el reintento
+    buffer.enqueue('drivers', 'malo', {'lon': 2})
+    buffer.flush()
+    assert buffer.dead_letters() == []
+    buffer.flush()
+
+    stats = buffer.stats()
+    assert stats['pending'] == 0
+    assert stats['dead_lettered'] == stats['dead_letters'] == 1
+    descartada = buffer.dead_letters()[0]
+    assert (descartada['collection'], descartada['doc_id'], descartada['data']) == ('drivers', 'malo', {'lat': 1, 'lon': 2})
+    assert 'malo' in descartada['error']
+
+
+def test_exito_reinicia_los_intentos(fake_db, buffer):
+    rechazados = {'x'}
+    fake_db.rechazar = lambda coleccion, doc_id, datos: doc_id in rechazados
+    buffer.enqueue('drivers', 'x', {'lat': 1})
+    buffer.flush()
+    buffer.flush()
+    rechazados.clear()
+    assert buffer.flush() == 1
+
+    rechazados.add('x')
+    buffer.enqueue('drivers', 'x', {'lat': 2})
+    buffer.flush()
+    buffer.flush()
+    assert buffer.stats()['pending'] == 1 and buffer.dead_letters() == []
+
+
+def test_error_transitorio_reencola_el_lote(fake_db, buffer):
+    def caido(coleccion, doc_id, datos):
+        raise ServiceUnavailable("Firestore no responde")
+
+    fake_db.rechazar = caido
+    buffer.enqueue('drivers', 'a', {'lat': 1})
+    buffer.enqueue('drivers', 'b', {'lat': 1})
+    for _ in range(5):
+        assert buffer.flush() == 0
+    stats = buffer.stats()
+    assert stats['pending'] == 2 and stats['dead_lettered'] == 0 and stats['retried'] == 0
+
+    fake_db.rechazar = lambda coleccion, doc_id, datos: False
+    assert buffer.flush() == 2